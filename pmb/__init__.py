@@ -29,6 +29,7 @@ from .helpers import frontend
 from .helpers import logging as pmb_logging
 from .helpers import mount
 from .helpers import other
+from .helpers import session_cache
 
 
 def main():
@@ -64,6 +65,10 @@ def main():
         else:
             logging.info("Run pmbootstrap -h for usage information.")
 
+        # Cache statistics
+        if args.profile_caches:
+            session_cache.log_stats(args)
+
         # Still active notice
         if mount.ismount(args.work + "/chroot_native/dev"):
             logging.info("NOTE: chroot is still active (use 'pmbootstrap"
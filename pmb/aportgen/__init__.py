@@ -26,6 +26,7 @@ import pmb.aportgen.linux
 import pmb.aportgen.musl
 import pmb.config
 import pmb.helpers.cli
+import pmb.helpers.pmaports
 
 
 def properties(pkgname):
@@ -69,3 +70,4 @@ def generate(args, pkgname):
         pmb.helpers.run.user(args, ["rm", "-r", path_target])
     pmb.helpers.run.user(
         args, ["mv", args.work + "/aportgen", path_target])
+    pmb.helpers.pmaports.invalidate(args, path_target)
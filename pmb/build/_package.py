@@ -19,12 +19,16 @@ along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 import datetime
 import logging
 import os
+import time
 
 import pmb.build
 import pmb.build.autodetect
+import pmb.build.buildcache
+import pmb.build.scheduler
 import pmb.chroot
 import pmb.chroot.apk
 import pmb.chroot.distccd
+import pmb.chroot.overlay
 import pmb.helpers.pmaports
 import pmb.helpers.repo
 import pmb.parse
@@ -38,13 +42,11 @@ def skip_already_built(args, pkgname, arch):
 
     :returns: True when it can be skipped or False
     """
-    if arch not in args.cache["built"]:
-        args.cache["built"][arch] = []
-    if pkgname in args.cache["built"][arch]:
+    if (arch, pkgname) in args.cache["built"]:
         logging.verbose(pkgname + ": already checked this session,"
                         " no need to build it or its dependencies")
         return True
-    args.cache["built"][arch].append(pkgname)
+    args.cache["built"].add((arch, pkgname))
     return False
 
 
@@ -186,6 +188,28 @@ def is_necessary_warn_depends(args, apkbuild, arch, force, depends_built):
     return ret
 
 
+def depends_necessary(args, apkbuild, arch, strict=False, force=False,
+                      cross=None):
+    """
+    Build all dependencies and check if we need to build at all.
+
+    :param cross: None, "native", "distcc", or "crossdirect"
+    :returns: list of dependency pkgnames when the build is necessary,
+              otherwise None
+    """
+    depends_arch = arch
+    if cross == "native":
+        depends_arch = args.arch_native
+
+    # Build dependencies
+    depends, built = build_depends(args, apkbuild, depends_arch, strict)
+
+    # Check if build is necessary
+    if not is_necessary_warn_depends(args, apkbuild, arch, force, built):
+        return None
+    return depends
+
+
 def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
                   suffix="native", skip_init_buildenv=False, src=None):
     """
@@ -201,20 +225,29 @@ def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
     :param src: override source used to build the package with a local folder
     :returns: True when the build is necessary (otherwise False)
     """
+    depends = depends_necessary(args, apkbuild, arch, strict, force, cross)
+    if depends is None:
+        return False
+    setup_buildenv(args, apkbuild, arch, depends, strict, cross, suffix,
+                   skip_init_buildenv, src)
+    return True
 
-    depends_arch = arch
-    if cross == "native":
-        depends_arch = args.arch_native
-
-    # Build dependencies
-    depends, built = build_depends(args, apkbuild, depends_arch, strict)
 
-    # Check if build is necessary
-    if not is_necessary_warn_depends(args, apkbuild, arch, force, built):
-        return False
+def setup_buildenv(args, apkbuild, arch, depends, strict=False, cross=None,
+                   suffix="native", skip_init_buildenv=False, src=None):
+    """
+    Setup the whole build environment (abuild, gcc, dependencies,
+    cross-compiler), after depends_necessary() has built the dependencies.
 
+    :param depends: list of dependency pkgnames from depends_necessary()
+    :param cross: see init_buildenv()
+    :param skip_init_buildenv: see init_buildenv()
+    :param src: see init_buildenv()
+    """
     # Install and configure abuild, ccache, gcc, dependencies
     if not skip_init_buildenv:
+        if pmb.chroot.overlay.enabled(args, strict):
+            pmb.chroot.overlay.mount(args, suffix)
         pmb.build.init(args, suffix)
         pmb.build.other.configure_abuild(args, suffix)
         pmb.build.other.configure_ccache(args, suffix)
@@ -225,24 +258,34 @@ def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
 
     # Cross-compiler init
     if cross:
-        cross_pkgs = ["ccache-cross-symlinks"]
-        if "gcc4" in depends:
-            cross_pkgs += ["gcc4-" + arch]
-        elif "gcc6" in depends:
-            cross_pkgs += ["gcc6-" + arch]
-        else:
-            cross_pkgs += ["gcc-" + arch, "g++-" + arch]
-        if "clang" in depends or "clang-dev" in depends:
-            cross_pkgs += ["clang"]
-        if cross == "crossdirect":
-            cross_pkgs += ["crossdirect"]
-        pmb.chroot.apk.install(args, cross_pkgs)
+        pmb.chroot.apk.install(args, cross_packages(depends, arch, cross))
     if cross == "distcc":
         pmb.chroot.distccd.start(args, arch)
     if cross == "crossdirect":
         pmb.chroot.mount_native_into_foreign(args, suffix)
 
-    return True
+
+def cross_packages(depends, arch, cross):
+    """
+    Get the cross-compiler packages, that setup_buildenv() installs in the
+    native chroot.
+
+    :param depends: list of dependency pkgnames of the aport
+    :param cross: "native", "distcc" or "crossdirect"
+    :returns: list of pkgnames
+    """
+    ret = ["ccache-cross-symlinks"]
+    if "gcc4" in depends:
+        ret += ["gcc4-" + arch]
+    elif "gcc6" in depends:
+        ret += ["gcc6-" + arch]
+    else:
+        ret += ["gcc-" + arch, "g++-" + arch]
+    if "clang" in depends or "clang-dev" in depends:
+        ret += ["clang"]
+    if cross == "crossdirect":
+        ret += ["crossdirect"]
+    return ret
 
 
 def get_gcc_version(args, arch):
@@ -403,6 +446,12 @@ def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
     if not args.ccache:
         env["CCACHE_DISABLE"] = "1"
 
+    # Parallel builds: don't use the apk cache, which is shared with the
+    # other chroot clones, when abuild installs the depends
+    clone = "build_clone" in args and args.build_clone
+    if clone:
+        env["SUDO_APK"] += " --no-cache"
+
     # Build the abuild command
     cmd = ["abuild", "-D", "postmarketOS"]
     if strict:
@@ -411,11 +460,15 @@ def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
         cmd += ["-d"]  # do not install depends with abuild
     if force:
         cmd += ["-f"]
+    if clone:
+        cmd += ["-P", pmb.build.scheduler.repodest]
 
     # Copy the aport to the chroot and build it
     pmb.build.copy_to_buildpath(args, apkbuild["pkgname"], suffix)
     override_source(args, apkbuild, pkgver, src, suffix)
     pmb.chroot.user(args, cmd, suffix, "/home/pmos/build", env=env)
+    if clone:
+        pmb.build.scheduler.publish(args, arch, suffix)
     return (output, cmd, env)
 
 
@@ -434,8 +487,11 @@ def finish(args, apkbuild, arch, output, strict=False, suffix="native"):
     pmb.parse.apkindex.clear_cache(args, args.work + "/packages/" +
                                    arch + "/APKINDEX.tar.gz")
 
-    # Uninstall build dependencies (strict mode)
-    if strict:
+    # Strict mode: discard the overlay with the build dependencies, or
+    # uninstall them
+    if strict and pmb.chroot.overlay.mounted(args, suffix):
+        pmb.chroot.overlay.discard(args, suffix)
+    elif strict:
         logging.info("(" + suffix + ") uninstall build dependencies")
         pmb.chroot.user(args, ["abuild", "undeps"], suffix, "/home/pmos/build",
                         env={"SUDO_APK": "abuild-apk --no-progress"})
@@ -474,12 +530,32 @@ def package(args, pkgname, arch=None, force=False, strict=False,
         return
     suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
     cross = pmb.build.autodetect.crosscompile(args, apkbuild, arch, suffix)
-    if not init_buildenv(args, apkbuild, arch, strict, force, cross, suffix,
-                         skip_init_buildenv, src):
+    depends = depends_necessary(args, apkbuild, arch, strict, force, cross)
+    if depends is None:
         return
 
-    # Build and finish up
+    # Restore the packages of an identical previous build (before the chroot
+    # gets set up, so there is nothing to clean up on a cache hit)
+    cache_key = None
+    if pmb.build.buildcache.enabled(args, src):
+        cache_key = pmb.build.buildcache.key(args, apkbuild, arch, cross)
+        output = pmb.build.buildcache.restore(args, cache_key, apkbuild, arch)
+        if output:
+            return output
+
+    # Install and configure everything needed for the build (one parallel
+    # build process at a time, see pmb.build.scheduler.lock())
+    with pmb.build.scheduler.lock():
+        setup_buildenv(args, apkbuild, arch, depends, strict, cross, suffix,
+                       skip_init_buildenv, src)
+
+    # Build and finish up (remember the build time for the next build plans)
+    start = time.time()
     (output, cmd, env) = run_abuild(args, apkbuild, arch, strict, force, cross,
                                     suffix, src)
     finish(args, apkbuild, arch, output, strict, suffix)
+    pmb.build.scheduler.build_time_save(args, apkbuild["pkgname"], arch,
+                                        time.time() - start)
+    if cache_key:
+        pmb.build.buildcache.save(args, cache_key, apkbuild, arch)
     return output
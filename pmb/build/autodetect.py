@@ -78,16 +78,24 @@ def arch(args, pkgname):
 
 
 def suffix(args, apkbuild, arch):
+    """
+    :returns: the chroot suffix to build a package in, e.g. "native" or
+              "buildroot_armhf". During parallel builds, each build process
+              uses its own clone of the chroot (args.build_clone), e.g.
+              "native-2" or "buildroot_armhf-2".
+    """
+    ret = "buildroot_" + arch
     if arch == args.arch_native:
-        return "native"
-
-    pkgname = apkbuild["pkgname"]
-    if args.cross:
+        ret = "native"
+    elif args.cross:
         for pattern in pmb.config.build_cross_native:
-            if fnmatch.fnmatch(pkgname, pattern):
-                return "native"
+            if fnmatch.fnmatch(apkbuild["pkgname"], pattern):
+                ret = "native"
+                break
 
-    return "buildroot_" + arch
+    if "build_clone" in args and args.build_clone:
+        ret += "-" + str(args.build_clone)
+    return ret
 
 
 def crosscompile(args, apkbuild, arch, suffix):
@@ -0,0 +1,179 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Content-addressed build cache: the apk files of each build get stored in
+$WORK/cache_build/$KEY, where the key is a hash of everything that goes into
+the build (aport folder contents, versions of all dependencies and of the
+build toolchain that get installed for the build, arch and cross-compile
+method). When the same aport
+gets built again (e.g. with --force or after zapping the chroots), the apk
+files are restored from there instead. Use "pmbootstrap zap -b" to clear it.
+"""
+
+import hashlib
+import logging
+import os
+
+import pmb.build._package
+import pmb.config
+import pmb.helpers.pmaports
+import pmb.helpers.run
+import pmb.parse.apkindex
+
+
+def enabled(args, src=None):
+    """
+    :param src: see pmb.build.package(), packages built from a local source
+                folder never get cached
+    """
+    if src:
+        return False
+    return "no_build_cache" not in args or not args.no_build_cache
+
+
+def key(args, apkbuild, arch, cross=None):
+    """
+    Calculate the build cache key of an aport.
+
+    :param cross: None, "native", "distcc" or "crossdirect"
+    :returns: sha256 hex digest
+    """
+    ret = hashlib.sha256()
+    ret.update(("arch=" + arch + "\ncross=" + str(cross) + "\n").encode())
+
+    # Contents of the aport folder (symlinks get resolved, just like
+    # copy_to_buildpath() does)
+    aport = pmb.helpers.pmaports.find(args, apkbuild["pkgname"])
+    for root, dirs, files in os.walk(aport, followlinks=True):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            ret.update(("file=" + os.path.relpath(path, aport) +
+                        "\n").encode())
+            with open(path, "rb") as handle:
+                for chunk in iter(lambda: handle.read(65536), b""):
+                    ret.update(chunk)
+
+    # Versions of the dependencies, that get installed for the build, and of
+    # everything they depend on (resolved with the APKINDEX files)
+    depends = pmb.build._package.get_depends(args, apkbuild)
+    depends_arch = args.arch_native if cross == "native" else arch
+    for depend, version in sorted(resolve(args, depends,
+                                          depends_arch).items()):
+        ret.update(("depend=" + depend + ":" + version + "\n").encode())
+
+    # Versions of the build toolchain in the build chroot (abuild,
+    # build-base, gcc, ...) and of the cross-compiler in the native chroot
+    toolchain = resolve(args, pmb.config.build_packages, depends_arch)
+    for name, version in sorted(toolchain.items()):
+        ret.update(("toolchain=" + name + ":" + version + "\n").encode())
+    if cross:
+        cross_pkgs = pmb.build._package.cross_packages(depends, arch, cross)
+        for name, version in sorted(resolve(args, cross_pkgs,
+                                            args.arch_native).items()):
+            ret.update(("cross_toolchain=" + name + ":" + version +
+                        "\n").encode())
+    return ret.hexdigest()
+
+
+def resolve(args, names, arch):
+    """
+    Resolve package names recursively with the APKINDEX files.
+
+    :param names: list of dependency names, e.g. ["abuild", "so:libc.so"]
+    :returns: dict of dependency name: "pkgname-version" of the package that
+              provides it, "(missing)" for names without such a package
+    """
+    ret = {}
+    todo = list(names)
+    while todo:
+        depend = todo.pop()
+        if depend in ret:
+            continue
+        package = pmb.parse.apkindex.package(args, depend, arch, False)
+        if not package:
+            ret[depend] = "(missing)"
+            continue
+        ret[depend] = package["pkgname"] + "-" + package["version"]
+        todo.extend(package.get("depends", []))
+    return ret
+
+
+def depends_resolved(args, apkbuild, arch):
+    """
+    Resolve the dependencies of an aport recursively with the APKINDEX files.
+
+    :returns: see resolve()
+    """
+    return resolve(args, pmb.build._package.get_depends(args, apkbuild), arch)
+
+
+def outputs(apkbuild, arch):
+    """
+    :returns: paths of the apk files of a build, relative to the packages
+              folder, e.g. ["x86_64/hello-1-r2.apk",
+                            "x86_64/hello-doc-1-r2.apk"]
+    """
+    suffix = "-" + apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"] + ".apk"
+    return [arch + "/" + pkgname + suffix for pkgname in
+            [apkbuild["pkgname"]] + list(apkbuild["subpackages"])]
+
+
+def restore(args, cache_key, apkbuild, arch):
+    """
+    Copy the apk files of a previous build with the same cache key to the
+    packages folder and update the APKINDEX.
+
+    :returns: None on cache miss, output path relative to the packages folder
+              like pmb.build.package() on cache hit ("x86_64/hello-1-r2.apk")
+    """
+    path = args.work + "/cache_build/" + cache_key
+    files = outputs(apkbuild, arch)
+    if not os.path.exists(path + "/" + os.path.basename(files[0])):
+        logging.verbose(apkbuild["pkgname"] + ": build cache miss (" +
+                        cache_key + ")")
+        return None
+
+    logging.info("(build cache) restore " + files[0])
+    pmb.helpers.run.root(args, ["mkdir", "-p", args.work + "/packages/" +
+                                arch])
+    for file in files:
+        path_file = path + "/" + os.path.basename(file)
+        if os.path.exists(path_file):
+            pmb.helpers.run.root(args, ["cp", path_file, args.work +
+                                        "/packages/" + file])
+    pmb.build.index_repo(args, arch)
+    return files[0]
+
+
+def save(args, cache_key, apkbuild, arch):
+    """
+    Store the apk files of a build in the build cache. The files get copied
+    to a temporary folder first, so an interrupted copy never gets restored.
+    """
+    path = args.work + "/cache_build/" + cache_key
+    if os.path.exists(path):
+        pmb.helpers.run.root(args, ["rm", "-rf", path])
+    pmb.helpers.run.root(args, ["mkdir", "-p", path + "_"])
+    for file in outputs(apkbuild, arch):
+        path_file = args.work + "/packages/" + file
+        if os.path.exists(path_file):
+            pmb.helpers.run.root(args, ["cp", path_file, path + "_/"])
+    pmb.helpers.run.root(args, ["mv", path + "_", path])
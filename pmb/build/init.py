@@ -24,6 +24,7 @@ import pmb.build
 import pmb.config
 import pmb.chroot
 import pmb.chroot.apk
+import pmb.chroot.template
 import pmb.helpers.run
 
 
@@ -38,10 +39,8 @@ def init(args, suffix="native"):
                            build=False)
 
     # Fix permissions
-    pmb.chroot.root(args, ["chown", "root:abuild",
-                           "/var/cache/distfiles"], suffix)
-    pmb.chroot.root(args, ["chmod", "g+w",
-                           "/var/cache/distfiles"], suffix)
+    commands = [["chown", "root:abuild", "/var/cache/distfiles"],
+                ["chmod", "g+w", "/var/cache/distfiles"]]
 
     # Generate package signing keys
     chroot = args.work + "/chroot_" + suffix
@@ -54,7 +53,7 @@ def init(args, suffix="native"):
         for key in glob.glob(chroot +
                              "/mnt/pmbootstrap-abuild-config/*.pub"):
             key = key[len(chroot):]
-            pmb.chroot.root(args, ["cp", key, "/etc/apk/keys/"], suffix)
+            commands.append(["cp", key, "/etc/apk/keys/"])
 
     # Add gzip wrapper, that converts '-9' to '-1'
     if not os.path.exists(chroot + "/usr/local/bin/gzip"):
@@ -74,23 +73,22 @@ def init(args, suffix="native"):
             for i in range(len(lines)):
                 lines[i] = lines[i][16:]
             handle.write("\n".join(lines))
-        pmb.chroot.root(args, ["cp", "/tmp/gzip_wrapper.sh", "/usr/local/bin/gzip"],
-                        suffix)
-        pmb.chroot.root(args, ["chmod", "+x", "/usr/local/bin/gzip"], suffix)
+        commands += [["cp", "/tmp/gzip_wrapper.sh", "/usr/local/bin/gzip"],
+                     ["chmod", "+x", "/usr/local/bin/gzip"]]
 
-    # Add user to group abuild
-    pmb.chroot.root(args, ["adduser", "pmos", "abuild"], suffix)
+    commands += [
+        # Add user to group abuild
+        ["adduser", "pmos", "abuild"],
 
-    # abuild.conf: Don't clean the build folder after building, so we can
-    # inspect it afterwards for debugging
-    pmb.chroot.root(args, ["sed", "-i", "-e", "s/^CLEANUP=.*/CLEANUP=''/",
-                           "/etc/abuild.conf"], suffix)
+        # abuild.conf: Don't clean the build folder after building, so we can
+        # inspect it afterwards for debugging
+        ["sed", "-i", "-e", "s/^CLEANUP=.*/CLEANUP=''/", "/etc/abuild.conf"],
 
-    # abuild.conf: Don't clean up installed packages in strict mode, so
-    # abuild exits directly when pressing ^C in pmbootstrap.
-    pmb.chroot.root(args, ["sed", "-i", "-e",
-                           "s/^ERROR_CLEANUP=.*/ERROR_CLEANUP=''/",
-                           "/etc/abuild.conf"], suffix)
+        # abuild.conf: Don't clean up installed packages in strict mode, so
+        # abuild exits directly when pressing ^C in pmbootstrap.
+        ["sed", "-i", "-e", "s/^ERROR_CLEANUP=.*/ERROR_CLEANUP=''/",
+         "/etc/abuild.conf"]]
+    pmb.chroot.root_batch(args, commands, suffix)
 
     # Qemu workaround (aarch64 only)
     arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
@@ -100,3 +98,4 @@ def init(args, suffix="native"):
 
     # Mark the chroot as initialized
     pmb.chroot.root(args, ["touch", marker], suffix)
+    pmb.chroot.template.save(args, suffix)
@@ -21,6 +21,7 @@ import os
 import logging
 import pmb.chroot.user
 import pmb.helpers.cli
+import pmb.helpers.pmaports
 import pmb.parse
 
 
@@ -64,3 +65,4 @@ def newapkbuild(args, folder, args_passed, force=False):
     for path in glob.glob(build_outside + "/*"):
         if not os.path.isdir(path):
             pmb.helpers.run.user(args, ["cp", path, target])
+    pmb.helpers.pmaports.invalidate(args, target)
@@ -21,6 +21,7 @@ import logging
 import os
 import shlex
 
+import pmb.build.scheduler
 import pmb.chroot
 import pmb.helpers.file
 import pmb.helpers.git
@@ -99,30 +100,32 @@ def index_repo(args, arch=None):
 
     :param arch: when not defined, re-index all repos
     """
-    pmb.build.init(args)
-
-    if arch:
-        paths = [args.work + "/packages/" + arch]
-    else:
-        paths = glob.glob(args.work + "/packages/*")
-
-    for path in paths:
-        if os.path.isdir(path):
-            path_arch = os.path.basename(path)
-            path_repo_chroot = "/home/pmos/packages/pmos/" + path_arch
-            logging.debug("(native) index " + path_arch + " repository")
-            commands = [
-                # Wrap the index command with sh so we can use '*.apk'
-                ["sh", "-c", "apk -q index --output APKINDEX.tar.gz_"
-                 " --rewrite-arch " + shlex.quote(path_arch) + " *.apk"],
-                ["abuild-sign", "APKINDEX.tar.gz_"],
-                ["mv", "APKINDEX.tar.gz_", "APKINDEX.tar.gz"]
-            ]
-            for command in commands:
-                pmb.chroot.user(args, command, working_dir=path_repo_chroot)
+    # Parallel build processes index one after another
+    with pmb.build.scheduler.lock():
+        pmb.build.init(args)
+
+        if arch:
+            paths = [args.work + "/packages/" + arch]
         else:
-            logging.debug("NOTE: Can't build index for: " + path)
-        pmb.parse.apkindex.clear_cache(args, path + "/APKINDEX.tar.gz")
+            paths = glob.glob(args.work + "/packages/*")
+
+        for path in paths:
+            if os.path.isdir(path):
+                path_arch = os.path.basename(path)
+                path_repo_chroot = "/home/pmos/packages/pmos/" + path_arch
+                logging.debug("(native) index " + path_arch + " repository")
+                commands = [
+                    # Wrap the index command with sh so we can use '*.apk'
+                    ["sh", "-c", "apk -q index --output APKINDEX.tar.gz_"
+                     " --rewrite-arch " + shlex.quote(path_arch) + " *.apk"],
+                    ["abuild-sign", "APKINDEX.tar.gz_"],
+                    ["mv", "APKINDEX.tar.gz_", "APKINDEX.tar.gz"]
+                ]
+                pmb.chroot.user_batch(args, commands,
+                                      working_dir=path_repo_chroot)
+            else:
+                logging.debug("NOTE: Can't build index for: " + path)
+            pmb.parse.apkindex.clear_cache(args, path + "/APKINDEX.tar.gz")
 
 
 def configure_abuild(args, suffix, verify=False):
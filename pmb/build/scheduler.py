@@ -0,0 +1,474 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Plan the build of multiple packages with their dependencies: the packages
+form a directed acyclic graph (DAG), which gets split up into levels. All
+packages of one level only depend on packages of previous levels, so they can
+be built in parallel (each in its own clone of the build chroot).
+"""
+
+import collections
+import contextlib
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+
+import pmb.build._package
+import pmb.build.autodetect
+import pmb.build.other
+import pmb.helpers.disk_cache
+import pmb.helpers.logging
+import pmb.helpers.mount
+import pmb.helpers.run
+import pmb.parse.apkindex
+
+# State of the parallel build processes (forked from the main process, so they
+# inherit args, which can't be pickled because of the open log file)
+_parallel = {}
+
+# abuild's REPODEST in the chroot clones of parallel builds, so the parallel
+# abuild processes don't update the same APKINDEX (see publish())
+repodest = "/home/pmos/packages_parallel"
+
+
+def build_time_get(args, pkgname, arch):
+    """
+    :returns: how long the last build of a package took in seconds, or None
+              if it was not built before
+    """
+    return pmb.helpers.disk_cache.load(args, "build_times",
+                                       arch + "/" + pkgname, None)
+
+
+def build_time_save(args, pkgname, arch, seconds):
+    """
+    Remember how long a build took, for the estimated duration of the next
+    build plans.
+    """
+    pmb.helpers.disk_cache.save(args, "build_times", arch + "/" + pkgname,
+                                None, seconds)
+
+
+def dag(args, packages, force=False):
+    """
+    Calculate which packages need to be built, and on which other packages
+    they depend. This follows the same rules as pmb.build.package() does
+    while building recursively.
+
+    :param packages: list of requested (pkgname, arch) tuples
+    :param force: build the requested packages, even if not necessary
+    :returns: (nodes, requested)
+              nodes: OrderedDict of (pkgname, arch) in topological order (each
+                     node comes after its dependencies, unless there is a
+                     cycle). pkgname is always the name of the pmaport, not of
+                     a subpackage. Packages from binary repositories are not
+                     part of the DAG. Example:
+                     {("hello-world", "x86_64"): {"depends": [],
+                                                  "build": True,
+                                                  "requested": True}, ...}
+              requested: the node of each requested package (or None), e.g.:
+                         {("hello-world-doc", "x86_64"): ("hello-world",
+                                                          "x86_64")}
+    """
+    visited = {}
+    ret = collections.OrderedDict()
+    no_depends = "no_depends" in args and args.no_depends
+
+    def mark_requested(key):
+        ret[key]["requested"] = True
+        if force:
+            ret[key]["build"] = True
+
+    def add(pkgname, arch, requested):
+        # Already visited (or currently being visited, in case of a cycle)
+        if (pkgname, arch) in visited:
+            key = visited[(pkgname, arch)]
+            if requested and key in ret:
+                mark_requested(key)
+            return key
+        visited[(pkgname, arch)] = None
+
+        # Only pmaports, that can be built for the arch
+        apkbuild = pmb.build._package.get_apkbuild(args, pkgname, arch)
+        if not apkbuild:
+            return None
+        if not pmb.build._package.check_build_for_arch(args, pkgname, arch):
+            return None
+        key = (apkbuild["pkgname"], arch)
+        visited[(pkgname, arch)] = key
+        if key in ret:
+            if requested:
+                mark_requested(key)
+            return key
+
+        # Dependencies (cross-compiled in the native chroot: native depends)
+        suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
+        cross = pmb.build.autodetect.crosscompile(args, apkbuild, arch, suffix)
+        depends_arch = args.arch_native if cross == "native" else arch
+        depends = []
+        if not no_depends:
+            for depend in pmb.build._package.get_depends(args, apkbuild):
+                depend_key = add(depend, depends_arch, False)
+                if depend_key and depend_key != key and \
+                        depend_key not in depends:
+                    depends.append(depend_key)
+
+        # Check if building is necessary (like is_necessary_warn_depends())
+        build = pmb.build.other.is_necessary(args, arch, apkbuild)
+        if requested and force:
+            build = True
+
+        if key not in ret:
+            ret[key] = {"depends": depends, "build": build,
+                        "requested": requested}
+        return key
+
+    requested = collections.OrderedDict()
+    for pkgname, arch in packages:
+        requested[(pkgname, arch)] = add(pkgname, arch, True)
+    return (ret, requested)
+
+
+def plan(args, packages, force=False):
+    """
+    Calculate the build plan for the requested packages.
+
+    :param packages: list of requested (pkgname, arch) tuples
+    :param force: build the requested packages, even if not necessary
+    :returns: dict like the following:
+              {"dag": nodes from dag(),
+               "requested": requested from dag(),
+               "levels": [[("hello-world", "x86_64")],
+                          [("hello-world-wrapper", "x86_64")]],
+               "critical_path": [("hello-world", "x86_64"),
+                                 ("hello-world-wrapper", "x86_64")],
+               "duration": 120.5,
+               "unknown": [("hello-world-wrapper", "x86_64")]}
+              levels: packages to build, the packages of each level only
+                      depend on packages from previous levels.
+              critical_path: the chain of dependent builds, that takes the
+                             longest time (with estimated durations)
+              duration: estimated duration of the critical path in seconds,
+                        from the previous build times
+              unknown: packages without previous build time (they are
+                       estimated with 0 seconds)
+    """
+    nodes, requested = dag(args, packages, force)
+
+    # Level of each node: how many builds it has to wait for. Packages that
+    # don't need to be built are in the same level as their dependencies,
+    # but don't add a level on their own. Also estimate when each node is
+    # done, and remember the dependency that finishes last (or has the most
+    # builds before it, if the durations are unknown).
+    level = {}
+    finish = {}
+    finish_previous = {}
+    unknown = []
+
+    def rank(key):
+        return (finish[key], level[key] + int(nodes[key]["build"]))
+
+    for key, node in nodes.items():
+        level[key] = 0
+        start = 0
+        finish_previous[key] = None
+        for depend in node["depends"]:
+            if depend not in level:
+                continue  # cycle
+            level[key] = max(level[key],
+                             level[depend] + int(nodes[depend]["build"]))
+            if (finish_previous[key] is None or
+                    rank(depend) > rank(finish_previous[key])):
+                start = finish[depend]
+                finish_previous[key] = depend
+
+        duration = 0
+        if node["build"]:
+            duration = build_time_get(args, *key)
+            if duration is None:
+                unknown.append(key)
+                duration = 0
+        finish[key] = start + duration
+
+    levels = []
+    for key, node in nodes.items():
+        if not node["build"]:
+            continue
+        while len(levels) <= level[key]:
+            levels.append([])
+        levels[level[key]].append(key)
+
+    # Critical path: walk backwards from the node that finishes last
+    critical_path = []
+    duration = 0
+    if levels:
+        key = max((k for k in nodes if nodes[k]["build"]), key=rank)
+        duration = finish[key]
+        while key:
+            if nodes[key]["build"]:
+                critical_path.insert(0, key)
+            key = finish_previous[key]
+
+    return {"dag": nodes,
+            "requested": requested,
+            "levels": levels,
+            "critical_path": critical_path,
+            "duration": duration,
+            "unknown": unknown}
+
+
+def format_duration(seconds):
+    """ :returns: human readable duration, e.g. "1h 2m 5s" """
+    seconds = int(round(seconds))
+    ret = ""
+    if seconds >= 3600:
+        ret += str(seconds // 3600) + "h "
+    if seconds >= 60:
+        ret += str(seconds % 3600 // 60) + "m "
+    return ret + str(seconds % 60) + "s"
+
+
+def log_plan(args, build_plan):
+    """
+    Print a build plan (return value of plan()) for 'pmbootstrap build
+    --dry-run'.
+    """
+    levels = build_plan["levels"]
+    if not levels:
+        logging.info("Nothing to build, all packages are up to date.")
+        return
+
+    def names(keys):
+        return ", ".join(pkgname + " (" + arch + ")" for pkgname, arch in keys)
+
+    count = sum(len(level) for level in levels)
+    logging.info("Build plan: " + str(count) + " package(s) in " +
+                 str(len(levels)) + " level(s)")
+    for i, level in enumerate(levels):
+        logging.info("Level " + str(i + 1) + ": " + names(level))
+    logging.info("Critical path: " +
+                 " -> ".join(pkgname for pkgname, arch in
+                             build_plan["critical_path"]))
+
+    estimate = "Estimated duration: " + \
+        format_duration(build_plan["duration"])
+    if build_plan["unknown"]:
+        estimate += (" (plus " + str(len(build_plan["unknown"])) +
+                     " package(s) without previous build time: " +
+                     names(build_plan["unknown"]) + ")")
+    logging.info(estimate)
+
+
+def lock():
+    """
+    :returns: the lock, that parallel build processes hold while they update
+              the local repositories or install packages with apk (the apk
+              cache is shared between the chroot clones). Outside of parallel
+              builds, a context manager that does nothing.
+    """
+    if "lock" in _parallel:
+        return _parallel["lock"]
+    return contextlib.ExitStack()
+
+
+def publish(args, arch, suffix):
+    """
+    Move the apk files, that abuild has written to the repodest of a chroot
+    clone, to the local repository and index it (one build process at a
+    time).
+    """
+    path = args.work + "/chroot_" + suffix + repodest + "/pmos/" + arch
+    with lock():
+        pmb.helpers.run.root(args, ["mkdir", "-p", args.work + "/packages/" +
+                                    arch])
+        for apk in sorted(glob.glob(path + "/*.apk")):
+            pmb.helpers.run.root(args, ["mv", apk, args.work + "/packages/" +
+                                        arch + "/"])
+        pmb.build.index_repo(args, arch)
+
+
+def parallel_init(queue):
+    """ Pool initializer: each build process gets its own chroot clone. """
+    _parallel["clone"] = queue.get()
+
+
+def parallel_build(task):
+    """
+    Build one package in a parallel build process. The output of the build
+    gets written to its own log file, $WORK/log_build/<arch>_<pkgname>.txt.
+
+    :param task: (pkgname, arch, force, strict, src) tuple
+    :returns: output of pmb.build.package()
+    """
+    pkgname, arch, force, strict, src = task
+    args = _parallel["args"]
+    args.build_clone = _parallel["clone"]
+    args.log = args.work + "/log_build/" + arch + "_" + pkgname + ".txt"
+    if os.path.exists(args.log):
+        os.remove(args.log)
+    pmb.helpers.logging.init(args)
+    try:
+        return pmb.build.package(args, pkgname, arch, force, strict, src=src)
+    except Exception as e:
+        raise RuntimeError("Failed to build " + pkgname + " (" + arch +
+                           "): " + str(e) + " (log: " + args.log + ")")
+    finally:
+        if args.logfd != sys.stdout:
+            args.logfd.close()
+
+
+def clones_remove(args, suffixes):
+    """
+    Remove the chroot clones of parallel builds.
+
+    :param suffixes: list of chroot suffixes, e.g. ["native-1", "native-2"]
+    """
+    for suffix in suffixes:
+        chroot = args.work + "/chroot_" + suffix
+        if not os.path.exists(chroot):
+            continue
+        logging.debug("(" + suffix + ") remove chroot clone")
+        pmb.helpers.mount.umount_all(args, chroot)
+        pmb.helpers.run.root(args, ["rm", "-rf", chroot])
+        args.cache.invalidate("apk_repository_list_updated", suffix)
+
+
+def run_parallel(args, tasks, count, clones):
+    """
+    Build packages, that don't depend on each other, in parallel. The build
+    processes hold the lock() while installing packages and updating the
+    local repositories, abuild writes the apk files to its own repodest in
+    each chroot clone (see publish()).
+
+    :param tasks: list of parallel_build() tasks
+    :param count: maximum amount of parallel builds
+    :param clones: list of the suffixes of the chroot clones, that have been
+                   initialized already. New ones get appended, so the caller
+                   can remove them with clones_remove() when done.
+    :returns: list of outputs of pmb.build.package(), in the order of tasks
+    """
+    count = min(count, len(tasks))
+    logging.info("Building " + str(len(tasks)) + " packages with " +
+                 str(count) + " parallel jobs (logs: " + args.work +
+                 "/log_build/)")
+    os.makedirs(args.work + "/log_build", exist_ok=True)
+
+    # Initialize the chroot clones before forking, so the build processes
+    # don't install the same packages at the same time
+    for pkgname, arch, force, strict, src in tasks:
+        apkbuild = pmb.build._package.get_apkbuild(args, pkgname, arch)
+        suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
+        for clone in range(1, count + 1):
+            suffix_clone = suffix + "-" + str(clone)
+            if suffix_clone not in clones:
+                pmb.build.init(args, suffix_clone)
+                clones.append(suffix_clone)
+
+    # Build in forked processes
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    for clone in range(1, count + 1):
+        queue.put(clone)
+    _parallel["args"] = args
+    _parallel["lock"] = context.RLock()
+    try:
+        with context.Pool(count, parallel_init, (queue,)) as pool:
+            ret = pool.map(parallel_build, tasks, chunksize=1)
+    finally:
+        _parallel.clear()
+
+    # Index the local repositories once more in the main process, so its
+    # APKINDEX caches get cleared
+    arches = []
+    for pkgname, arch, force, strict, src in tasks:
+        if arch not in arches:
+            arches.append(arch)
+    for arch in arches:
+        pmb.build.index_repo(args, arch)
+
+    # Don't check the packages again in this session
+    for pkgname, arch, force, strict, src in tasks:
+        args.cache["built"].add((arch, pkgname))
+    return ret
+
+
+def run(args, build_plan, force=False, strict=False, src=None, parallel=1):
+    """
+    Build the packages from a build plan (return value of plan()) level by
+    level. pmb.build.package() does the actual work, after the dependencies
+    of a package have been built in the previous levels, it only needs to
+    check that they are up to date.
+
+    :param force: build the requested packages, even if not necessary
+    :param strict: see pmb.build.package()
+    :param src: see pmb.build.package(), only used for requested packages
+    :param parallel: maximum amount of packages to build at the same time.
+                     Cross-compiled packages are always built one after
+                     another, as they share the native chroot.
+    :returns: dict of the requested (pkgname, arch) tuples and the output of
+              pmb.build.package() (None when the build was not necessary)
+    """
+    nodes = build_plan["dag"]
+    outputs = {}
+    clones = []
+    try:
+        for level in build_plan["levels"]:
+            tasks = []
+            tasks_parallel = []
+            for key in level:
+                pkgname, arch = key
+                if nodes[key]["requested"]:
+                    task = (pkgname, arch, force, strict, src)
+                else:
+                    task = (pkgname, arch, False, strict, None)
+                tasks.append(task)
+
+                apkbuild = pmb.build._package.get_apkbuild(args, pkgname,
+                                                           arch)
+                suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
+                if not pmb.build.autodetect.crosscompile(args, apkbuild,
+                                                         arch, suffix):
+                    tasks_parallel.append(task)
+
+            if parallel > 1 and len(tasks_parallel) > 1:
+                outputs_parallel = run_parallel(args, tasks_parallel,
+                                                parallel, clones)
+                for task, output in zip(tasks_parallel, outputs_parallel):
+                    outputs[task[0:2]] = output
+
+            for task in tasks:
+                pkgname, arch, force_task, strict, src_task = task
+                if (pkgname, arch) not in outputs:
+                    outputs[(pkgname, arch)] = pmb.build.package(
+                        args, pkgname, arch, force_task, strict, src=src_task)
+    finally:
+        clones_remove(args, clones)
+
+    # Requested packages, that were not in any level still get checked
+    ret = collections.OrderedDict()
+    for (pkgname, arch), key in build_plan["requested"].items():
+        if key in outputs:
+            ret[(pkgname, arch)] = outputs[key]
+        else:
+            ret[(pkgname, arch)] = pmb.build.package(args, pkgname, arch,
+                                                     force, strict, src=src)
+    return ret
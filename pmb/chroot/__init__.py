@@ -20,6 +20,7 @@ from pmb.chroot.init import init
 from pmb.chroot.mount import mount, mount_native_into_foreign
 from pmb.chroot.root import root
 from pmb.chroot.user import user
+from pmb.chroot.batch import root_batch, user_batch
 from pmb.chroot.user import exists as user_exists
 from pmb.chroot.shutdown import shutdown
 from pmb.chroot.zap import zap
@@ -58,7 +58,7 @@ def update_repository_list(args, suffix="native", check=False):
     # Up to date: Save cache, return
     lines_new = pmb.helpers.repo.urls(args)
     if lines_old == lines_new:
-        args.cache["apk_repository_list_updated"].append(suffix)
+        args.cache["apk_repository_list_updated"].add(suffix)
         return
 
     # Check phase: raise error when still outdated
@@ -102,7 +102,7 @@ def check_min_version(args, suffix="native"):
                            " 'pmbootstrap zap -hc'")
 
     # Mark this suffix as checked
-    args.cache["apk_min_version_checked"].append(suffix)
+    args.cache["apk_min_version_checked"].add(suffix)
 
 
 def install_is_necessary(args, build, arch, package, packages_installed):
@@ -191,7 +191,8 @@ def install(args, packages, suffix="native", build=True):
 
     # Add depends to packages
     arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
-    packages_with_depends = pmb.parse.depends.recurse(args, packages, suffix)
+    packages_with_depends = pmb.parse.depends.recurse_cached(args, packages,
+                                                             suffix)
 
     # Filter outdated packages (build them if required)
     packages_installed = installed(args, suffix)
@@ -257,10 +258,12 @@ def installed(args, suffix="native"):
                 {
                   "pkgname": "postmarketos-mkinitfs"
                   "version": "0.0.4-r10",
-                  "depends": ["busybox-extras", "lddtree", ...],
-                  "provides": ["mkinitfs=0.0.1"]
+                  "depends": ("busybox-extras", "lddtree", ...),
+                  "provides": ("mkinitfs", )
                 }, ...
               }
+              The values are pmb.parse.apkindex.Block objects, which can be
+              accessed like the dictionaries above.
     """
     path = args.work + "/chroot_" + suffix + "/lib/apk/db/installed"
     return pmb.parse.apkindex.parse(args, path, False)
@@ -0,0 +1,130 @@
+"""Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import shlex
+
+import pmb.helpers.run
+from pmb.chroot.root import run_script
+
+# Written inside the chroot by the batch script, when a command fails
+marker = "/tmp/pmbootstrap_batch_failed"
+
+
+def batch_script(cmds, env={}):
+    """
+    Convert a list of commands into one shell script, that runs them one after
+    another and stops at the first failing command. Each command gets echoed
+    before running it, so its output can be told apart in the log. The number
+    of the failed command (counting from 1) gets written to the marker file.
+
+    :param cmds: list of commands, e.g. [["mkdir", "-p", "/tmp/a"],
+                                         ["touch", "/tmp/a/b"]]
+    :param env: environment variables to be passed to each command
+    :returns: the flat string. Its exit code is the exit code of the failed
+              command, or 0 when all commands succeeded.
+    """
+    lines = []
+    for i, cmd in enumerate(cmds, 1):
+        lines.append("echo " + shlex.quote("% " + " ".join(cmd)))
+        lines.append(pmb.helpers.run.flat_cmd(cmd, env=env) +
+                     " || { ret=$?; echo \"(exit code $ret)\"; echo " +
+                     str(i) + " > " + marker + "; exit $ret; }")
+    return "\n".join(lines)
+
+
+def marker_read(args, suffix):
+    """
+    :returns: the number of the failed command of the last batch (counting
+              from 1), or None if none of the commands failed
+    """
+    path = args.work + "/chroot_" + suffix + marker
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as handle:
+        return int(handle.read())
+
+
+def run_batch(args, cmds, script, suffix, working_dir, output, check, env,
+              auto_init):
+    """
+    Run the script of root_batch() or user_batch() and raise an exception
+    with the failed command (see root_batch() for the arguments).
+    """
+    if output not in ["log", "stdout", "interactive"]:
+        raise RuntimeError("Can't use output " + output + " with a batch of"
+                           " commands")
+
+    msg = "(" + suffix + ") % "
+    if working_dir != "/":
+        msg += "cd " + working_dir + "; "
+    msg += " && ".join([" ".join(cmd) for cmd in cmds])
+    if working_dir:
+        script = "cd " + shlex.quote(working_dir) + " || exit 1;" + script
+    script = "rm -f " + marker + ";" + script
+    code = run_script(args, msg, script, suffix, output, False, False, env,
+                      auto_init)
+
+    if code and check is not False:
+        failed = msg
+        i = marker_read(args, suffix)
+        if i is not None and 1 <= i <= len(cmds):
+            failed = "(" + suffix + ") % " + " ".join(cmds[i - 1])
+        logging.debug("^" * 70)
+        logging.info("NOTE: The failed command's output is above the ^^^ line"
+                     " in the log file: " + args.log)
+        raise RuntimeError("Command failed: " + failed)
+    return code
+
+
+def root_batch(args, cmds, suffix="native", working_dir="/", output="log",
+               check=None, env={}, auto_init=True):
+    """
+    Run a list of commands inside a chroot as root, with only one sudo and
+    chroot call for all of them. The commands run one after another, until
+    the first one fails.
+
+    :param cmds: list of commands, e.g. [["mkdir", "-p", "/tmp/a"],
+                                         ["touch", "/tmp/a/b"]]
+    :param output: "log", "stdout" or "interactive"
+    :returns: 0 when all commands succeeded, otherwise (with check=False) the
+              exit code of the failed command
+
+    See pmb.chroot.root() for a detailed description of all other arguments.
+    """
+    return run_batch(args, cmds, batch_script(cmds), suffix, working_dir,
+                     output, check, env, auto_init)
+
+
+def user_batch(args, cmds, suffix="native", working_dir="/", output="log",
+               check=None, env={}, auto_init=True):
+    """
+    Run a list of commands inside a chroot as "user", with only one sudo,
+    chroot and su call for all of them. The commands run one after another,
+    until the first one fails.
+
+    See root_batch() for a detailed description of the arguments and the
+    return value.
+    """
+    if "HOME" not in env:
+        env["HOME"] = "/home/pmos"
+
+    script = batch_script(cmds, env)
+    script = pmb.helpers.run.flat_cmd(["busybox", "su", "pmos", "-c", script])
+    return run_batch(args, cmds, script, suffix, working_dir, output, check,
+                     {}, auto_init)
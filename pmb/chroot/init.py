@@ -23,6 +23,7 @@ import filecmp
 
 import pmb.chroot
 import pmb.chroot.apk_static
+import pmb.chroot.template
 import pmb.config
 import pmb.helpers.repo
 import pmb.helpers.run
@@ -45,6 +46,20 @@ def copy_resolv_conf(args, suffix="native"):
         pmb.helpers.run.root(args, ["touch", chroot])
 
 
+def copy_qemu_user_binary(args, suffix):
+    """
+    Copy the qemu-user binary of the chroot's arch from the native chroot, so
+    binfmt_misc can run the chroot's programs.
+    """
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    arch_qemu = pmb.parse.arch.alpine_to_qemu(arch)
+    chroot = args.work + "/chroot_" + suffix
+    pmb.helpers.run.root(args, ["mkdir", "-p", chroot + "/usr/bin"])
+    pmb.helpers.run.root(args, ["cp", args.work +
+                                "/chroot_native/usr/bin/qemu-" + arch_qemu,
+                                chroot + "/usr/bin/qemu-" + arch_qemu + "-static"])
+
+
 def init(args, suffix="native"):
     # When already initialized: just prepare the chroot
     chroot = args.work + "/chroot_" + suffix
@@ -82,28 +97,31 @@ def init(args, suffix="native"):
 
     # Non-native chroot: install qemu-user-binary
     if emulate:
-        arch_qemu = pmb.parse.arch.alpine_to_qemu(arch)
-        pmb.helpers.run.root(args, ["mkdir", "-p", chroot + "/usr/bin"])
-        pmb.helpers.run.root(args, ["cp", args.work +
-                                    "/chroot_native/usr/bin/qemu-" + arch_qemu,
-                                    chroot + "/usr/bin/qemu-" + arch_qemu + "-static"])
+        copy_qemu_user_binary(args, suffix)
 
-    # Install alpine-base
+    # Extract the build chroot template (see pmb/chroot/template.py), or
+    # install alpine-base
     pmb.helpers.repo.update(args, arch)
-    pmb.chroot.apk_static.run(args, ["--no-progress", "--root", chroot,
-                                     "--cache-dir", apk_cache, "--initdb", "--arch", arch,
-                                     "add", "alpine-base"])
+    restored = pmb.chroot.template.restore(args, suffix)
+    if not restored:
+        pmb.chroot.apk_static.run(args, ["--no-progress", "--root", chroot,
+                                         "--cache-dir", apk_cache, "--initdb", "--arch", arch,
+                                         "add", "alpine-base"])
 
     # Building chroots: create "pmos" user, add symlinks to /home/pmos
     if not suffix.startswith("rootfs_"):
-        pmb.chroot.root(args, ["adduser", "-D", "pmos", "-u",
-                               pmb.config.chroot_uid_user], suffix, auto_init=False)
+        if not restored:
+            pmb.chroot.root(args, ["adduser", "-D", "pmos", "-u",
+                                   pmb.config.chroot_uid_user], suffix, auto_init=False)
 
-        # Create the links (with subfolders if necessary)
+        # Create the links (with subfolders if necessary). The targets are
+        # mountpoints, which are not part of the template: always fix their
+        # owner (e.g. $WORK/packages gets created as root after a zap).
         for target, link_name in pmb.config.chroot_home_symlinks.items():
             link_dir = os.path.dirname(link_name)
             if not os.path.exists(chroot + link_dir):
                 pmb.chroot.user(args, ["mkdir", "-p", link_dir], suffix)
-            pmb.chroot.user(args, ["ln", "-s", target, link_name], suffix)
+            if not os.path.islink(chroot + link_name):
+                pmb.chroot.user(args, ["ln", "-s", target, link_name], suffix)
             pmb.chroot.root(args, ["chown", "pmos:pmos", target],
                             suffix)
@@ -76,8 +76,7 @@ def extract(args, flavor, suffix, extra=False):
                 ["sh", "/tmp/_extract.sh"],
                 ["rm", "/tmp/_extract.sh", inside + "/_initfs"]
                 ]
-    for command in commands:
-        pmb.chroot.root(args, command, suffix)
+    pmb.chroot.root_batch(args, commands, suffix)
 
     # Return outside path for logging
     return outside
@@ -80,6 +80,7 @@ def mount_dev_tmpfs(args, suffix="native"):
     pmb.helpers.run.root(args, ["mount", "-t", "tmpfs",
                                 "-o", "size=1M,noexec,dev",
                                 "tmpfs", dev])
+    pmb.helpers.mount.invalidate()
 
     # Create pts, shm folders and device nodes
     pmb.helpers.run.root(args, ["mkdir", "-p", dev + "/pts", dev + "/shm"])
@@ -87,6 +88,13 @@ def mount_dev_tmpfs(args, suffix="native"):
 
 
 def mount(args, suffix="native"):
+    # Skip when everything was mounted in this session already, and /dev is
+    # still mounted (pmb.helpers.mount.umount_all() resets the cache)
+    dev = args.work + "/chroot_" + suffix + "/dev"
+    if (suffix in args.cache["chroot_mounted"] and
+            pmb.helpers.mount.ismount(dev)):
+        return
+
     # Mount tmpfs as the chroot's /dev
     mount_dev_tmpfs(args, suffix)
 
@@ -102,6 +110,7 @@ def mount(args, suffix="native"):
     for source, target in mountpoints.items():
         target_full = args.work + "/chroot_" + suffix + target
         pmb.helpers.mount.bind(args, source, target_full)
+    args.cache["chroot_mounted"].add(suffix)
 
 
 def mount_native_into_foreign(args, suffix):
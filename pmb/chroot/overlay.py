@@ -0,0 +1,133 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Disposable build chroots for strict builds ('pmbootstrap build --strict
+--overlay'). Instead of zapping all chroots, each package gets built in an
+overlayfs mounted at $WORK/chroot_$SUFFIX: the lower layer is a pristine build
+chroot (the extracted chroot template, see pmb/chroot/template.py) in
+$WORK/cache_chroot_overlay/$ARCH_$KEY, the upper layer is a new folder in
+$WORK/overlay_$SUFFIX. After the build, the overlay and the upper layer get
+removed again.
+"""
+
+import glob
+import logging
+import os
+
+import pmb.build
+import pmb.chroot
+import pmb.chroot.template
+import pmb.helpers.mount
+import pmb.helpers.repo
+import pmb.helpers.run
+import pmb.parse.arch
+from pmb.chroot.init import copy_qemu_user_binary
+
+
+def enabled(args, strict):
+    """ :param strict: see pmb.build.package() """
+    return strict and "strict_overlay" in args and args.strict_overlay
+
+
+def mounted(args, suffix):
+    """ :returns: True if the chroot is an overlay (see mount()) """
+    return pmb.helpers.mount.ismount(args.work + "/chroot_" + suffix)
+
+
+def umount(args, suffix):
+    """ Umount the chroot and everything mounted inside of it. """
+    chroot = args.work + "/chroot_" + suffix
+    for mountpoint in pmb.helpers.mount.umount_all_list(chroot):
+        if mountpoint == chroot or mountpoint.startswith(chroot + "/"):
+            pmb.helpers.run.root(args, ["umount", mountpoint])
+    pmb.helpers.mount.invalidate()
+    args.cache.invalidate("chroot_mounted", suffix)
+
+
+def discard(args, suffix):
+    """ Remove the chroot and the upper layer of its overlay. """
+    umount(args, suffix)
+    for path in [args.work + "/chroot_" + suffix,
+                 args.work + "/overlay_" + suffix]:
+        if os.path.exists(path):
+            pmb.helpers.run.root(args, ["rm", "-rf", path])
+    args.cache.invalidate("apk_repository_list_updated", suffix)
+
+
+def lower(args, suffix):
+    """
+    Get the pristine build chroot for the arch of the suffix, and create it
+    if necessary: from the chroot template, or by initializing a new build
+    chroot (which saves the template).
+
+    :returns: path to the lower layer
+    """
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    pmb.helpers.repo.update(args, arch)
+    packages = pmb.chroot.template.packages_apkindex(args, arch)
+    if packages is None:
+        raise RuntimeError("Failed to resolve the packages of a new " + arch +
+                           " build chroot with the APKINDEX files")
+    key = pmb.chroot.template.key(arch, packages)
+    ret = args.work + "/cache_chroot_overlay/" + arch + "_" + key
+    if os.path.exists(ret):
+        return ret
+
+    template = pmb.chroot.template.path(args, arch, key)
+    if not os.path.exists(template):
+        discard(args, suffix)
+        pmb.chroot.init(args, suffix)
+        pmb.build.init(args, suffix)
+        if not os.path.exists(template):
+            raise RuntimeError("Failed to create the " + arch + " chroot"
+                               " template for the overlay (see log)")
+
+    logging.info("(" + suffix + ") extract chroot template for overlay")
+    for old in glob.glob(args.work + "/cache_chroot_overlay/" + arch + "_*"):
+        pmb.helpers.run.root(args, ["rm", "-rf", old])
+    pmb.helpers.run.root(args, ["mkdir", "-p", ret + "_"])
+    pmb.helpers.run.root(args, ["tar", "-C", ret + "_", "-xpf", template,
+                                "--numeric-owner"])
+    pmb.helpers.run.root(args, ["mv", ret + "_", ret])
+    return ret
+
+
+def mount(args, suffix):
+    """
+    Replace the chroot with a new overlay over the pristine build chroot.
+    """
+    path_lower = lower(args, suffix)
+    discard(args, suffix)
+
+    logging.info("(" + suffix + ") mount overlay over pristine build chroot")
+    chroot = args.work + "/chroot_" + suffix
+    upper = args.work + "/overlay_" + suffix + "/upper"
+    work = args.work + "/overlay_" + suffix + "/work"
+    pmb.helpers.run.root(args, ["mkdir", "-p", chroot, upper, work])
+    pmb.helpers.run.root(args, ["mount", "-t", "overlay", "-o", "lowerdir=" +
+                                path_lower + ",upperdir=" + upper +
+                                ",workdir=" + work, "overlay", chroot])
+    pmb.helpers.mount.invalidate()
+
+    # Set up the files, that are not part of the template
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    if pmb.parse.arch.cpu_emulation_required(args, arch):
+        copy_qemu_user_binary(args, suffix)
+    pmb.chroot.init(args, suffix)
@@ -52,13 +52,6 @@ def root(args, cmd, suffix="native", working_dir="/", output="log",
     See pmb.helpers.run_core.core() for a detailed description of all other
     arguments and the return value.
     """
-    # Initialize chroot
-    chroot = args.work + "/chroot_" + suffix
-    if not auto_init and not os.path.islink(chroot + "/bin/sh"):
-        raise RuntimeError("Chroot does not exist: " + chroot)
-    if auto_init:
-        pmb.chroot.init(args, suffix)
-
     # Readable log message (without all the escaping)
     msg = "(" + suffix + ") % "
     for key, value in env.items():
@@ -67,6 +60,26 @@ def root(args, cmd, suffix="native", working_dir="/", output="log",
         msg += "cd " + working_dir + "; "
     msg += " ".join(cmd)
 
+    return run_script(args, msg, pmb.helpers.run.flat_cmd(cmd, working_dir),
+                      suffix, output, output_return, check, env, auto_init)
+
+
+def run_script(args, log_message, script, suffix="native", output="log",
+               output_return=False, check=None, env={}, auto_init=True):
+    """
+    Run a shell script inside a chroot as root. This is the common part of
+    root() and root_batch(), see root() for the arguments.
+
+    :param log_message: readable form of the script for the log
+    :param script: flat shell string, e.g. "cd /home/pmos;echo test"
+    """
+    # Initialize chroot
+    chroot = args.work + "/chroot_" + suffix
+    if not auto_init and not os.path.islink(chroot + "/bin/sh"):
+        raise RuntimeError("Chroot does not exist: " + chroot)
+    if auto_init:
+        pmb.chroot.init(args, suffix)
+
     # Merge env with defaults into env_all
     env_all = {"CHARSET": "UTF-8",
                "HISTFILE": "~/.ash_history",
@@ -78,14 +91,14 @@ def root(args, cmd, suffix="native", working_dir="/", output="log",
         env_all[key] = value
 
     # Build the command in steps and run it, e.g.:
-    # cmd: ["echo", "test"]
+    # script: "echo test"
     # cmd_chroot: ["/sbin/chroot", "/..._native", "/bin/sh", "-c", "echo test"]
     # cmd_sudo: ["sudo", "env", "-i", "sh", "-c", "PATH=... /sbin/chroot ..."]
     executables = executables_absolute_path()
-    cmd_chroot = [executables["chroot"], chroot, "/bin/sh", "-c",
-                  pmb.helpers.run.flat_cmd(cmd, working_dir)]
+    cmd_chroot = [executables["chroot"], chroot, "/bin/sh", "-c", script]
     cmd_sudo = ["sudo", "env", "-i", executables["sh"], "-c",
                 pmb.helpers.run.flat_cmd(cmd_chroot, env=env_all)]
     kill_as_root = output in ["log", "stdout"]
-    return pmb.helpers.run_core.core(args, msg, cmd_sudo, None, output,
-                                     output_return, check, kill_as_root)
+    return pmb.helpers.run_core.core(args, log_message, cmd_sudo, None,
+                                     output, output_return, check,
+                                     kill_as_root)
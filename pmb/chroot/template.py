@@ -0,0 +1,155 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Build chroot templates: after pmb.build.init() has set up a new build chroot,
+its files get stored as $WORK/cache_chroot_template/$ARCH_$KEY.tar. The key
+is a hash of the installed packages and their versions. When a build chroot
+of the same arch gets created again (e.g. after "pmbootstrap zap" or with
+"pmbootstrap build --strict"), and the APKINDEX still has the same versions
+of alpine-base, the build packages and their dependencies, the chroot gets
+extracted from the template instead of installing everything again.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+
+import pmb.chroot.apk
+import pmb.config
+import pmb.helpers.run
+import pmb.parse.apkindex
+import pmb.parse.arch
+
+# Paths that must not end up in the template: mountpoints (see
+# pmb.chroot.mount()) and files that get created for the current host
+exclude = ["/dev", "/native", "/etc/resolv.conf", "/etc/apk/repositories",
+           "/tmp/*", "/usr/bin/qemu-*-static"]
+
+
+def enabled(args, suffix):
+    """ Templates are only used for build chroots (not for rootfs_*). """
+    if suffix.startswith("rootfs_"):
+        return False
+    return "no_chroot_template" not in args or not args.no_chroot_template
+
+
+def key(arch, packages):
+    """
+    :param packages: dict of pkgname: version
+    :returns: sha256 hex digest
+    """
+    ret = hashlib.sha256()
+    ret.update(("arch=" + arch + "\nuid=" + pmb.config.chroot_uid_user +
+                "\n").encode())
+    for pkgname, version in sorted(packages.items()):
+        ret.update((pkgname + "=" + version + "\n").encode())
+    return ret.hexdigest()
+
+
+def packages_apkindex(args, arch):
+    """
+    Resolve the packages of a new build chroot with the APKINDEX files.
+
+    :returns: dict of pkgname: version for alpine-base, the build packages
+              and all their dependencies, or None if a dependency is missing
+    """
+    ret = {}
+    todo = ["alpine-base"] + pmb.config.build_packages
+    while todo:
+        package = pmb.parse.apkindex.package(args, todo.pop(), arch, False)
+        if not package:
+            return None
+        if package["pkgname"] in ret:
+            continue
+        ret[package["pkgname"]] = package["version"]
+        todo.extend(package["depends"])
+    return ret
+
+
+def packages_installed(args, suffix):
+    """ :returns: dict of pkgname: version of the packages in the chroot """
+    ret = {}
+    for name, package in pmb.chroot.apk.installed(args, suffix).items():
+        if name == package["pkgname"]:
+            ret[name] = package["version"]
+    return ret
+
+
+def path(args, arch, key):
+    return args.work + "/cache_chroot_template/" + arch + "_" + key + ".tar"
+
+
+def restore(args, suffix):
+    """
+    Extract the template into a new build chroot, if there is one that has
+    the same package versions as the APKINDEX.
+
+    :returns: True if the chroot was created from the template, False
+              otherwise
+    """
+    if not enabled(args, suffix):
+        return False
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    packages = packages_apkindex(args, arch)
+    if packages is None:
+        return False
+    template = path(args, arch, key(arch, packages))
+    if not os.path.exists(template):
+        logging.verbose("(" + suffix + ") no chroot template: " + template)
+        return False
+
+    logging.info("(" + suffix + ") extract chroot template")
+    chroot = args.work + "/chroot_" + suffix
+    pmb.helpers.run.root(args, ["tar", "-C", chroot, "-xpf", template,
+                                "--numeric-owner"])
+    return True
+
+
+def save(args, suffix):
+    """
+    Store a new build chroot as template (after pmb.build.init()). This is
+    skipped when the installed packages differ from what a new chroot would
+    get with the current APKINDEX, because restore() could not use the
+    template then. Older templates of the same arch get removed.
+    """
+    if not enabled(args, suffix):
+        return
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    packages = packages_installed(args, suffix)
+    if packages != packages_apkindex(args, arch):
+        logging.verbose("(" + suffix + ") not saving chroot template, the"
+                        " installed packages differ from the APKINDEX")
+        return
+    template = path(args, arch, key(arch, packages))
+    if os.path.exists(template):
+        return
+
+    logging.info("(" + suffix + ") save chroot template")
+    chroot = args.work + "/chroot_" + suffix
+    cmd = ["tar", "-C", chroot, "-cpf", template + "_", "--numeric-owner"]
+    paths_exclude = list(pmb.config.chroot_mount_bind.values()) + exclude
+    for path_exclude in paths_exclude:
+        cmd += ["--exclude", "." + path_exclude]
+    pmb.helpers.run.root(args, ["mkdir", "-p", os.path.dirname(template)])
+    pmb.helpers.run.root(args, cmd + ["."])
+    for old in glob.glob(path(args, arch, "*")):
+        pmb.helpers.run.root(args, ["rm", old])
+    pmb.helpers.run.root(args, ["mv", template + "_", template])
@@ -28,7 +28,8 @@ import pmb.parse.apkindex
 
 
 def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
-        pkgs_local_mismatch=False, pkgs_online_mismatch=False, distfiles=False):
+        pkgs_local_mismatch=False, pkgs_online_mismatch=False, distfiles=False,
+        build_cache=False):
     """
     Shutdown everything inside the chroots (e.g. distccd, adb), umount
     everything and then safely remove folders from the work-directory.
@@ -41,6 +42,7 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
     :param pkgs_online_mismatch: Clean out outdated binary packages downloaded from
                      mirrors (e.g. from Alpine)
     :param distfiles: Clear the downloaded files cache
+    :param build_cache: Clear the build cache (see pmb/build/buildcache.py)
 
     NOTE: This function gets called in pmb/config/init.py, with only args.work
     and args.device set!
@@ -64,8 +66,10 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
     # Deletion patterns for folders inside args.work
     patterns = [
         "chroot_native",
+        "chroot_native-*",
         "chroot_buildroot_*",
         "chroot_rootfs_*",
+        "overlay_*",
     ]
     if pkgs_local:
         patterns += ["packages"]
@@ -73,6 +77,8 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
         patterns += ["cache_http"]
     if distfiles:
         patterns += ["cache_distfiles"]
+    if build_cache:
+        patterns += ["cache_build"]
 
     # Delete everything matching the patterns
     for pattern in patterns:
@@ -85,7 +91,7 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
                     pmb.helpers.run.root(args, ["rm", "-rf", match])
 
     # Chroots were zapped, so no repo lists exist anymore
-    args.cache["apk_repository_list_updated"].clear()
+    args.cache.invalidate("apk_repository_list_updated")
 
     # Print amount of cleaned up space
     if dry:
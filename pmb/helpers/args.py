@@ -19,6 +19,7 @@ along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 import copy
 import os
 import pmb.config
+import pmb.helpers.session_cache
 
 """ This file constructs the args variable, which is passed to almost all
     functions in the pmbootstrap code base. Here's a listing of the kind of
@@ -67,7 +68,8 @@ import pmb.config
            args.cache["mycache"][key] = ret
            return ret
 
-       See add_cache() below for details.
+       Entries get removed with args.cache.invalidate("mycache", key). See
+       add_cache() below and pmb/helpers/session_cache.py for details.
 
     5. Parsed configs
        Similar to the cache above, specific config files get parsed and added
@@ -136,18 +138,35 @@ def add_shortcuts(args):
 
 
 def add_cache(args):
-    """ Add a caching dict (caches parsing of files etc. for the current
-        session) """
-    repo_update = {"404": [], "offline_msg_shown": False}
-    setattr(args, "cache", {"apkindex": {},
-                            "apkbuild": {},
-                            "apk_min_version_checked": [],
-                            "apk_repository_list_updated": [],
-                            "built": {},
-                            "find_aport": {},
-                            "pmb.helpers.package.depends_recurse": {},
-                            "pmb.helpers.package.get": {},
-                            "pmb.helpers.repo.update": repo_update})
+    """ Add the session cache (caches parsing of files etc. for the current
+        session, see pmb/helpers/session_cache.py) """
+    repo_update = {"404": set(), "offline_msg_shown": False}
+    cache = pmb.helpers.session_cache.SessionCache({
+        "apkindex": {},
+        "apkindex_providers": {},
+        "apkbuild": {},
+        "apk_min_version_checked": set(),
+        "apk_repository_list_updated": set(),
+        "built": set(),
+        "chroot_mounted": set(),
+        "find_aport": {},
+        "pmb.helpers.package.check_arch_recurse": {},
+        "pmb.helpers.package.depends_recurse": {},
+        "pmb.helpers.package.get": {},
+        "pmb.helpers.pmaports.subpackages_index_validity": {},
+        "pmb.helpers.rdepends.graph": {},
+        "pmb.helpers.repo.update": repo_update,
+        "pmaports_subpackages": {}})
+
+    # Providers are looked up in parsed APKINDEX files
+    def invalidate_providers(path):
+        providers = cache["apkindex_providers"]
+        for indexes in list(providers.keys()):
+            if path is None or path in indexes:
+                del providers[indexes]
+    cache.add_hook("apkindex", invalidate_providers)
+
+    setattr(args, "cache", cache)
 
 
 def add_deviceinfo(args):
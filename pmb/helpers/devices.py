@@ -37,10 +37,14 @@ def list_apkbuilds(args):
     """
     :returns: { "first-device": {"pkgname": ..., "pkgver": ...}, ... }
     """
-    ret = {}
+    paths = {}
     for device in list_codenames(args):
-        apkbuild_path = args.aports + "/device/device-" + device + "/APKBUILD"
-        ret[device] = pmb.parse.apkbuild(args, apkbuild_path)
+        paths[device] = args.aports + "/device/device-" + device + "/APKBUILD"
+    apkbuilds = pmb.parse.apkbuild_all(args, list(paths.values()))
+
+    ret = {}
+    for device, path in paths.items():
+        ret[device] = apkbuilds[path]
     return ret
 
 
@@ -0,0 +1,137 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Persistent caches, that survive the current pmbootstrap session. In contrast
+to args.cache (see pmb/helpers/args.py), the results are written to
+$WORK/cache_$NAME and can be loaded by the next pmbootstrap invocation.
+
+Every entry is stored together with a "validity" value (usually the last
+modified time and size of the parsed file, see file_validity()), the
+pmbootstrap version and the format version below. If any of these do not
+match when loading, the entry is considered outdated.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+
+import pmb.config
+
+# Increase this number, whenever the structure of cached data changes
+format_version = 2
+
+
+def file_validity(path):
+    """
+    Get a value, that changes whenever a file gets modified.
+
+    :param path: full path to the file
+    :returns: (last modified time in nanoseconds, size in bytes)
+    """
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def path(args, name, key):
+    """
+    Get the path to a cache entry on disk.
+
+    :param name: name of the cache (e.g. "apkindex")
+    :param key: identifier of the entry inside the cache (e.g. the full path
+                to the parsed file)
+    """
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return args.work + "/cache_" + name + "/" + digest + ".pickle"
+
+
+def load(args, name, key, validity):
+    """
+    Load an entry from a persistent cache.
+
+    :param name: name of the cache (e.g. "apkindex")
+    :param key: identifier of the entry inside the cache
+    :param validity: the entry is only returned, if it was saved with the same
+                     validity value (see file_validity())
+    :returns: the cached data or None
+    """
+    path_entry = path(args, name, key)
+    if not os.path.exists(path_entry):
+        return None
+
+    header_expected = (format_version, pmb.config.version, key, validity)
+    try:
+        with open(path_entry, "rb") as handle:
+            # The header gets pickled separately, so we don't need to load the
+            # whole data when it is outdated
+            if pickle.load(handle) != header_expected:
+                logging.verbose("Outdated " + name + " disk cache for: " + key)
+                return None
+            return pickle.load(handle)
+    except (EOFError, OSError, pickle.UnpicklingError, AttributeError,
+            ImportError, IndexError, TypeError, ValueError) as e:
+        logging.verbose("Failed to load " + name + " disk cache for " + key +
+                        ": " + str(e))
+        return None
+
+
+def save(args, name, key, validity, data):
+    """
+    Save an entry to a persistent cache. Does nothing, when the work folder
+    does not exist yet (so we don't interfere with 'pmbootstrap init').
+
+    :param name: name of the cache (e.g. "apkindex")
+    :param key: identifier of the entry inside the cache
+    :param validity: see load()
+    :param data: what should be cached, must be pickle-able
+    """
+    if not os.path.exists(args.work):
+        return
+
+    path_entry = path(args, name, key)
+    path_temp = path_entry + "." + str(os.getpid()) + ".tmp"
+    header = (format_version, pmb.config.version, key, validity)
+    try:
+        os.makedirs(os.path.dirname(path_entry), exist_ok=True)
+        with open(path_temp, "wb") as handle:
+            pickle.dump(header, handle, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, handle, pickle.HIGHEST_PROTOCOL)
+
+        # Replace atomically, parallel pmbootstrap sessions may read it
+        os.replace(path_temp, path_entry)
+    except OSError as e:
+        logging.verbose("Failed to save " + name + " disk cache for " + key +
+                        ": " + str(e))
+        if os.path.exists(path_temp):
+            os.remove(path_temp)
+
+
+def delete(args, name, key):
+    """
+    Remove an entry from a persistent cache.
+
+    :returns: True on successful deletion, False otherwise
+    """
+    # Parallel build processes may delete the same entry at the same time
+    try:
+        os.remove(path(args, name, key))
+    except FileNotFoundError:
+        return False
+    return True
@@ -19,6 +19,7 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import collections
 import glob
 import json
 import logging
@@ -28,6 +29,7 @@ import sys
 import pmb.aportgen
 import pmb.build
 import pmb.build.autodetect
+import pmb.build.scheduler
 import pmb.config
 import pmb.chroot
 import pmb.chroot.initfs
@@ -37,11 +39,13 @@ import pmb.flasher
 import pmb.helpers.logging
 import pmb.helpers.pkgrel_bump
 import pmb.helpers.pmaports
+import pmb.helpers.rdepends
 import pmb.helpers.repo
 import pmb.helpers.repo_missing
 import pmb.helpers.run
 import pmb.install
 import pmb.parse
+import pmb.parse.apkindex
 import pmb.qemu
 
 
@@ -88,8 +92,14 @@ def aportgen(args):
 
 
 def build(args):
-    # Strict mode: zap everything
-    if args.strict:
+    # Strict mode: zap everything (or build in overlays, see
+    # pmb/chroot/overlay.py)
+    if args.strict_overlay and not args.strict:
+        raise RuntimeError("--overlay can only be used with --strict")
+    if args.strict_overlay and args.no_chroot_template:
+        raise RuntimeError("--overlay can't be used with"
+                           " --no-chroot-template")
+    if args.strict and not args.strict_overlay:
         pmb.chroot.zap(args, False)
 
     if args.envkernel:
@@ -101,12 +111,35 @@ def build(args):
     force = True if src else args.force
     if src and not os.path.exists(src):
         raise RuntimeError("Invalid path specified for --src: " + src)
+    if args.parallel < 1:
+        raise RuntimeError("Invalid value for --parallel: " +
+                           str(args.parallel))
 
-    # Build all packages
+    packages = []
     for package in args.packages:
         arch_package = args.arch or pmb.build.autodetect.arch(args, package)
-        if not pmb.build.package(args, package, arch_package, force,
-                                 args.strict, src=src):
+        packages.append((package, arch_package))
+
+    # Build all packages one after another, pmb.build.package() recurses
+    # into the dependencies (no need to plan the whole build first)
+    outputs = collections.OrderedDict()
+    if args.parallel == 1 and not args.dry_run:
+        for package, arch_package in packages:
+            outputs[(package, arch_package)] = pmb.build.package(
+                args, package, arch_package, force, args.strict, src=src)
+
+    # Plan the build of all packages and their dependencies, then build them
+    # level by level
+    else:
+        build_plan = pmb.build.scheduler.plan(args, packages, force)
+        if args.dry_run:
+            pmb.build.scheduler.log_plan(args, build_plan)
+            return
+        outputs = pmb.build.scheduler.run(args, build_plan, force,
+                                          args.strict, src, args.parallel)
+
+    for (package, arch_package), output in outputs.items():
+        if not output:
             logging.info("NOTE: Package '" + package + "' is up to date. Use"
                          " 'pmbootstrap build " + package + " --force'"
                          " if needed.")
@@ -172,6 +205,17 @@ def repo_missing(args):
     print(json.dumps(missing, indent=4))
 
 
+def rdepends(args):
+    pmb.helpers.repo.update(args, args.arch)
+    packages = pmb.helpers.rdepends.get(args, args.package, args.arch,
+                                        not args.direct)
+    for package in packages:
+        print(package)
+
+    # Don't write the "Done" message
+    pmb.helpers.logging.disable()
+
+
 def index(args):
     pmb.build.index_repo(args)
 
@@ -281,6 +325,7 @@ def apkbuild_parse(args):
     packages = args.packages
     if not packages:
         packages = pmb.helpers.pmaports.get_list(args)
+        pmb.parse.apkbuild_all(args)
 
     # Iterate over all packages
     for package in packages:
@@ -298,7 +343,8 @@ def apkindex_parse(args):
             raise RuntimeError("Package not found in the APKINDEX: " +
                                args.package)
         result = result[args.package]
-    print(json.dumps(result, indent=4))
+    print(json.dumps(result, indent=4,
+                     default=pmb.parse.apkindex.Block.to_dict))
 
 
 def pkgrel_bump(args):
@@ -363,7 +409,8 @@ def zap(args):
     pmb.chroot.zap(args, dry=args.dry, http=args.http,
                    distfiles=args.distfiles, pkgs_local=args.pkgs_local,
                    pkgs_local_mismatch=args.pkgs_local_mismatch,
-                   pkgs_online_mismatch=args.pkgs_online_mismatch)
+                   pkgs_online_mismatch=args.pkgs_online_mismatch,
+                   build_cache=args.build_cache)
 
     # Don't write the "Done" message
     pmb.helpers.logging.disable()
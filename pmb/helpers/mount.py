@@ -17,8 +17,51 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
+import select
 import pmb.helpers.run
 
+# Parsed /proc/mounts of the current process (see table())
+_table = {}
+
+
+def invalidate():
+    """ Parse /proc/mounts again on the next lookup (after mounting). """
+    _table.pop("entries", None)
+
+
+def table(source="/proc/mounts"):
+    """
+    Parse the mount table and keep the result, until it changes. The kernel
+    reports each change (mount or umount by any process) as priority event
+    when polling the opened /proc/mounts (see proc(5)), so checking if the
+    result is still valid does not need to read the file.
+
+    :returns: (mountpoints, sources): sets of the second and first column
+    """
+    if _table.get("pid") != os.getpid() or _table["source"] != source:
+        # Forked processes need their own handle, the events of a handle get
+        # cleared when reading it
+        _table.clear()
+        handle = open(source, "rb")
+        poll = select.poll()
+        poll.register(handle, select.POLLPRI | select.POLLERR)
+        _table.update({"pid": os.getpid(), "source": source,
+                       "handle": handle, "poll": poll})
+    elif "entries" in _table and not _table["poll"].poll(0):
+        return _table["entries"]
+
+    handle = _table["handle"]
+    handle.seek(0)
+    mountpoints = set()
+    sources = set()
+    for line in handle.read().decode("utf-8").splitlines():
+        words = line.split()
+        if len(words) >= 2:
+            sources.add(words[0])
+            mountpoints.add(words[1])
+    _table["entries"] = (mountpoints, sources)
+    return _table["entries"]
+
 
 def ismount(folder):
     """
@@ -26,14 +69,8 @@ def ismount(folder):
     Workaround for: https://bugs.python.org/issue29707
     """
     folder = os.path.realpath(os.path.realpath(folder))
-    with open("/proc/mounts", "r") as handle:
-        for line in handle:
-            words = line.split()
-            if len(words) >= 2 and words[1] == folder:
-                return True
-            if words[0] == folder:
-                return True
-    return False
+    mountpoints, sources = table()
+    return folder in mountpoints or folder in sources
 
 
 def bind(args, source, destination, create_folders=True, umount=False):
@@ -60,6 +97,7 @@ def bind(args, source, destination, create_folders=True, umount=False):
 
     # Actually mount the folder
     pmb.helpers.run.root(args, ["mount", "--bind", source, destination])
+    invalidate()
 
     # Verify, that it has worked
     if not ismount(destination):
@@ -82,6 +120,7 @@ def bind_blockdevice(args, source, destination):
     # Mount
     pmb.helpers.run.root(args, ["mount", "--bind", source,
                                 destination])
+    invalidate()
 
 
 def umount_all_list(prefix, source="/proc/mounts"):
@@ -113,7 +152,9 @@ def umount_all(args, folder):
     """
     Umount all folders, that are mounted inside a given folder.
     """
+    args.cache.invalidate("chroot_mounted")
     for mountpoint in umount_all_list(folder):
         pmb.helpers.run.root(args, ["umount", mountpoint])
+        invalidate()
         if ismount(mountpoint):
             raise RuntimeError("Failed to umount: " + mountpoint)
@@ -26,10 +26,85 @@ Functions that work on both pmaports and (binary package) repos. See also:
 """
 
 import logging
-import copy
 
 import pmb.helpers.pmaports
 import pmb.helpers.repo
+import pmb.parse.apkindex
+
+
+class Package:
+    """
+    Return value of get(). Packages are immutable (arch, depends and provides
+    are tuples), so they can be stored in the cache and returned to all
+    callers without copying them. Like pmb.parse.apkindex.Block, they can be
+    accessed like a dictionary (package["depends"], "version" in package, ...)
+    and compare equal to the dictionary returned by to_dict().
+    """
+    __slots__ = ("arch", "depends", "pkgname", "provides", "version")
+
+    def __init__(self, arch, depends, pkgname, provides, version):
+        set_attr = object.__setattr__
+        set_attr(self, "arch", tuple(arch))
+        set_attr(self, "depends", tuple(depends))
+        set_attr(self, "pkgname", pkgname)
+        set_attr(self, "provides", tuple(provides))
+        set_attr(self, "version", version)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("packages from pmb.helpers.package.get() are"
+                             " immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError("packages from pmb.helpers.package.get() are"
+                             " immutable")
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, Package):
+            return all(getattr(self, key) == getattr(other, key)
+                       for key in self.__slots__)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def replace(self, **kwargs):
+        """ :returns: a new package, with the given keys replaced """
+        values = {key: getattr(self, key) for key in self.__slots__}
+        values.update(kwargs)
+        return Package(**values)
+
+    def to_dict(self):
+        """
+        :returns: a new dictionary, "arch", "depends" and "provides" are
+                  lists (like the return value of get() used to be)
+        """
+        ret = {}
+        for key in self.__slots__:
+            value = getattr(self, key)
+            ret[key] = list(value) if isinstance(value, tuple) else value
+        return ret
 
 
 def get(args, pkgname, arch, replace_subpkgnames=False):
@@ -43,28 +118,29 @@ def get(args, pkgname, arch, replace_subpkgnames=False):
                      with check_arch(). Example: "armhf"
         :param replace_subpkgnames: replace all subpkgnames with their main
                                     pkgnames in the depends (see #1733)
-        :returns: data from the parsed APKBUILD or APKINDEX in the following
-                  format: {"arch": ["noarch"],
+        :returns: data from the parsed APKBUILD or APKINDEX as Package, which
+                  can be accessed like the following dictionary (with tuples
+                  instead of lists):
+                          {"arch": ["noarch"],
                            "depends": ["busybox-extras", "lddtree", ...],
                            "pkgname": "postmarketos-mkinitfs",
                            "provides": ["mkinitfs=0..1"],
                            "version": "0.0.4-r10"} """
     # Cached result
     cache_key = "pmb.helpers.package.get"
-    if (arch in args.cache[cache_key] and
-            pkgname in args.cache[cache_key][arch] and
-            replace_subpkgnames in args.cache[cache_key][arch][pkgname]):
-        return args.cache[cache_key][arch][pkgname][replace_subpkgnames]
+    cache_entry = (arch, pkgname, replace_subpkgnames)
+    if cache_entry in args.cache[cache_key]:
+        return args.cache[cache_key][cache_entry]
 
     # Find in pmaports
     ret = None
     pmaport = pmb.helpers.pmaports.get(args, pkgname, False)
     if pmaport:
-        ret = {"arch": pmaport["arch"],
-               "depends": pmb.build._package.get_depends(args, pmaport),
-               "pkgname": pmaport["pkgname"],
-               "provides": pmaport["provides"],
-               "version": pmaport["pkgver"] + "-r" + pmaport["pkgrel"]}
+        ret = Package(pmaport["arch"],
+                      pmb.build._package.get_depends(args, pmaport),
+                      pmaport["pkgname"],
+                      pmaport["provides"],
+                      pmaport["pkgver"] + "-r" + pmaport["pkgrel"])
 
     # Find in APKINDEX (given arch)
     if not ret:
@@ -80,14 +156,10 @@ def get(args, pkgname, arch, replace_subpkgnames=False):
             if ret:
                 break
 
-    # Copy ret (it might have references to caches of the APKINDEX or APKBUILDs
-    # and we don't want to modify those!)
-    if ret:
-        ret = copy.deepcopy(ret)
-
-    # Make sure ret["arch"] is a list (APKINDEX code puts a string there)
-    if ret and isinstance(ret["arch"], str):
-        ret["arch"] = [ret["arch"]]
+    # APKINDEX blocks only have one arch
+    if ret and not isinstance(ret, Package):
+        ret = Package([ret["arch"]], ret["depends"], ret["pkgname"],
+                      ret.get("provides", []), ret["version"])
 
     # Replace subpkgnames if desired
     if replace_subpkgnames:
@@ -96,15 +168,11 @@ def get(args, pkgname, arch, replace_subpkgnames=False):
             depend = get(args, depend, arch)["pkgname"]
             if depend not in depends_new:
                 depends_new += [depend]
-        ret["depends"] = depends_new
+        ret = ret.replace(depends=depends_new)
 
     # Save to cache and return
     if ret:
-        if arch not in args.cache[cache_key]:
-            args.cache[cache_key][arch] = {}
-        if pkgname not in args.cache[cache_key][arch]:
-            args.cache[cache_key][arch][pkgname] = {}
-        args.cache[cache_key][arch][pkgname][replace_subpkgnames] = ret
+        args.cache[cache_key][cache_entry] = ret
         return ret
 
     # Could not find the package
@@ -121,9 +189,8 @@ def depends_recurse(args, pkgname, arch):
                    "linux-samsung-i9100", ...] """
     # Cached result
     cache_key = "pmb.helpers.package.depends_recurse"
-    if (arch in args.cache[cache_key] and
-            pkgname in args.cache[cache_key][arch]):
-        return args.cache[cache_key][arch][pkgname]
+    if (arch, pkgname) in args.cache[cache_key]:
+        return args.cache[cache_key][(arch, pkgname)]
 
     # Build ret (by iterating over the queue)
     queue = [pkgname]
@@ -143,9 +210,7 @@ def depends_recurse(args, pkgname, arch):
     ret.sort()
 
     # Save to cache and return
-    if arch not in args.cache[cache_key]:
-        args.cache[cache_key][arch] = {}
-    args.cache[cache_key][arch][pkgname] = ret
+    args.cache[cache_key][(arch, pkgname)] = ret
     return ret
 
 
@@ -173,6 +238,47 @@ def check_arch(args, pkgname, arch, binary=True):
     return False
 
 
+def check_arch_recurse_find(args, pkgname, arch):
+    """ Find a package in the dependency tree of pkgname, that can't be built
+        for the arch. The results are cached for each package in the tree, so
+        subtrees shared by multiple packages only get checked once per arch.
+        :returns: pkgname of the first package found, that can't be built, or
+                  None if all of them can be built """
+    cache = args.cache["pmb.helpers.package.check_arch_recurse"]
+    visiting = {}
+
+    def find(pkgname):
+        """ :returns: (result, depth of the highest package currently being
+                       visited, that the result is based on) """
+        if (arch, pkgname) in cache:
+            return (cache[(arch, pkgname)], len(visiting))
+        if pkgname in visiting:
+            return (None, visiting[pkgname])  # cycle
+        depth = len(visiting)
+        visiting[pkgname] = depth
+
+        ret = None
+        ret_depth = depth
+        if not check_arch(args, pkgname, arch):
+            ret = pkgname
+        else:
+            for depend in get(args, pkgname, arch)["depends"]:
+                ret, ret_depth_depend = find(get(args, depend,
+                                                 arch)["pkgname"])
+                ret_depth = min(ret_depth, ret_depth_depend)
+                if ret:
+                    break
+        del visiting[pkgname]
+
+        # A package in a cycle may only be found buildable after all others
+        # in the cycle are done (non-buildable packages are always final)
+        if ret or ret_depth >= depth:
+            cache[(arch, pkgname)] = ret
+        return (ret, ret_depth)
+
+    return find(pkgname)[0]
+
+
 def check_arch_recurse(args, pkgname, arch):
     """ Recursively check if a package and its dependencies exist (binary repo)
         or can be built (pmaports) for a certain architecture.
@@ -181,11 +287,10 @@ def check_arch_recurse(args, pkgname, arch):
         :returns: True when all the package's dependencies can be built or
                   exist for the arch in question
     """
-    for pkgname_i in depends_recurse(args, pkgname, arch):
-        if not check_arch(args, pkgname_i, arch):
-            if pkgname_i != pkgname:
-                logging.verbose(pkgname_i + ": (indirectly) depends on " +
-                                pkgname)
-            logging.verbose(pkgname_i + ": can't be built for " + arch)
-            return False
-    return True
+    pkgname_i = check_arch_recurse_find(args, pkgname, arch)
+    if not pkgname_i:
+        return True
+    if pkgname_i != pkgname:
+        logging.verbose(pkgname_i + ": (indirectly) depends on " + pkgname)
+    logging.verbose(pkgname_i + ": can't be built for " + arch)
+    return False
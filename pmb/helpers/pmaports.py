@@ -29,6 +29,7 @@ import glob
 import logging
 import os
 
+import pmb.helpers.disk_cache
 import pmb.parse
 
 
@@ -69,6 +70,77 @@ def guess_main(args, subpkgname):
             return paths[0]
 
 
+def subpackages_index_validity(args):
+    """
+    Get a value for the disk cache of subpackages_index(), that changes when
+    any APKBUILD gets added, removed or modified. It is only calculated once
+    per session (see pmb.helpers.args.add_cache()).
+    """
+    cache = args.cache["pmb.helpers.pmaports.subpackages_index_validity"]
+    if args.aports in cache:
+        return cache[args.aports]
+
+    ret = []
+    for path in sorted(glob.glob(args.aports + "/*/*/APKBUILD")):
+        ret.append((path,) + pmb.helpers.disk_cache.file_validity(path))
+    ret = tuple(ret)
+    cache[args.aports] = ret
+    return ret
+
+
+def subpackages_index(args):
+    """
+    Map all subpackages and provides of all pmaports to their aport folders.
+    Building the index requires parsing every APKBUILD, so it is cached for
+    the current session and on disk (see pmb/helpers/disk_cache.py).
+
+    :returns: dict like: {"hello-world-doc": "/home/user/code/pmbootstrap/
+                          aports/main/hello-world", "mkbootimg": ..., ...}
+    """
+    # Cached for the current session
+    if args.aports in args.cache["pmaports_subpackages"]:
+        return args.cache["pmaports_subpackages"][args.aports]
+
+    # Cached on disk (until any APKBUILD changes)
+    validity = subpackages_index_validity(args)
+    ret = pmb.helpers.disk_cache.load(args, "pmaports", args.aports, validity)
+
+    if ret is None:
+        logging.verbose("Indexing subpackages and provides of all pmaports")
+        ret = {}
+        apkbuilds = [entry[0] for entry in validity]
+        for path, apkbuild in pmb.parse.apkbuild_all(args, apkbuilds).items():
+            aport = os.path.dirname(path)
+
+            # Subpackages
+            for subpackage in apkbuild["subpackages"]:
+                ret.setdefault(subpackage.split(":", 1)[0], aport)
+
+            # Provides (cut off before equals sign for entries like
+            # "mkbootimg=0.0.1")
+            for provides in apkbuild["provides"]:
+                ret.setdefault(provides.split("=", 1)[0], aport)
+        pmb.helpers.disk_cache.save(args, "pmaports", args.aports, validity,
+                                    ret)
+
+    args.cache["pmaports_subpackages"][args.aports] = ret
+    return ret
+
+
+def invalidate(args, aport):
+    """
+    Clear the session caches of the pmaports indexes and of the parsed
+    APKBUILD, after an aport has been created or modified (e.g. by
+    "pmbootstrap aportgen").
+
+    :param aport: full path to the aport folder
+    """
+    args.cache.invalidate("apkbuild", aport + "/APKBUILD")
+    args.cache.invalidate("find_aport")
+    args.cache.invalidate("pmaports_subpackages")
+    args.cache.invalidate("pmb.helpers.pmaports.subpackages_index_validity")
+
+
 def find(args, package, must_exist=True):
     """
     Find the aport path, that provides a certain subpackage.
@@ -98,27 +170,7 @@ def find(args, package, must_exist=True):
 
         # Search in subpackages and provides
         if not ret:
-            for path_current in glob.glob(args.aports + "/*/*/APKBUILD"):
-                apkbuild = pmb.parse.apkbuild(args, path_current)
-                found = False
-
-                # Subpackages
-                for subpackage_i in apkbuild["subpackages"]:
-                    if package == subpackage_i.split(":", 1)[0]:
-                        found = True
-                        break
-
-                # Provides (cut off before equals sign for entries like
-                # "mkbootimg=0.0.1")
-                if not found:
-                    for provides_i in apkbuild["provides"]:
-                        if package == provides_i.split("=", 1)[0]:
-                            found = True
-                            break
-
-                if found:
-                    ret = os.path.dirname(path_current)
-                    break
+            ret = subpackages_index(args).get(package)
 
         # Guess a main package
         if not ret:
@@ -0,0 +1,154 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Reverse dependencies: which pmaports depend (directly or indirectly) on a
+package, e.g. to find out what needs to be rebuilt after bumping a library.
+"""
+
+import collections
+import logging
+import os
+
+import pmb.build._package
+import pmb.helpers.pmaports
+import pmb.helpers.repo
+import pmb.parse
+import pmb.parse.apkindex
+
+
+def names(args):
+    """
+    Map the pkgnames, subpackages and provides names of all pmaports to the
+    pkgnames of their pmaports. Only exact names are in there, in contrast to
+    pmb.helpers.pmaports.find(), which also guesses the pmaport of unknown
+    subpackages (e.g. "hello-world" for "hello-world-dev").
+
+    :returns: dict like: {"hello-world": "hello-world",
+                          "hello-world-doc": "hello-world", ...}
+    """
+    ret = {}
+    for name, aport in pmb.helpers.pmaports.subpackages_index(args).items():
+        ret[name] = os.path.basename(aport)
+    for apkbuild in pmb.parse.apkbuild_all(args).values():
+        ret[apkbuild["pkgname"]] = apkbuild["pkgname"]
+    return ret
+
+
+def origin(args, pkgname, arch, names_pmaports=None):
+    """
+    Find the pmaport, that a dependency gets resolved to.
+
+    :param pkgname: package, subpackage or provides name of a pmaport, or any
+                    name from an APKINDEX (e.g. "so:libGL.so.1")
+    :param arch: architecture of the APKINDEX files to look at
+    :param names_pmaports: return value of names() (gets generated if None)
+    :returns: pkgname of the pmaport (e.g. "mesa") or None, when the package
+              is not built from pmaports
+    """
+    if names_pmaports is None:
+        names_pmaports = names(args)
+    if pkgname in names_pmaports:
+        return names_pmaports[pkgname]
+
+    providers = pmb.parse.apkindex.providers(args, pkgname, arch, False)
+    for provider in providers.values():
+        if names_pmaports.get(provider["origin"]) == provider["origin"]:
+            return provider["origin"]
+    return None
+
+
+def graph(args, arch):
+    """
+    Build the reverse dependency graph of all pmaports. The dependencies come
+    from the APKBUILDs (depends, makedepends, checkdepends) and from the
+    APKINDEX files (runtime dependencies of the binary packages, e.g. the
+    so: names that abuild detected). Only the APKINDEX files that have been
+    downloaded already get used.
+
+    :param arch: architecture of the APKINDEX files to look at
+    :returns: dict of pmaport pkgnames and the sets of pmaport pkgnames, that
+              depend on them directly, e.g.:
+              {"hello-world": {"hello-world-wrapper"}, ...}
+    """
+    # Cached result
+    cache_key = "pmb.helpers.rdepends.graph"
+    if arch in args.cache[cache_key]:
+        return args.cache[cache_key][arch]
+
+    logging.verbose("Calculate reverse dependencies of all pmaports (" +
+                    arch + ")")
+    ret = collections.defaultdict(set)
+    origins = {}
+    names_pmaports = names(args)
+
+    def add(depends, pkgname):
+        for depend in depends:
+            if depend not in origins:
+                origins[depend] = origin(args, depend, arch, names_pmaports)
+            depend_origin = origins[depend]
+            if depend_origin and depend_origin != pkgname:
+                ret[depend_origin].add(pkgname)
+
+    # Dependencies from the APKBUILDs (without versions and conflicts)
+    pmaports = set()
+    for apkbuild in pmb.parse.apkbuild_all(args).values():
+        pkgname = apkbuild["pkgname"]
+        pmaports.add(pkgname)
+        depends = pmb.build._package.get_depends(args, apkbuild)
+        add(pmb.parse.apkindex.split_depends(" ".join(depends)), pkgname)
+
+    # Dependencies of binary packages built from pmaports (the caller needs
+    # to update the APKINDEX files first, see pmb.helpers.repo.update())
+    for path in pmb.helpers.repo.apkindex_files(args, arch):
+        for provide, blocks in pmb.parse.apkindex.parse(args, path).items():
+            # Only look at each package once, not at all of its aliases
+            block = blocks.get(provide)
+            if block and block.get("origin") in pmaports:
+                add(block["depends"], block["origin"])
+
+    ret = dict(ret)
+    args.cache[cache_key][arch] = ret
+    return ret
+
+
+def get(args, pkgname, arch, recursive=True):
+    """
+    Get the pmaports, that depend on a package.
+
+    :param pkgname: package, subpackage or provides name (e.g. "so:libGL.so.1")
+    :param arch: architecture of the APKINDEX files to look at
+    :param recursive: also include the pmaports, that depend on the package
+                      only indirectly
+    :returns: sorted list of pmaport pkgnames, e.g.: ["hello-world-wrapper"]
+    """
+    start = origin(args, pkgname, arch) or pkgname
+    rdepends = graph(args, arch)
+
+    # Breadth-first search through the graph
+    ret = set()
+    queue = collections.deque([start])
+    while len(queue):
+        for pkgname_rdepend in rdepends.get(queue.popleft(), []):
+            if pkgname_rdepend in ret or pkgname_rdepend == start:
+                continue
+            ret.add(pkgname_rdepend)
+            if recursive:
+                queue.append(pkgname_rdepend)
+    return sorted(ret)
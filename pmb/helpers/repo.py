@@ -28,6 +28,7 @@ import hashlib
 import logging
 import pmb.helpers.http
 import pmb.helpers.run
+import pmb.parse.apkindex
 
 
 def hash(url, length=8):
@@ -178,12 +179,13 @@ def update(args, arch=None, force=False, existing_only=False):
         temp = pmb.helpers.http.download(args, url, "APKINDEX", False,
                                          logging.DEBUG, True)
         if not temp:
-            args.cache[cache_key]["404"].append(url)
+            args.cache[cache_key]["404"].add(url)
             continue
         target_folder = os.path.dirname(target)
         if not os.path.exists(target_folder):
             pmb.helpers.run.root(args, ["mkdir", "-p", target_folder])
         pmb.helpers.run.root(args, ["cp", temp, target])
+        pmb.parse.apkindex.clear_cache(args, target)
 
     return True
 
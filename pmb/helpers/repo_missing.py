@@ -21,6 +21,7 @@ import logging
 import pmb.build
 import pmb.helpers.package
 import pmb.helpers.pmaports
+import pmb.parse
 
 
 def filter_missing_packages(args, arch, pkgnames):
@@ -85,6 +86,7 @@ def get_relevant_packages(args, arch, pkgname=None, built=False):
         ret = pmb.helpers.package.depends_recurse(args, pkgname, arch)
     else:
         ret = pmb.helpers.pmaports.get_list(args)
+        pmb.parse.apkbuild_all(args)
         ret = filter_arch_packages(args, arch, ret)
     if built:
         ret = filter_aport_packages(args, arch, ret)
@@ -124,7 +126,7 @@ def generate_output_format(args, arch, pkgnames):
         ret += [{"pkgname": entry["pkgname"],
                  "repo": pmb.helpers.pmaports.get_repo(args, pkgname),
                  "version": entry["version"],
-                 "depends": entry["depends"]}]
+                 "depends": list(entry["depends"])}]
     return ret
 
 
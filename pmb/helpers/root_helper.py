@@ -0,0 +1,300 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Long-lived root helper process ('pmbootstrap --root-helper'). Instead of
+running "sudo env -i ... chroot ..." for each command, this file gets started
+once per session with sudo, and runs the commands that it receives through
+its stdin. Their output gets streamed back through its stdout.
+
+Messages in both directions are frames of a one byte type, the payload length
+as four bytes (big endian) and the payload:
+* "r": run a command, payload: JSON {"cmd": [...], "cwd": "/..." or None}.
+       A leading "env [-i] VAR=value ..." gets handled by the helper itself.
+* "k": kill the running command (with all its child processes)
+* "o": output of the running command
+* "x": the command has finished, payload: its exit code
+
+The helper runs as root and gets started by its path in isolated mode ("-I",
+so pmb/helpers is not in sys.path), it must only use the Python standard
+library.
+"""
+
+import atexit
+import json
+import logging
+import os
+import selectors
+import signal
+import struct
+import subprocess
+import sys
+
+header = struct.Struct("!cI")
+
+# Helper process of the current pmbootstrap process (parallel builds fork
+# new processes, which need their own helper)
+_helper = {}
+
+
+def write_frame(fd, frame_type, payload=b""):
+    data = header.pack(frame_type, len(payload)) + payload
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def read_exact(fd, length):
+    """ :returns: bytes of the given length, or None at the end of the file """
+    ret = b""
+    while len(ret) < length:
+        data = os.read(fd, length - len(ret))
+        if not data:
+            return None
+        ret += data
+    return ret
+
+
+def read_frame(fd):
+    """ :returns: (type, payload) or None at the end of the file """
+    data = read_exact(fd, header.size)
+    if data is None:
+        return None
+    frame_type, length = header.unpack(data)
+    payload = read_exact(fd, length) if length else b""
+    if payload is None:
+        return None
+    return (frame_type, payload)
+
+
+def split_env(cmd):
+    """
+    Handle "env" and "env -i" in the helper, so it doesn't need to be
+    started.
+
+    :param cmd: e.g. ["env", "-i", "HOME=/root", "/usr/sbin/chroot", ...]
+    :returns: (cmd, env), e.g. (["/usr/sbin/chroot", ...], {"HOME": "/root"}).
+              Without "-i", env also contains the environment of the helper.
+              env is None, when cmd does not start with "env" or "env -i".
+    """
+    if cmd[0:2] == ["env", "-i"]:
+        env = {}
+        cmd = cmd[2:]
+    elif cmd[0] == "env" and len(cmd) > 1 and "=" in cmd[1]:
+        env = dict(os.environ)
+        cmd = cmd[1:]
+    else:
+        return (cmd, None)
+    while cmd and "=" in cmd[0]:
+        key, value = cmd[0].split("=", 1)
+        env[key] = value
+        cmd = cmd[1:]
+    return (cmd, env)
+
+
+def serve_command(request, fd_in, fd_out):
+    """
+    Run one command and stream its output.
+
+    :returns: False when pmbootstrap has closed the connection, True
+              otherwise
+    """
+    cmd, env = split_env(request["cmd"])
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   cwd=request["cwd"], env=env,
+                                   start_new_session=True)
+    except OSError as e:
+        write_frame(fd_out, b"o", (str(e) + "\n").encode("utf-8"))
+        write_frame(fd_out, b"x", b"127")
+        return True
+
+    connected = True
+    sel = selectors.DefaultSelector()
+    sel.register(process.stdout, selectors.EVENT_READ)
+    sel.register(fd_in, selectors.EVENT_READ)
+    try:
+        while True:
+            done = False
+            for key, events in sel.select():
+                if key.fileobj is process.stdout:
+                    data = os.read(process.stdout.fileno(), 65536)
+                    if data:
+                        write_frame(fd_out, b"o", data)
+                    else:
+                        done = True
+                    continue
+
+                # Kill requested, or pmbootstrap is gone
+                frame = read_frame(fd_in)
+                if frame is None:
+                    connected = False
+                    sel.unregister(fd_in)
+                if frame is None or frame[0] == b"k":
+                    kill(process)
+            if done:
+                break
+    except BaseException:
+        # The helper gets terminated: don't leave the command running
+        kill(process)
+        raise
+
+    process.stdout.close()
+    write_frame(fd_out, b"x", str(process.wait()).encode("utf-8"))
+    return connected
+
+
+def kill(process):
+    """ Kill a command of serve_command() with all its child processes. """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def terminate(signum, frame):
+    sys.exit(128 + signum)
+
+
+def serve():
+    """
+    Main loop of the helper process (running as root). The commands run in
+    their own session, so Ctrl-C in the terminal only reaches pmbootstrap
+    and the helper: the helper keeps running, and pmbootstrap asks it to kill
+    the command (see run()). SIGINT gets caught instead of ignored, so the
+    commands don't inherit SIG_IGN.
+    """
+    signal.signal(signal.SIGINT, lambda signum, frame: None)
+    signal.signal(signal.SIGTERM, terminate)
+    fd_in = sys.stdin.fileno()
+    fd_out = sys.stdout.fileno()
+    while True:
+        frame = read_frame(fd_in)
+        if frame is None:
+            return
+        frame_type, payload = frame
+        if frame_type != b"r":
+            continue
+        if not serve_command(json.loads(payload.decode("utf-8")), fd_in,
+                             fd_out):
+            return
+
+
+def enabled(args):
+    return "root_helper" in args and args.root_helper
+
+
+def stop():
+    """ Let the helper process of this pmbootstrap process exit. """
+    if _helper.get("pid") != os.getpid():
+        return
+    process = _helper["process"]
+    _helper.clear()
+    process.stdin.close()
+    process.wait()
+    process.stdout.close()
+
+
+def start(args):
+    """ :returns: subprocess.Popen instance of the running helper process """
+    if _helper.get("pid") == os.getpid():
+        return _helper["process"]
+
+    cmd = ["sudo", sys.executable, "-I", os.path.realpath(__file__)]
+    logging.debug("Start root helper process")
+    logging.verbose("run: " + str(cmd))
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE)
+    _helper["pid"] = os.getpid()
+    _helper["process"] = process
+    atexit.register(stop)
+    return process
+
+
+def run(args, cmd, working_dir=None, output_to_stdout=False,
+        output_return=False, output_timeout=True):
+    """
+    Run a command as root through the helper process. This is called by
+    pmb.helpers.run_core.core() for the "log" and "stdout" output modes.
+
+    :param cmd: command without the leading "sudo"
+    See pmb.helpers.run_core.foreground_pipe() for the other parameters and
+    the return value.
+    """
+    process = start(args)
+    fd_in = process.stdout.fileno()
+    fd_out = process.stdin.fileno()
+    request = {"cmd": cmd, "cwd": working_dir}
+    write_frame(fd_out, b"r", json.dumps(request).encode("utf-8"))
+
+    # Write the log messages of the text layer before the output
+    args.logfd.flush()
+    if output_to_stdout:
+        sys.stdout.flush()
+
+    output_buffer = []
+    sel = selectors.DefaultSelector()
+    sel.register(fd_in, selectors.EVENT_READ)
+    timeout = args.timeout if output_timeout else None
+    killed = False
+    while True:
+        try:
+            ready = sel.select(None if killed else timeout)
+        except KeyboardInterrupt:
+            # Ctrl-C: kill the command and wait until it has finished
+            write_frame(fd_out, b"k")
+            while True:
+                frame = read_frame(fd_in)
+                if frame is None:
+                    _helper.clear()
+                    break
+                if frame[0] == b"x":
+                    break
+            raise
+        if not ready:
+            logging.info("Process did not write any output for " +
+                         str(args.timeout) + " seconds. Killing it.")
+            logging.info("NOTE: The timeout can be increased with"
+                         " 'pmbootstrap -t'.")
+            write_frame(fd_out, b"k")
+            killed = True
+            continue
+
+        frame = read_frame(fd_in)
+        if frame is None:
+            _helper.clear()
+            raise RuntimeError("The root helper process exited unexpectedly")
+        frame_type, payload = frame
+        if frame_type == b"x":
+            break
+        args.logfd.buffer.write(payload)
+        if output_to_stdout:
+            sys.stdout.buffer.write(payload)
+        if output_return:
+            output_buffer.append(payload)
+
+    args.logfd.flush()
+    if output_to_stdout:
+        sys.stdout.flush()
+    return (int(payload), b"".join(output_buffer).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    serve()
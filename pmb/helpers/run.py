@@ -86,8 +86,11 @@ def root(args, cmd, working_dir=None, output="log", output_return=False,
     See pmb.helpers.run_core.core() for a detailed description of all other
     arguments and the return value.
     """
+    # Set the environment variables with env, not with "sh -c", so the command
+    # still starts with sudo (see pmb.helpers.root_helper)
     if env:
-        cmd = ["sh", "-c", flat_cmd(cmd, env=env)]
+        cmd = ["env"] + [key + "=" + value for key, value in env.items()] + \
+            cmd
     cmd = ["sudo"] + cmd
-    return user(args, cmd, working_dir, output, output_return, check, env,
+    return user(args, cmd, working_dir, output, output_return, check, {},
                 True)
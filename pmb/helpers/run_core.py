@@ -23,6 +23,7 @@ import subprocess
 import sys
 import time
 import os
+import pmb.helpers.root_helper
 import pmb.helpers.run
 
 """ For a detailed description of all output modes, read the description of
@@ -287,11 +288,19 @@ def core(args, log_message, cmd, working_dir=None, output="log",
             output_to_stdout = True
 
         output_timeout = output in ["log", "stdout"]
-        (code, output_after_run) = foreground_pipe(args, cmd, working_dir,
-                                                   output_to_stdout,
-                                                   output_return,
-                                                   output_timeout,
-                                                   kill_as_root)
+        if (cmd[0] == "sudo" and output_timeout and
+                pmb.helpers.root_helper.enabled(args)):
+            # Persistent root helper (pmbootstrap --root-helper)
+            (code, output_after_run) = pmb.helpers.root_helper.run(
+                args, cmd[1:], working_dir, output_to_stdout, output_return,
+                output_timeout)
+        else:
+            (code, output_after_run) = foreground_pipe(args, cmd,
+                                                       working_dir,
+                                                       output_to_stdout,
+                                                       output_return,
+                                                       output_timeout,
+                                                       kill_as_root)
 
     # Check the return code
     if code and check is not False:
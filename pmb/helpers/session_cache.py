@@ -0,0 +1,203 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The session cache (args.cache, see pmb/helpers/args.py). Each named cache is
+a dict or a set, which counts how often a lookup ("key in cache" or
+cache.get(key)) was a hit or a miss. The time between a miss and storing the
+key in the cache gets added up as well, that is how long it took to compute
+the missing entries. Only the latest misses are remembered for that (see
+computing_max), so lookups that never get stored (e.g. "if key in cache" as
+plain check) don't pile up. Entries get removed with invalidate(), which also runs
+the hooks registered for that cache (e.g. to remove derived results from other
+caches).
+"""
+
+import collections
+import json
+import logging
+import time
+
+# Amount of misses per cache, that may still be waiting for their entry to get
+# stored (nested lookups, e.g. while resolving dependencies recursively)
+computing_max = 32
+
+
+def new_counters():
+    return {"hits": 0, "misses": 0, "invalidations": 0, "seconds": 0.0,
+            "computing": collections.OrderedDict()}
+
+
+def count_lookup(counters, key, found):
+    """
+    :param found: whether the key was in the cache
+    :returns: found
+    """
+    if found:
+        counters["hits"] += 1
+    else:
+        counters["misses"] += 1
+        computing = counters["computing"]
+        computing.pop(key, None)
+        computing[key] = time.perf_counter()
+        if len(computing) > computing_max:
+            computing.popitem(last=False)
+    return found
+
+
+def count_store(counters, key):
+    """ Add the time it took to compute a missing entry. """
+    start = counters["computing"].pop(key, None)
+    if start is not None:
+        counters["seconds"] += time.perf_counter() - start
+
+
+class Cache(dict):
+    """ dict with hit/miss counters for lookups """
+
+    def __init__(self, data=(), counters=None):
+        super().__init__(data)
+        self.counters = new_counters() if counters is None else counters
+
+    def __contains__(self, key):
+        return count_lookup(self.counters, key, super().__contains__(key))
+
+    def __setitem__(self, key, value):
+        count_store(self.counters, key)
+        super().__setitem__(key, value)
+
+    def get(self, key, default=None):
+        count_lookup(self.counters, key, super().__contains__(key))
+        return super().get(key, default)
+
+    def discard(self, key):
+        """ :returns: True if the key was in the cache, False otherwise """
+        if not super().__contains__(key):
+            return False
+        del self[key]
+        return True
+
+
+class CacheSet(set):
+    """ set with hit/miss counters for lookups """
+
+    def __init__(self, data=(), counters=None):
+        super().__init__(data)
+        self.counters = new_counters() if counters is None else counters
+
+    def __contains__(self, key):
+        return count_lookup(self.counters, key, super().__contains__(key))
+
+    def add(self, key):
+        count_store(self.counters, key)
+        super().add(key)
+
+    def discard(self, key):
+        """ :returns: True if the key was in the cache, False otherwise """
+        if not super().__contains__(key):
+            return False
+        super().discard(key)
+        return True
+
+
+class SessionCache(dict):
+    """
+    All named caches of the current session. Plain dicts and sets, that get
+    assigned (e.g. args.cache["apkbuild"] = {}), are converted to Cache and
+    CacheSet objects, the counters of the name are kept.
+    """
+
+    def __init__(self, caches):
+        super().__init__()
+        self.counters = {}
+        self.hooks = {}
+        for name, value in caches.items():
+            self[name] = value
+
+    def __setitem__(self, name, value):
+        if name not in self.counters:
+            self.counters[name] = new_counters()
+        if isinstance(value, dict):
+            value = Cache(value, self.counters[name])
+        elif isinstance(value, set):
+            value = CacheSet(value, self.counters[name])
+        super().__setitem__(name, value)
+
+    def add_hook(self, name, hook):
+        """
+        Run a function, whenever entries of a cache get invalidated.
+
+        :param hook: function with the key (or None) as parameter
+        """
+        self.hooks.setdefault(name, []).append(hook)
+
+    def invalidate(self, name, key=None):
+        """
+        Remove an entry from a cache and run its hooks.
+
+        :param key: the entry to remove, None removes all entries
+        :returns: True if anything was removed, False otherwise
+        """
+        cache = self[name]
+        computing = self.counters[name]["computing"]
+        if key is None:
+            ret = len(cache) > 0
+            cache.clear()
+            computing.clear()
+        else:
+            ret = cache.discard(key)
+            computing.pop(key, None)
+        self.counters[name]["invalidations"] += 1
+        for hook in self.hooks.get(name, []):
+            hook(key)
+        return ret
+
+    def stats(self):
+        """
+        :returns: copy of the counters of all caches, e.g.:
+                  {"apkbuild": {"hits": 10, "misses": 2, "invalidations": 0,
+                                "seconds": 0.015}, ...}
+                  seconds: time spent computing the missing entries
+        """
+        ret = {}
+        for name, counters in self.counters.items():
+            ret[name] = {key: value for key, value in counters.items()
+                         if key != "computing"}
+        return ret
+
+
+def log_stats(args):
+    """
+    Print the counters of the session cache ('pmbootstrap --profile-caches'),
+    and write them to the log as JSON.
+    """
+    stats = args.cache.stats()
+    logging.debug("Session cache stats: " + json.dumps(stats, sort_keys=True))
+
+    logging.info("Session cache (hits, misses, invalidations, time spent on"
+                 " misses):")
+    for name in sorted(stats, key=lambda name: (-stats[name]["seconds"],
+                                                name)):
+        counters = stats[name]
+        if not counters["hits"] and not counters["misses"]:
+            continue
+        logging.info("* {}: {} hits, {} misses, {} invalidations, {:.3f}s"
+                     "".format(name, counters["hits"], counters["misses"],
+                               counters["invalidations"],
+                               counters["seconds"]))
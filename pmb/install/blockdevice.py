@@ -41,6 +41,7 @@ def previous_install(args):
         label = pmb.chroot.root(args, ["blkid", "-s", "LABEL", "-o", "value",
                                        blockdevice_inside], output_return=True)
         pmb.helpers.run.root(args, ["umount", args.work + "/chroot_native" + blockdevice_inside])
+        pmb.helpers.mount.invalidate()
     return "pmOS_boot" in label
 
 
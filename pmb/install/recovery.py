@@ -76,5 +76,4 @@ def create_zip(args, suffix):
         # Compress with -1 for speed improvement
         ["gzip", "-f1", "rootfs.tar"],
         ["build-recovery-zip", args.device]]
-    for command in commands:
-        pmb.chroot.root(args, command, suffix, zip_root)
+    pmb.chroot.root_batch(args, commands, suffix, zip_root)
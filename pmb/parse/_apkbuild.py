@@ -16,11 +16,29 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
 import logging
 import pmb.config
+import pmb.helpers.disk_cache
 import pmb.parse.version
 
+# Minimum amount of APKBUILDs that need to be parsed in apkbuild_all(), before
+# multiple processes get used (starting them takes longer for few APKBUILDs)
+parallel_threshold = 64
+
+# Increase this number, whenever parse_attributes() changes, so APKBUILDs that
+# were parsed with the old code and stored in the disk cache get parsed again
+parser_version = 1
+
+# Hash of the attributes that get parsed, part of the disk cache validity as
+# well (calculated once, instead of for each APKBUILD)
+attributes_digest = hashlib.sha256(json.dumps(
+    pmb.config.apkbuild_attributes, sort_keys=True).encode("utf-8")).hexdigest()
+
 
 def replace_variables(apkbuild):
     """
@@ -122,25 +140,14 @@ def read_file(path):
     return lines
 
 
-def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
+def parse_attributes(path):
     """
-    Parse relevant information out of the APKBUILD file. This is not meant
-    to be perfect and catch every edge case (for that, a full shell parser
-    would be necessary!). Instead, it should just work with the use-cases
-    covered by pmbootstrap and not take too long.
-    Run 'pmbootstrap apkbuild_parse hello-world' for a full output example.
+    Parse the attributes from pmb.config.apkbuild_attributes out of an
+    APKBUILD file, without any sanity checks (see apkbuild()).
 
     :param path: full path to the APKBUILD
-    :param check_pkgver: verify that the pkgver is valid.
-    :param check_pkgname: the pkgname must match the name of the aport folder
-    :returns: relevant variables from the APKBUILD. Arrays get returned as
-              arrays.
+    :returns: relevant variables from the APKBUILD
     """
-    # Try to get a cached result first (we assume, that the aports don't change
-    # in one pmbootstrap call)
-    if path in args.cache["apkbuild"]:
-        return args.cache["apkbuild"][path]
-
     # Read the file and check line endings
     lines = read_file(path)
 
@@ -189,28 +196,80 @@ def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
     # Properly format values
     ret = replace_variables(ret)
     ret = cut_off_function_names(ret)
+    return ret
 
+
+def check(path, apkbuild, check_pkgver=True, check_pkgname=True):
+    """
+    Run the sanity checks of apkbuild() on a parsed APKBUILD and raise a
+    RuntimeError if one of them fails.
+
+    :param path: full path to the APKBUILD
+    :param apkbuild: the result of parse_attributes()
+    """
     # Sanity check: pkgname
-    suffix = "/" + ret["pkgname"] + "/APKBUILD"
+    suffix = "/" + apkbuild["pkgname"] + "/APKBUILD"
     if check_pkgname:
         if not os.path.realpath(path).endswith(suffix):
             logging.info("Folder: '" + os.path.dirname(path) + "'")
-            logging.info("Pkgname: '" + ret["pkgname"] + "'")
+            logging.info("Pkgname: '" + apkbuild["pkgname"] + "'")
             raise RuntimeError("The pkgname must be equal to the name of"
                                " the folder, that contains the APKBUILD!")
 
     # Sanity check: arch
-    if not len(ret["arch"]):
+    if not len(apkbuild["arch"]):
         raise RuntimeError("Arch must not be empty: " + path)
 
     # Sanity check: pkgver
     if check_pkgver:
-        if "-r" in ret["pkgver"] or not pmb.parse.version.validate(ret["pkgver"]):
+        if "-r" in apkbuild["pkgver"] or not pmb.parse.version.validate(apkbuild["pkgver"]):
             logging.info("NOTE: Valid pkgvers are described here:")
             logging.info("<https://wiki.alpinelinux.org/wiki/APKBUILD_Reference#pkgver>")
-            raise RuntimeError("Invalid pkgver '" + ret["pkgver"] +
+            raise RuntimeError("Invalid pkgver '" + apkbuild["pkgver"] +
                                "' in APKBUILD: " + path)
 
+
+def cache_validity(path):
+    """
+    Get the validity value of a parsed APKBUILD in the disk cache. Besides
+    the APKBUILD file, it covers parser_version and the attributes that get
+    parsed (attributes_digest).
+
+    :returns: (file_validity(), parser_version, attributes_digest)
+    """
+    return (pmb.helpers.disk_cache.file_validity(path), parser_version,
+            attributes_digest)
+
+
+def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
+    """
+    Parse relevant information out of the APKBUILD file. This is not meant
+    to be perfect and catch every edge case (for that, a full shell parser
+    would be necessary!). Instead, it should just work with the use-cases
+    covered by pmbootstrap and not take too long.
+    Run 'pmbootstrap apkbuild_parse hello-world' for a full output example.
+
+    :param path: full path to the APKBUILD
+    :param check_pkgver: verify that the pkgver is valid.
+    :param check_pkgname: the pkgname must match the name of the aport folder
+    :returns: relevant variables from the APKBUILD. Arrays get returned as
+              arrays.
+    """
+    # Try to get a cached result first (we assume, that the aports don't change
+    # in one pmbootstrap call)
+    if path in args.cache["apkbuild"]:
+        return args.cache["apkbuild"][path]
+
+    # Load the result of a previous pmbootstrap call from disk, if the APKBUILD
+    # did not change since then. The sanity checks below run in both cases.
+    validity = cache_validity(path)
+    ret = pmb.helpers.disk_cache.load(args, "apkbuild", path, validity)
+    if ret is None:
+        ret = parse_attributes(path)
+        pmb.helpers.disk_cache.save(args, "apkbuild", path, validity, ret)
+
+    check(path, ret, check_pkgver, check_pkgname)
+
     # Fill cache
     args.cache["apkbuild"][path] = ret
     return ret
@@ -281,3 +340,57 @@ def kernels(args, device):
     if ret:
         return ret
     return None
+
+
+def apkbuild_all(args, paths=None, check_pkgver=True, check_pkgname=True):
+    """
+    Parse many APKBUILDs at once and fill the same caches as apkbuild(). The
+    APKBUILDs, that are neither cached for the current session nor on disk,
+    get parsed with one process per CPU core if there are at least
+    parallel_threshold of them.
+
+    :param paths: list of full paths to the APKBUILDs (default: all APKBUILDs
+                  in args.aports)
+    :param check_pkgver: see apkbuild()
+    :param check_pkgname: see apkbuild()
+    :returns: dict of each path and the parsed APKBUILD, e.g.:
+              {"/home/user/code/pmbootstrap/aports/main/hello-world/APKBUILD":
+               {"pkgname": "hello-world", ...}, ...}
+    """
+    if paths is None:
+        paths = sorted(glob.glob(args.aports + "/*/*/APKBUILD"))
+
+    # Load what we can from the session and disk caches
+    ret = {}
+    validities = {}
+    missing = []
+    for path in paths:
+        if path in args.cache["apkbuild"]:
+            ret[path] = args.cache["apkbuild"][path]
+            continue
+        validities[path] = cache_validity(path)
+        ret[path] = pmb.helpers.disk_cache.load(args, "apkbuild", path,
+                                                validities[path])
+        if ret[path] is None:
+            missing.append(path)
+
+    # Parse the rest
+    processes = os.cpu_count() or 1
+    if len(missing) >= parallel_threshold and processes > 1:
+        logging.verbose("Parsing " + str(len(missing)) + " APKBUILDs with " +
+                        str(processes) + " processes")
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(parse_attributes, missing)
+    else:
+        results = map(parse_attributes, missing)
+    for path, result in zip(missing, results):
+        pmb.helpers.disk_cache.save(args, "apkbuild", path, validities[path],
+                                    result)
+        ret[path] = result
+
+    # Run the sanity checks and fill the session cache
+    for path in paths:
+        if path in validities:
+            check(path, ret[path], check_pkgver, check_pkgname)
+            args.cache["apkbuild"][path] = ret[path]
+    return ret
@@ -17,102 +17,239 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 import collections
+import contextlib
+import io
 import logging
 import os
+import re
+import sys
 import tarfile
 import pmb.chroot.apk
+import pmb.helpers.disk_cache
 import pmb.helpers.repo
 import pmb.parse.version
 
 
-def parse_next_block(args, path, lines, start):
+class Block:
+    """
+    One package of an APKINDEX, as returned by parse_next_block(). Blocks are
+    immutable and only store the keys we parse, because we keep tens of
+    thousands of them in memory (all indexes of all arches in one session).
+    Strings that appear in many blocks (pkgname, arch, origin, depends and
+    provides entries) are interned, so they are only stored once.
+
+    "depends" is stored as the raw line from the APKINDEX, and only gets split
+    up when it is accessed for the first time. Most lookups only need the
+    version or pkgname of a package.
+
+    For existing code, they can be accessed like a dictionary with the keys
+    from block_keys (block["version"], "timestamp" in block, ...). Missing
+    optional keys ("origin" and "timestamp" of virtual packages) behave like
+    missing dictionary keys.
+    """
+    __slots__ = ("arch", "_depends", "origin", "pkgname", "provides",
+                 "timestamp", "version")
+    fields = ("arch", "depends", "origin", "pkgname", "provides", "timestamp",
+              "version")
+
+    def __init__(self, arch, depends, origin, pkgname, provides, timestamp,
+                 version):
+        """
+        :param depends: tuple of pkgnames (and so:, cmd: etc. names), or the
+                        raw value of the "D:" line (gets split on access)
+        :param provides: tuple of pkgnames (and so:, cmd: etc. names)
+        :param origin: None for virtual packages
+        :param timestamp: None for virtual packages
+        """
+        set_attr = object.__setattr__
+        set_attr(self, "arch", sys.intern(arch))
+        set_attr(self, "_depends", depends)
+        set_attr(self, "origin", sys.intern(origin) if origin else None)
+        set_attr(self, "pkgname", sys.intern(pkgname))
+        set_attr(self, "provides", provides)
+        set_attr(self, "timestamp", timestamp)
+        set_attr(self, "version", version)
+
+    @property
+    def depends(self):
+        depends = self._depends
+        if isinstance(depends, str):
+            depends = split_depends(depends)
+            object.__setattr__(self, "_depends", depends)
+        return depends
+
+    def __setattr__(self, key, value):
+        raise AttributeError("APKINDEX blocks are immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError("APKINDEX blocks are immutable")
+
+    def __reduce__(self):
+        return (Block, tuple(getattr(self, key) for key in self.__slots__))
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in self.fields else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.fields and getattr(self, key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, Block):
+            return all(getattr(self, key) == getattr(other, key)
+                       for key in self.fields)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [key for key in self.fields if getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        """
+        :returns: a new dictionary in the format of parse_next_block()'s old
+                  return value, "depends" and "provides" are lists.
+        """
+        ret = {}
+        for key in self.keys():
+            value = getattr(self, key)
+            ret[key] = list(value) if isinstance(value, tuple) else value
+        return ret
+
+
+# Keys of an APKINDEX block, that we parse. The key's letter is the first
+# character of the line, followed by a colon (e.g. "P:musl").
+block_keys = {
+    "A": "arch",
+    "D": "depends",
+    "o": "origin",
+    "P": "pkgname",
+    "p": "provides",
+    "t": "timestamp",
+    "V": "version",
+}
+
+# Match the names in a "depends" or "provides" line, ignoring conflicts
+# ("!name") and everything from the first operator on ("name>=1.0" -> "name")
+depends_regex = re.compile("(?<![^ ])([^ !][^ <>=~]*)[^ ]*")
+
+
+def split_depends(value):
+    """
+    Split the value of a "depends" or "provides" line into names.
+
+    :param value: e.g. "so:libc.musl-x86_64.so.1 !conflict foo>=1.0"
+    :returns: tuple of interned names, e.g.
+              ("so:libc.musl-x86_64.so.1", "foo")
+    """
+    return tuple(map(sys.intern, depends_regex.findall(value)))
+
+
+def parse_next_block(args, path, lines):
     """
     Parse the next block in an APKINDEX.
 
     :param path: to the APKINDEX.tar.gz
-    :param start: current index in lines, gets increased in this
-                  function. Wrapped into a list, so it can be modified
-                  "by reference". Example: [5]
-    :param lines: all lines from the "APKINDEX" file inside the archive
-    :returns: a dictionary with the following structure:
+    :param lines: iterator over the lines of the "APKINDEX" file inside the
+                  archive (e.g. an opened file). It gets advanced to the first
+                  line after the block.
+    :returns: a Block (see above) with the following structure:
               { "arch": "noarch",
-                "depends": ["busybox-extras", "lddtree", ... ],
+                "depends": ("busybox-extras", "lddtree", ... ),
                 "origin": "postmarketos-mkinitfs",
                 "pkgname": "postmarketos-mkinitfs",
-                "provides": ["mkinitfs=0.0.1"],
+                "provides": ("mkinitfs", ),
                 "timestamp": "1500000000",
                 "version": "0.0.4-r10" }
-              NOTE: "depends" is not set for packages without any dependencies,
+              NOTE: "depends" is empty for packages without any dependencies,
                     e.g. musl.
               NOTE: "timestamp" and "origin" are not set for virtual packages
                     (#1273). We use that information to skip these virtual
                     packages in parse().
     :returns: None, when there are no more blocks
     """
-
     # Parse until we hit an empty line or end of file
     ret = {}
-    mapping = {
-        "A": "arch",
-        "D": "depends",
-        "o": "origin",
-        "P": "pkgname",
-        "p": "provides",
-        "t": "timestamp",
-        "V": "version",
-    }
-    end_of_block_found = False
-    for i in range(start[0], len(lines)):
-        # Check for empty line
-        start[0] = i + 1
-        line = lines[i]
-        if not isinstance(line, str):
-            line = line.decode()
+    for line in lines:
         if line == "\n":
-            end_of_block_found = True
             break
 
-        # Parse keys from the mapping
-        for letter, key in mapping.items():
-            if line.startswith(letter + ":"):
-                if key in ret:
-                    raise RuntimeError(
-                        "Key " + key + " (" + letter + ":) specified twice"
-                        " in block: " + str(ret) + ", file: " + path)
-                ret[key] = line[2:-1]
-
-    # Format and return the block
-    if end_of_block_found:
-        # Check for required keys
-        for key in ["arch", "pkgname", "version"]:
-            if key not in ret:
-                raise RuntimeError("Missing required key '" + key +
-                                   "' in block " + str(ret) + ", file: " + path)
-
-        # Format optional lists
-        for key in ["provides", "depends"]:
-            if key in ret and ret[key] != "":
-                # Ignore all operators for now
-                values = ret[key].split(" ")
-                ret[key] = []
-                for value in values:
-                    if value.startswith("!"):
-                        continue
-                    for operator in [">", "=", "<", "~"]:
-                        if operator in value:
-                            value = value.split(operator)[0]
-                            break
-                    ret[key].append(value)
-            else:
-                ret[key] = []
-        return ret
+        # Parse keys from block_keys, dispatched on the first character
+        if line[1:2] != ":":
+            continue
+        key = block_keys.get(line[0])
+        if not key:
+            continue
+        if key in ret:
+            raise RuntimeError("Key " + key + " (" + line[0] + ":) specified"
+                               " twice in block: " + str(ret) + ", file: " +
+                               path)
+        ret[key] = line[2:-1]
 
     # No more blocks
-    elif ret != {}:
-        raise RuntimeError("Last block in " + path + " does not end"
-                           " with a new line! Delete the file and"
-                           " try again. Last block: " + str(ret))
-    return None
+    else:
+        if ret != {}:
+            raise RuntimeError("Last block in " + path + " does not end"
+                               " with a new line! Delete the file and"
+                               " try again. Last block: " + str(ret))
+        return None
+
+    # Check for required keys
+    for key in ["arch", "pkgname", "version"]:
+        if key not in ret:
+            raise RuntimeError("Missing required key '" + key +
+                               "' in block " + str(ret) + ", file: " + path)
+
+    # Format optional lists (ignore all operators for now). Provides are
+    # needed right away for the aliases in parse(), depends are split lazily.
+    provides = split_depends(ret["provides"]) if "provides" in ret else ()
+    return Block(ret["arch"], ret.get("depends", ()), ret.get("origin"),
+                 ret["pkgname"], provides, ret.get("timestamp"),
+                 ret["version"])
+
+
+def read_blocks(args, path, is_tar=None):
+    """
+    Read the blocks of an APKINDEX one by one, without loading the whole file
+    into memory.
+
+    :param path: path to an APKINDEX.tar.gz file or apk package database
+                 (almost the same format, but not compressed).
+    :param is_tar: set to True or False if already known, to avoid checking
+                   the file type again
+    :returns: generator of blocks (return values of parse_next_block())
+    """
+    if is_tar is None:
+        is_tar = tarfile.is_tarfile(path)
+
+    with contextlib.ExitStack() as stack:
+        if is_tar:
+            tar = stack.enter_context(tarfile.open(path, "r:gz"))
+            handle = stack.enter_context(tar.extractfile(
+                tar.getmember("APKINDEX")))
+            lines = io.TextIOWrapper(handle, encoding="utf-8")
+        else:
+            lines = stack.enter_context(open(path, "r", encoding="utf-8"))
+
+        while True:
+            block = parse_next_block(args, path, lines)
+            if not block:
+                return
+            yield block
 
 
 def parse_add_block(ret, block, alias=None, multiple_providers=True):
@@ -202,23 +339,21 @@ def parse(args, path, multiple_providers=True):
         else:
             clear_cache(args, path)
 
-    # Read all lines
-    if tarfile.is_tarfile(path):
-        with tarfile.open(path, "r:gz") as tar:
-            with tar.extractfile(tar.getmember("APKINDEX")) as handle:
-                lines = handle.readlines()
-    else:
-        with open(path, "r", encoding="utf-8") as handle:
-            lines = handle.readlines()
+    # Try to get a cached result from a previous session (the installed
+    # packages database of a chroot changes too often to be worth it)
+    is_tar = tarfile.is_tarfile(path)
+    disk_cache_key = cache_key + ":" + path
+    if is_tar:
+        validity = pmb.helpers.disk_cache.file_validity(path)
+        ret = pmb.helpers.disk_cache.load(args, "apkindex", disk_cache_key,
+                                          validity)
+        if ret is not None:
+            parse_cache_update(args, path, lastmod, cache_key, ret)
+            return ret
 
     # Parse the whole APKINDEX file
     ret = collections.OrderedDict()
-    start = [0]
-    while True:
-        block = parse_next_block(args, path, lines, start)
-        if not block:
-            break
-
+    for block in read_blocks(args, path, is_tar):
         # Skip virtual packages
         if "timestamp" not in block:
             logging.verbose("Skipped virtual package " + str(block) + " in"
@@ -231,11 +366,24 @@ def parse(args, path, multiple_providers=True):
             for alias in block["provides"]:
                 parse_add_block(ret, block, alias, multiple_providers)
 
-    # Update the cache
+    # Update the caches
+    parse_cache_update(args, path, lastmod, cache_key, ret)
+    if is_tar:
+        pmb.helpers.disk_cache.save(args, "apkindex", disk_cache_key, validity,
+                                    ret)
+    return ret
+
+
+def parse_cache_update(args, path, lastmod, cache_key, ret):
+    """
+    Store the result of parse() in the cache for the current session.
+
+    :param lastmod: last modified time of the parsed file
+    :param cache_key: "multiple" or "single" (see parse())
+    """
     if path not in args.cache["apkindex"]:
         args.cache["apkindex"][path] = {"lastmod": lastmod}
     args.cache["apkindex"][path][cache_key] = ret
-    return ret
 
 
 def parse_blocks(args, path):
@@ -250,30 +398,21 @@ def parse_blocks(args, path):
 
     NOTE: "block" is the return value from parse_next_block() above.
     """
-    # Parse all lines
-    with tarfile.open(path, "r:gz") as tar:
-        with tar.extractfile(tar.getmember("APKINDEX")) as handle:
-            lines = handle.readlines()
-
-    # Parse lines into blocks
-    ret = []
-    start = [0]
-    while True:
-        block = pmb.parse.apkindex.parse_next_block(args, path, lines, start)
-        if not block:
-            return ret
-        ret.append(block)
+    return list(read_blocks(args, path))
 
 
 def clear_cache(args, path):
     """
-    Clear the APKINDEX parsing cache.
+    Clear the APKINDEX parsing cache of the current session and the one
+    stored on disk.
 
-    :returns: True on successful deletion, False otherwise
+    :returns: True on successful deletion from the session cache,
+              False otherwise
     """
     logging.verbose("Clear APKINDEX cache for: " + path)
-    if path in args.cache["apkindex"]:
-        del args.cache["apkindex"][path]
+    for cache_key in ["multiple", "single"]:
+        pmb.helpers.disk_cache.delete(args, "apkindex", cache_key + ":" + path)
+    if args.cache.invalidate("apkindex", path):
         return True
     else:
         logging.verbose("Nothing to do, path was not in cache:" +
@@ -281,6 +420,95 @@ def clear_cache(args, path):
         return False
 
 
+def providers_index_validity(indexes):
+    """
+    Get a value that changes whenever one of the indexes gets modified.
+
+    :param indexes: list of APKINDEX.tar.gz paths
+    :returns: tuple of pmb.helpers.disk_cache.file_validity() results, with
+              None for indexes that don't exist
+    """
+    ret = []
+    for path in indexes:
+        if os.path.isfile(path):
+            ret.append(pmb.helpers.disk_cache.file_validity(path))
+        else:
+            ret.append(None)
+    return tuple(ret)
+
+
+def providers_index(args, indexes):
+    """
+    Merge the aliases of multiple APKINDEX files into one dictionary, keeping
+    only the highest version of each provider. The result is cached for the
+    current session (until clear_cache() is called for one of the indexes)
+    and on disk. Both caches are only used until one of the indexes gets
+    modified.
+
+    :param indexes: list of APKINDEX.tar.gz paths
+    :returns: { provide: { pkgname: block, ... }, ... }
+              (same format as parse() with multiple_providers)
+    """
+    # Try to get a cached result first
+    cache_key = tuple(indexes)
+    validity = providers_index_validity(indexes)
+    if cache_key in args.cache["apkindex_providers"]:
+        validity_cached, ret = args.cache["apkindex_providers"][cache_key]
+        if validity_cached == validity:
+            return ret
+    disk_cache_key = "providers:" + "\n".join(indexes)
+
+    # Nothing worth storing on disk, when none of the indexes exist
+    use_disk_cache = validity.count(None) != len(validity)
+    ret = None
+    if use_disk_cache:
+        ret = pmb.helpers.disk_cache.load(args, "apkindex", disk_cache_key,
+                                          validity)
+
+    # Merge all indexes
+    if ret is None:
+        ret = {}
+        for path in indexes:
+            for provide, index_providers in parse(args, path).items():
+                if provide not in ret:
+                    ret[provide] = collections.OrderedDict()
+                merged = ret[provide]
+                for provider_pkgname, provider in index_providers.items():
+                    # Skip lower versions of providers we already found
+                    if provider_pkgname in merged:
+                        version = provider["version"]
+                        version_last = merged[provider_pkgname]["version"]
+                        if pmb.parse.version.compare(version,
+                                                     version_last) == -1:
+                            continue
+                    merged[provider_pkgname] = provider
+        if use_disk_cache:
+            pmb.helpers.disk_cache.save(args, "apkindex", disk_cache_key,
+                                        validity, ret)
+
+    args.cache["apkindex_providers"][cache_key] = (validity, ret)
+    return ret
+
+
+def providers_index_path(args, indexes, package, provider):
+    """
+    Find the APKINDEX, that a provider from providers_index() came from.
+
+    :param indexes: list of APKINDEX.tar.gz paths
+    :param package: name of the package, that gets provided
+    :param provider: block of the provider
+    :returns: path of the first index with the provider in the same version,
+              or None
+    """
+    for path in indexes:
+        index_provider = parse(args, path).get(package, {}).get(
+            provider["pkgname"])
+        if index_provider and index_provider["version"] == \
+                provider["version"]:
+            return path
+    return None
+
+
 def providers(args, package, arch=None, must_exist=True, indexes=None):
     """
     Get all packages, which provide one package.
@@ -306,29 +534,17 @@ def providers(args, package, arch=None, must_exist=True, indexes=None):
             break
 
     ret = collections.OrderedDict()
-    for path in indexes:
-        # Skip indexes not providing the package
-        index_packages = parse(args, path)
-        if package not in index_packages:
-            continue
-
-        # Iterate over found providers
-        for provider_pkgname, provider in index_packages[package].items():
-            # Skip lower versions of providers we already found
-            version = provider["version"]
-            if provider_pkgname in ret:
-                version_last = ret[provider_pkgname]["version"]
-                if pmb.parse.version.compare(version, version_last) == -1:
-                    logging.verbose(package + ": provided by: " +
-                                    provider_pkgname + "-" + version + " in " +
-                                    path + " (but " + version_last + " is"
-                                    " higher)")
-                    continue
-
-            # Add the provier to ret
-            logging.verbose(package + ": provided by: " + provider_pkgname +
-                            "-" + version + " in " + path)
-            ret[provider_pkgname] = provider
+    index = providers_index(args, indexes)
+    if package in index:
+        ret.update(index[package])
+        # Finding the index of each provider requires parsing the indexes
+        # again, only do it when it gets logged
+        if args.verbose:
+            for provider_pkgname, provider in ret.items():
+                path = providers_index_path(args, indexes, package, provider)
+                logging.verbose(package + ": provided by: " +
+                                provider_pkgname + "-" + provider["version"] +
+                                " in " + str(path))
 
     if ret == {} and must_exist:
         logging.debug("Searched in APKINDEX files: " + ", ".join(indexes))
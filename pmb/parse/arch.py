@@ -39,6 +39,10 @@ def alpine_native():
 
 
 def from_chroot_suffix(args, suffix):
+    # Clones of build chroots for parallel builds (e.g. "native-2")
+    if suffix.startswith("native-") or suffix.startswith("buildroot_"):
+        suffix = suffix.split("-", 1)[0]
+
     if suffix == "native":
         return args.arch_native
     if suffix == "rootfs_" + args.device:
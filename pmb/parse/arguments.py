@@ -260,6 +260,21 @@ def arguments_repo_missing(subparser):
     return ret
 
 
+def arguments_rdepends(subparser):
+    ret = subparser.add_parser("rdepends", help="list the pmaports, that"
+                               " depend on a package (e.g. to find out what"
+                               " needs to be rebuilt after changing it)")
+    package = ret.add_argument("package", help="package, subpackage or"
+                               " provides name (e.g. 'so:libGL.so.1')")
+    if argcomplete:
+        package.completer = package_completer
+    ret.add_argument("--arch", choices=pmb.config.build_device_architectures,
+                     default=pmb.parse.arch.alpine_native())
+    ret.add_argument("--direct", action="store_true",
+                     help="only list packages, that depend on it directly")
+    return ret
+
+
 def package_completer(prefix, action, parser, parsed_args):
     args = parsed_args
     pmb.config.merge_with_args(args)
@@ -350,6 +365,19 @@ def arguments():
                         " logfiles (this may reduce performance)")
     parser.add_argument("-q", "--quiet", dest="quiet",
                         action="store_true", help="do not output any log messages")
+    parser.add_argument("--profile-caches", dest="profile_caches",
+                        action="store_true", help="print hits, misses and the"
+                        " time spent on misses of each cache of the session"
+                        " at the end (also written to the log as JSON)")
+    parser.add_argument("--root-helper", dest="root_helper",
+                        action="store_true", help="start one process with"
+                        " sudo, which runs all commands as root (instead of"
+                        " running sudo for each command)")
+    parser.add_argument("--no-chroot-template", dest="no_chroot_template",
+                        action="store_true", help="always install the"
+                        " packages of new build chroots, instead of extracting"
+                        " them from the template in"
+                        " $WORK/cache_chroot_template")
 
     # Actions
     sub = parser.add_subparsers(title="action", dest="action")
@@ -361,6 +389,7 @@ def arguments():
                                         " non-interactively to migrate the"
                                         " work folder version on demand")
     arguments_repo_missing(sub)
+    arguments_rdepends(sub)
     arguments_kconfig(sub)
     arguments_export(sub)
     arguments_flasher(sub)
@@ -389,6 +418,10 @@ def arguments():
                      " cache")
     zap.add_argument("-d", "--distfiles", action="store_true", help="also delete"
                      " downloaded source tarballs")
+    zap.add_argument("-b", "--build-cache", action="store_true",
+                     dest="build_cache",
+                     help="also delete the apk files of previous builds in"
+                     " the build cache")
     zap.add_argument("-p", "--pkgs-local", action="store_true",
                      dest="pkgs_local",
                      help="also delete *all* locally compiled packages")
@@ -490,6 +523,11 @@ def arguments():
                        " necessary")
     build.add_argument("--strict", action="store_true", help="(slower) zap and install only"
                        " required depends when building, to detect dependency errors")
+    build.add_argument("--overlay", action="store_true",
+                       dest="strict_overlay", help="(with --strict) instead"
+                       " of zapping all chroots, build each package in a"
+                       " disposable overlayfs over a pristine build chroot,"
+                       " and remove the overlay after the build")
     build.add_argument("--src", help="override source used to build the"
                        " package with a local folder (the APKBUILD must"
                        " expect the source to be in $builddir, so you might"
@@ -505,6 +543,21 @@ def arguments():
     build.add_argument("-n", "--no-depends", action="store_true",
                        help="never build dependencies, abort instead",
                        dest="no_depends")
+    build.add_argument("--dry-run", action="store_true",
+                       help="only print the build plan (levels of packages"
+                       " that can be built after each other, critical path"
+                       " and estimated duration), don't build anything",
+                       dest="dry_run")
+    build.add_argument("--no-build-cache", action="store_true",
+                       help="don't restore the packages from the build cache"
+                       " in $WORK/cache_build, even if the aport and the"
+                       " versions of its dependencies did not change since"
+                       " the last build", dest="no_build_cache")
+    build.add_argument("--parallel", type=int, default=1, metavar="N",
+                       help="build up to N packages, that don't depend on"
+                       " each other, at the same time (each in its own"
+                       " clone of the build chroot, with its own log file"
+                       " in $WORK/log_build/)")
     build.add_argument("--envkernel", action="store_true",
                        help="Create an apk package from the build output of"
                        " a kernel compiled with envkernel.sh.")
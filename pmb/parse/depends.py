@@ -16,10 +16,14 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
+import collections
 import logging
+import os
 import pmb.chroot
 import pmb.chroot.apk
+import pmb.helpers.disk_cache
 import pmb.helpers.pmaports
+import pmb.helpers.repo
 import pmb.parse.apkindex
 import pmb.parse.arch
 
@@ -47,9 +51,13 @@ def package_from_aports(args, pkgname_depend):
             "version": version}
 
 
-def package_provider(args, pkgname, pkgnames_install, suffix="native"):
+def package_provider(args, pkgname, pkgnames_install, suffix="native",
+                     installed_used=None):
     """
     :param pkgnames_install: packages to be installed
+    :param installed_used: list, that pkgname gets appended to when the
+                           packages installed in the chroot are needed to
+                           pick a provider
     :returns: a block from the apkindex: {"pkgname": "...", ...}
               or None (no provider found)
     """
@@ -81,6 +89,8 @@ def package_provider(args, pkgname, pkgnames_install, suffix="native"):
             return provider
 
     # 4. Pick a package that is already installed
+    if installed_used is not None:
+        installed_used.append(pkgname)
     installed = pmb.chroot.apk.installed(args, suffix)
     for provider_pkgname, provider in providers.items():
         if provider_pkgname in installed:
@@ -97,14 +107,16 @@ def package_provider(args, pkgname, pkgnames_install, suffix="native"):
 
 
 def package_from_index(args, pkgname_depend, pkgnames_install, package_aport,
-                       suffix="native"):
+                       suffix="native", installed_used=None):
     """
+    :param installed_used: see package_provider()
     :returns: None when there is no aport and no binary package, or a dict with
               the keys pkgname, depends, version from either the aport or the
               binary package provider.
     """
     # No binary package
-    provider = package_provider(args, pkgname_depend, pkgnames_install, suffix)
+    provider = package_provider(args, pkgname_depend, pkgnames_install, suffix,
+                                installed_used)
     if not provider:
         return package_aport
 
@@ -122,33 +134,41 @@ def package_from_index(args, pkgname_depend, pkgnames_install, package_aport,
     return provider
 
 
-def recurse(args, pkgnames, suffix="native"):
+def recurse(args, pkgnames, suffix="native", installed_used=None):
     """
     Find all dependencies of the given pkgnames.
 
     :param suffix: the chroot suffix to resolve dependencies for. If a package
                    has multiple providers, we look at the installed packages in
                    the chroot to make a decision (see package_provider()).
+    :param installed_used: see package_provider()
     :returns: list of pkgnames: consists of the initial pkgnames plus all
               depends
     """
     logging.debug("(" + suffix + ") calculate depends of " +
                   ", ".join(pkgnames) + " (pmbootstrap -v for details)")
 
-    # Iterate over todo-list until is is empty
-    todo = list(pkgnames)
+    # Iterate over todo-list until is is empty. The packages in ret and todo
+    # will be installed, keep them in a set for fast lookups (the counter
+    # tracks duplicates in todo, so we know when to remove one from the set).
+    todo = collections.deque(pkgnames)
+    todo_count = collections.Counter(pkgnames)
     ret = []
+    ret_set = set()
+    pkgnames_install = set(pkgnames)
     while len(todo):
         # Skip already passed entries
-        pkgname_depend = todo.pop(0)
-        if pkgname_depend in ret:
+        pkgname_depend = todo.popleft()
+        todo_count[pkgname_depend] -= 1
+        if not todo_count[pkgname_depend] and pkgname_depend not in ret_set:
+            pkgnames_install.discard(pkgname_depend)
+        if pkgname_depend in ret_set:
             continue
 
         # Get depends and pkgname from aports
-        pkgnames_install = list(ret) + todo
         package = package_from_aports(args, pkgname_depend)
         package = package_from_index(args, pkgname_depend, pkgnames_install,
-                                     package, suffix)
+                                     package, suffix, installed_used)
 
         # Nothing found
         if not package:
@@ -158,12 +178,71 @@ def recurse(args, pkgnames, suffix="native"):
 
         # Append to todo/ret (unless it is a duplicate)
         pkgname = package["pkgname"]
-        if pkgname in ret:
+        if pkgname in ret_set:
             logging.verbose(pkgname + ": already found")
         else:
             depends = package["depends"]
             logging.verbose(pkgname + ": depends on: " + ",".join(depends))
             if depends:
-                todo += depends
+                todo.extend(depends)
+                todo_count.update(depends)
+                pkgnames_install.update(depends)
             ret.append(pkgname)
+            ret_set.add(pkgname)
+            pkgnames_install.add(pkgname)
+    return ret
+
+
+def recurse_validity(args, suffix="native"):
+    """
+    Get a value for the disk cache of recurse_cached(), that changes when the
+    APKINDEX files or the APKBUILDs in pmaports change. The packages
+    installed in the chroot are only relevant for some results, see
+    recurse_cached().
+    """
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    ret = []
+    for path in pmb.helpers.repo.apkindex_files(args, arch):
+        if os.path.exists(path):
+            ret.append((path,) + pmb.helpers.disk_cache.file_validity(path))
+        else:
+            ret.append((path, None))
+    return (tuple(ret), pmb.helpers.pmaports.subpackages_index_validity(args))
+
+
+def installed_validity(args, suffix="native"):
+    """ :returns: validity of the installed packages database of a chroot """
+    path = args.work + "/chroot_" + suffix + "/lib/apk/db/installed"
+    if not os.path.exists(path):
+        return None
+    return pmb.helpers.disk_cache.file_validity(path)
+
+
+def recurse_cached(args, pkgnames, suffix="native"):
+    """
+    Same as recurse(), but the result gets stored on disk and is reused by the
+    next pmbootstrap call, unless one of the inputs changed in the meantime
+    (see recurse_validity()). When a provider was picked by looking at the
+    installed packages, the result also gets resolved again after the
+    installed packages of the chroot changed (stored next to the result,
+    False if they were not needed).
+    """
+    key = "\n".join([args.aports, suffix] + list(pkgnames))
+    validity = recurse_validity(args, suffix)
+    cached = pmb.helpers.disk_cache.load(args, "depends", key, validity)
+    if cached is not None:
+        ret, installed = cached
+        if installed is False or installed == installed_validity(args,
+                                                                 suffix):
+            logging.debug("(" + suffix + ") depends of " +
+                          ", ".join(pkgnames) + ": unchanged since last time")
+            return ret
+
+    installed_used = []
+    ret = recurse(args, pkgnames, suffix, installed_used)
+    installed = False
+    if installed_used:
+        installed = installed_validity(args, suffix)
+    pmb.helpers.disk_cache.save(args, "depends", key, validity,
+                                (ret, installed))
     return ret
@@ -17,6 +17,7 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 import collections
+import functools
 
 """
 In order to stay as compatible to Alpine's apk as possible, this code
@@ -25,6 +26,9 @@ is heavily based on:
 https://git.alpinelinux.org/cgit/apk-tools/tree/src/version.c
 """
 
+# Maximum amount of version strings to keep in the tokens() and key() caches
+cache_size = 65536
+
 
 def token_value(string):
     """
@@ -51,6 +55,13 @@ def token_value(string):
     return order[string]
 
 
+# Token values used by tokens(), key() and compare()
+token_invalid = token_value("invalid")
+token_suffix = token_value("suffix")
+token_suffix_no = token_value("suffix_no")
+token_end = token_value("end")
+
+
 def next_token(previous, rest):
     """
     Parse the next token in the rest of the version string, we're
@@ -219,6 +230,69 @@ def validate(version):
     return True
 
 
+@functools.lru_cache(maxsize=cache_size)
+def tokens(version):
+    """
+    Parse a version string into all of its tokens, as the compare loop in
+    apk-tools would see them. The result is cached (LRU), so every version
+    string only gets parsed once.
+
+    :param version: full version string
+    :returns: tuple of (next, value) pairs, as returned by get_token(). next
+              is converted with token_value(), letters stay strings. The last
+              pair has the "end" or "invalid" token.
+    """
+    ret = []
+    current = "digit"
+    rest = version
+    while current not in ["end", "invalid"]:
+        (current, value, rest) = get_token(current, rest)
+        ret.append((token_value(current), value))
+    return tuple(ret)
+
+
+@functools.lru_cache(maxsize=cache_size)
+def key(version):
+    """
+    Get a sort key for a version string, so versions can be sorted and
+    compared without tokenizing them again (e.g. sorted(versions, key=key)).
+    The result is cached (LRU).
+
+    Each token adds its value and a rank to the key. The rank orders
+    different token types at the same position just like compare() does it
+    (e.g. "1" < "1.1" and "1_alpha" < "1"). The key stops at the "end" or
+    "invalid" token.
+
+    NOTE: compare() is not a strict weak ordering for a few unusual versions,
+          so no key can match it in every case. E.g. post-release suffixes
+          without a number and followed by another token type ("1_p" ==
+          "1"). The key treats all suffixes >= 0 like the common case, where
+          a number follows ("1_p" > "1"). Use compare(), sort() or
+          highest() if you need apk's exact result for such versions.
+
+    :param version: full version string
+    :returns: tuple of integers
+    """
+    ret = []
+    version_tokens = tokens(version)
+    for i, (next, value) in enumerate(version_tokens):
+        # Letters are compared by their character, ints work the same
+        ret.append(ord(value) if isinstance(value, str) else value)
+
+        if next == token_end or next == token_invalid:
+            ret.append(-next)
+            break
+        elif next == token_suffix:
+            # Pre-release suffixes ("alpha", ...) are lower than anything else
+            if version_tokens[i + 1][1] < 0:
+                ret.append(-(token_end + 1))
+            else:
+                ret.append(-token_suffix_no)
+        else:
+            ret.append(-next)
+    return tuple(ret)
+
+
 def compare(a_version, b_version, fuzzy=False):
     """
     Compare two versions A and B to find out which one is higher, or if
@@ -236,21 +310,19 @@ def compare(a_version, b_version, fuzzy=False):
 
     C equivalent: apk_version_compare_blob_fuzzy()
     """
+    a_tokens = tokens(a_version)
+    b_tokens = tokens(b_version)
 
-    # Defaults
-    a_token = "digit"
-    b_token = "digit"
-    a_value = 0
-    b_value = 0
-    a_rest = a_version
-    b_rest = b_version
-
-    # Parse A and B one token at a time, until one string ends, or the
+    # Walk through A and B one token at a time, until one string ends, or the
     # current token has a different type/value
-    while (a_token == b_token and a_token not in ["end", "invalid"] and
-           a_value == b_value):
-        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
-        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    i = 0
+    while True:
+        (a_token, a_value) = a_tokens[i]
+        (b_token, b_value) = b_tokens[i]
+        if (a_token != b_token or a_value != b_value or
+                a_token == token_end or a_token == token_invalid):
+            break
+        i += 1
 
     # Compare the values inside the last tokens
     if a_value < b_value:
@@ -266,21 +338,58 @@ def compare(a_version, b_version, fuzzy=False):
     # Leading version components and their values are equal, now the
     # non-terminating version is greater unless it's a suffix
     # indicating pre-release
-    if a_token == "suffix":
-        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+    if a_token == token_suffix:
+        (a_token, a_value) = a_tokens[i + 1]
         if a_value < 0:
             return -1
-    if b_token == "suffix":
-        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    if b_token == token_suffix:
+        (b_token, b_value) = b_tokens[i + 1]
         if b_value < 0:
             return 1
 
     # Compare the token value (e.g. digit < letter)
-    if token_value(a_token) > token_value(b_token):
+    if a_token > b_token:
         return -1
-    if token_value(a_token) < token_value(b_token):
+    if a_token < b_token:
         return 1
 
     # The tokens are not the same, but previous checks revealed that it
     # is equal anyway (e.g. "1.0" == "1").
     return 0
+
+
+def sort(versions, reverse=False):
+    """
+    Sort version strings from lowest to highest with compare(), so the order
+    is the same as apk's (key() differs for a few unusual versions). Equal
+    versions keep their order.
+
+    :param versions: list of full version strings
+    :param reverse: sort from highest to lowest instead
+    :returns: new sorted list
+    """
+    return sorted(versions, key=functools.cmp_to_key(compare),
+                  reverse=reverse)
+
+
+def highest(items, get_version=None):
+    """
+    Pick the item with the highest version with compare(), going through the
+    items once. When multiple items have the highest version, the last one
+    wins (like when replacing the current item while iterating, unless it
+    has a higher version).
+
+    :param items: list of version strings, or of other objects when
+                  get_version is set
+    :param get_version: function that returns the version string of an item,
+                        e.g. lambda block: block["version"]
+    :returns: the item with the highest version, None if items is empty
+    """
+    ret = None
+    ret_version = None
+    for item in items:
+        version = get_version(item) if get_version else item
+        if ret is None or compare(ret_version, version) != 1:
+            ret = item
+            ret_version = version
+    return ret
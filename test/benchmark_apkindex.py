@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Measure how long parsing APKINDEX files takes and how much memory it needs.
+Uses the files from test/testdata/apkindex and a large synthetic index, that
+has roughly the size of Alpine's main + community + testing repositories.
+
+usage: benchmark_apkindex.py [number of packages in the synthetic index]
+"""
+
+import os
+import random
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.config
+import pmb.helpers.logging
+import pmb.parse
+import pmb.parse.apkindex
+
+
+def get_args(work):
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = os.devnull
+    pmb.helpers.logging.init(args)
+
+    # Point the work folder to a non-existing path, so the results don't get
+    # stored in (or loaded from) the persistent cache
+    args.work = work + "/does-not-exist"
+    return args
+
+
+def write_apkindex(path, content):
+    """ Write content as "APKINDEX" file into a new APKINDEX.tar.gz """
+    path_plain = path + ".plain"
+    with open(path_plain, "w", encoding="utf-8") as handle:
+        handle.write(content)
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(path_plain, "APKINDEX")
+    os.remove(path_plain)
+
+
+def synthetic_apkindex(count):
+    """ Generate an APKINDEX with a realistic mix of keys """
+    rand = random.Random(1)
+    pkgnames = ["pkg" + str(i) for i in range(count)]
+    ret = []
+    for i, pkgname in enumerate(pkgnames):
+        depends = rand.sample(pkgnames, rand.randint(0, 8))
+        depends += ["so:lib" + str(rand.randint(0, count)) + ".so.1"]
+        depends += ["!" + pkgname + "-conflict"]
+        provides = ["so:lib" + str(i) + ".so.1=1.2.3",
+                    "cmd:" + pkgname + "=" + str(i) + ".0-r0"]
+        ret += ["C:Q1gKkFdQUwKAmcUpGY8VaErq0uHNo=",
+                "P:" + pkgname,
+                "V:" + str(i % 50) + "." + str(i % 7) + "-r" + str(i % 3),
+                "A:x86_64",
+                "S:357094",
+                "I:581632",
+                "T:description of " + pkgname,
+                "U:https://postmarketos.org",
+                "L:MIT",
+                "o:" + pkgname,
+                "m:Some Maintainer <some@example.org>",
+                "t:1515217616",
+                "c:6cc1d4e6ac35607dd09003e4d013a0d9c4800c49",
+                "D:" + " ".join(depends),
+                "p:" + " ".join(provides),
+                ""]
+    return "\n".join(ret) + "\n"
+
+
+def measure(args, func, path, repeat=3):
+    """ :returns: (best time in seconds, peak memory in bytes, memory in bytes
+                   retained by the result) """
+    times = []
+    for i in range(repeat):
+        args.cache["apkindex"] = {}
+        start = time.perf_counter()
+        func(args, path)
+        times.append(time.perf_counter() - start)
+
+    args.cache["apkindex"] = {}
+    tracemalloc.start()
+    result = func(args, path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return (min(times), peak, retained)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as work:
+        args = get_args(work)
+
+        # Test data (repeated, so it takes long enough to be measured) and
+        # synthetic index
+        paths = {}
+        testdata = pmb.config.pmb_src + "/test/testdata/apkindex/no_error"
+        with open(testdata, encoding="utf-8") as handle:
+            paths["testdata (x1000)"] = handle.read() * 1000
+        paths["synthetic (" + str(count) + " packages)"] = \
+            synthetic_apkindex(count)
+        for name, content in paths.items():
+            paths[name] = work + "/APKINDEX." + str(len(paths[name])) + \
+                ".tar.gz"
+            write_apkindex(paths[name], content)
+
+        # Run the benchmark
+        funcs = {"parse_blocks": pmb.parse.apkindex.parse_blocks,
+                 "parse": pmb.parse.apkindex.parse}
+        for name, path in paths.items():
+            for func_name, func in funcs.items():
+                duration, peak, retained = measure(args, func, path)
+                print("{:<30} {:<14} {:>8.3f} s {:>8.1f} MiB peak {:>8.1f}"
+                      " MiB retained".format(name, func_name, duration,
+                                             peak / 1024 / 1024,
+                                             retained / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Measure how long pmb.parse.depends.recurse() takes to resolve the
+postmarketos-ui-* meta packages. The packages come from a synthetic APKINDEX
+(with so: and virtual providers like in Alpine's repositories), the pmaports
+folder is empty and the chroots are assumed to have nothing installed.
+
+usage: benchmark_depends.py [number of packages in the synthetic index]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.chroot.apk
+import pmb.helpers.args
+import pmb.helpers.repo
+import pmb.parse.depends
+from benchmark_apkindex import get_args, write_apkindex
+
+uis = ["hildon", "i3wm", "mate", "phosh", "plasma-mobile", "sxmo", "weston",
+       "xfce4"]
+
+
+def synthetic_apkindex(count):
+    """ Generate an APKINDEX, where each package depends on a few other
+        packages directly, on a few libraries through so: names and sometimes
+        on a virtual package """
+    rand = random.Random(1)
+    pkgnames = ["pkg" + str(i) for i in range(count)]
+    ret = []
+
+    def block(pkgname, depends, provides):
+        return ["P:" + pkgname,
+                "V:1.0-r0",
+                "A:x86_64",
+                "o:" + pkgname,
+                "t:1515217616",
+                "D:" + " ".join(depends),
+                "p:" + " ".join(provides),
+                ""]
+
+    for i, pkgname in enumerate(pkgnames):
+        # Only depend on packages from a lower level (lower number), so the
+        # dependency trees have a realistic size
+        lower = i // 2
+        depends = rand.sample(pkgnames[:lower], min(lower, rand.randint(0, 3)))
+        if lower:
+            depends += ["so:lib" + str(rand.randrange(lower)) + ".so.1"
+                        for j in range(rand.randint(0, 3))]
+        depends += ["!" + pkgname + "-conflict"]
+        provides = ["so:lib" + str(i) + ".so.1=1.0",
+                    "cmd:" + pkgname]
+
+        # Virtual packages with multiple providers
+        if i % 100 == 0:
+            provides += ["virtual" + str(i // 1000)]
+        if i % 200 == 0:
+            virtual = rand.randrange((count - 1) // 1000 + 1)
+            depends += ["virtual" + str(virtual)]
+        ret += block(pkgname, depends, provides)
+
+    for ui in uis:
+        ret += block("postmarketos-ui-" + ui, rand.sample(pkgnames, 100), [])
+    return "\n".join(ret) + "\n"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as work:
+        args = get_args(work)
+        args.aports = work + "/aports"
+        os.mkdir(args.aports)
+
+        path = work + "/APKINDEX.tar.gz"
+        write_apkindex(path, synthetic_apkindex(count))
+        pmb.helpers.repo.apkindex_files = lambda args, arch=None: [path]
+        pmb.chroot.apk.installed = lambda args, suffix="native": {}
+
+        for ui in uis:
+            pkgname = "postmarketos-ui-" + ui
+            times = []
+            for i in range(3):
+                # Keep the parsed APKINDEX, measure only the resolving
+                apkindex = args.cache["apkindex"]
+                pmb.helpers.args.add_cache(args)
+                args.cache["apkindex"] = apkindex
+                start = time.perf_counter()
+                result = pmb.parse.depends.recurse(args, [pkgname])
+                times.append(time.perf_counter() - start)
+            print("{:<30} {:>6} packages {:>8.3f} s".format(
+                pkgname, len(result), min(times)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Measure how long pmb.helpers.repo_missing.filter_arch_packages() takes for
+all pmaports, with the memoized check_arch_recurse() and with the previous
+implementation, that checked the full dependency closure of each package.
+Without a path, a synthetic pmaports tree gets generated. With the path to
+a real pmaports checkout, the APKINDEX files of the configured mirrors are
+used for the dependencies that are not in pmaports.
+
+usage: benchmark_repo_missing.py [path to pmaports | number of aports]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.config
+import pmb.helpers.package
+import pmb.helpers.pmaports
+import pmb.helpers.repo
+import pmb.helpers.repo_missing
+import pmb.parse
+from benchmark_apkindex import get_args
+
+arches = ["x86_64", "armhf", "aarch64"]
+
+
+def synthetic_pmaports(path, count):
+    """ Generate aports, where each one depends on a few aports with a lower
+        number (or their -dev subpackages). Some can't be built for all
+        arches. """
+    rand = random.Random(1)
+    for i in range(count):
+        pkgname = "pkg" + str(i)
+        lower = i // 2
+        depends = []
+        count_depends = min(lower, rand.randint(0, 4))
+        for depend in rand.sample(range(lower), count_depends):
+            depends.append("pkg" + str(depend) + rand.choice(["", "-dev"]))
+        arch = "all"
+        if i % 97 == 0:
+            arch = "all !armhf"
+        elif i % 89 == 0:
+            arch = "x86_64 aarch64"
+
+        os.makedirs(path + "/main/" + pkgname)
+        with open(path + "/main/" + pkgname + "/APKBUILD", "w",
+                  encoding="utf-8") as handle:
+            handle.write("pkgname=" + pkgname + "\n"
+                         "pkgver=1.0\n"
+                         "pkgrel=0\n"
+                         "arch=\"" + arch + "\"\n"
+                         "subpackages=\"$pkgname-dev\"\n"
+                         "makedepends=\"" + " ".join(depends) + "\"\n"
+                         "package() {\n"
+                         "}\n")
+
+
+def check_arch_closure(args, pkgname, arch):
+    """ Previous implementation of check_arch_recurse() """
+    for pkgname_i in pmb.helpers.package.depends_recurse(args, pkgname, arch):
+        if not pmb.helpers.package.check_arch(args, pkgname_i, arch):
+            return False
+    return True
+
+
+def measure(args, pkgnames, func):
+    """ :returns: (seconds, count of buildable packages) for all arches """
+    pmb.helpers.package.check_arch_recurse = func
+    for name in ["pmb.helpers.package.check_arch_recurse",
+                 "pmb.helpers.package.depends_recurse"]:
+        args.cache[name] = {}
+    start = time.perf_counter()
+    count = 0
+    for arch in arches:
+        count += len(pmb.helpers.repo_missing.filter_arch_packages(
+            args, arch, pkgnames))
+    return (time.perf_counter() - start, count)
+
+
+def main():
+    param = sys.argv[1] if len(sys.argv) > 1 else "2000"
+    with tempfile.TemporaryDirectory() as work:
+        args = get_args(work)
+        if os.path.isdir(param):
+            args.aports = os.path.realpath(param)
+        else:
+            count = int(param)
+            args.aports = work + "/aports"
+            synthetic_pmaports(args.aports, count)
+            pmb.helpers.repo.update = lambda args, arch=None: None
+            pmb.helpers.repo.apkindex_files = lambda args, arch=None: []
+
+        # Parse everything once, only the recursion gets measured
+        pkgnames = pmb.helpers.pmaports.get_list(args)
+        pmb.parse.apkbuild_all(args)
+        memoized = pmb.helpers.package.check_arch_recurse
+        measure(args, pkgnames, memoized)
+
+        for name, func in [("closure (before)", check_arch_closure),
+                           ("memoized", memoized)]:
+            duration, count = measure(args, pkgnames, func)
+            print("{:<20} {:>6} aports {:>6} buildable {:>8.3f} s".format(
+                name, len(pkgnames), count, duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Measure how long pmb.chroot.init() and pmb.build.init() take, when running
+sudo for each command and with the persistent root helper (--root-helper).
+The chroot gets created from scratch in each run, as build clone chroot
+("chroot_native-N", see --parallel) in the work folder of the pmbootstrap.cfg,
+so the regular native chroot is not touched. Packages get installed from the
+apk cache, so only the first run needs to download them.
+
+This needs sudo (enter the password once before running it, or configure
+sudo without password), that's why it does not run with the testsuite.
+
+usage: benchmark_root_helper.py [runs per mode]
+"""
+
+import os
+import sys
+import time
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build
+import pmb.chroot
+import pmb.helpers.logging
+import pmb.helpers.mount
+import pmb.helpers.root_helper
+import pmb.helpers.run
+import pmb.helpers.run_core
+import pmb.parse
+
+clone = 99
+
+
+def remove_chroot(args, suffix):
+    chroot = args.work + "/chroot_" + suffix
+    pmb.helpers.mount.umount_all(args, chroot)
+    if os.path.exists(chroot):
+        pmb.helpers.run.root(args, ["rm", "-rf", chroot])
+
+
+def measure(args, suffix):
+    """ :returns: (seconds, count of commands running as root) """
+    core = pmb.helpers.run_core.core
+    count = [0]
+
+    def core_counted(args, log_message, cmd, *args_core, **kwargs):
+        if cmd[0] == "sudo":
+            count[0] += 1
+        return core(args, log_message, cmd, *args_core, **kwargs)
+
+    remove_chroot(args, suffix)
+    pmb.helpers.run_core.core = core_counted
+    try:
+        start = time.perf_counter()
+        pmb.chroot.init(args, suffix)
+        pmb.build.init(args, suffix)
+        return (time.perf_counter() - start, count[0])
+    finally:
+        pmb.helpers.run_core.core = core
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_benchmark.txt"
+    pmb.helpers.logging.init(args)
+    suffix = "native-" + str(clone)
+
+    # Fill the apk cache, so downloads are not measured
+    args.root_helper = False
+    measure(args, suffix)
+
+    try:
+        for name, root_helper in [("sudo per command", False),
+                                  ("root helper", True)]:
+            args.root_helper = root_helper
+            for i in range(runs):
+                duration, count = measure(args, suffix)
+                print("{:<20} run {} {:>5} root commands {:>8.3f} s".format(
+                    name, i + 1, count, duration))
+            pmb.helpers.root_helper.stop()
+    finally:
+        args.root_helper = False
+        remove_chroot(args, suffix)
+
+
+if __name__ == "__main__":
+    main()
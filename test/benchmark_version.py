@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Measure how long comparing versions takes, using all version pairs from
+test/testdata/version/version.data (the test cases of apk-tools).
+
+usage: benchmark_version.py
+"""
+
+import os
+import sys
+import time
+
+# Import from parent directory
+pmb_src = os.path.realpath(os.path.join(os.path.dirname(__file__) + "/.."))
+sys.path.insert(0, pmb_src)
+import pmb.parse.version
+
+
+def read_pairs():
+    ret = []
+    path = pmb_src + "/test/testdata/version/version.data"
+    with open(path) as handle:
+        for line in handle:
+            split = line.split(" ")
+            ret.append((split[0], split[2].split("#")[0].rstrip()))
+    return ret
+
+
+def measure(func, repeat=5):
+    """ :returns: (time of the first run, best time) in seconds """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return (times[0], min(times))
+
+
+def main():
+    pairs = read_pairs()
+    versions = sorted(set([a for a, b in pairs] + [b for a, b in pairs]))
+
+    def compare_pairs():
+        for a, b in pairs:
+            pmb.parse.version.compare(a, b)
+
+    def compare_all_with_first():
+        # Typical for picking the highest version among providers
+        for i in range(10):
+            for version in versions:
+                pmb.parse.version.compare(version, versions[0])
+
+    benchmarks = {"compare (" + str(len(pairs)) + " pairs)": compare_pairs,
+                  "compare (" + str(len(versions) * 10) + " with first)":
+                  compare_all_with_first}
+    for name, func in benchmarks.items():
+        first, best = measure(func)
+        print("{:<30} {:>8.2f} ms first run {:>8.2f} ms best".format(
+              name, first * 1000, best * 1000))
+
+
+if __name__ == "__main__":
+    main()
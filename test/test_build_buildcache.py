@@ -0,0 +1,145 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pytest
+import sys
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build
+import pmb.build.buildcache
+import pmb.helpers.logging
+import pmb.helpers.run
+import pmb.parse.apkindex
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir) + "/work"
+    args.aports = str(tmpdir) + "/aports"
+    os.makedirs(args.work + "/packages/x86_64")
+    os.makedirs(args.aports + "/main/hello-world")
+    return args
+
+
+def write(path, content):
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(content)
+
+
+def test_key(args, monkeypatch):
+    aport = args.aports + "/main/hello-world"
+    write(aport + "/APKBUILD", "pkgname=hello-world\n")
+    write(aport + "/main.c", "int main() {}\n")
+    apkbuild = {"pkgname": "hello-world", "depends": [], "makedepends": ["a"],
+                "checkdepends": [], "options": [], "subpackages": []}
+    versions = {"a": "1.0-r0", "b": "2.0-r0"}
+
+    def package(args, pkgname, arch, must_exist=True, indexes=None):
+        depends = {"a": ["b"], "build-base": ["gcc"]}.get(pkgname, [])
+        return {"pkgname": pkgname, "version": versions.get(pkgname, "1-r0"),
+                "depends": depends}
+    monkeypatch.setattr(pmb.parse.apkindex, "package", package)
+
+    func = pmb.build.buildcache.key
+    key = func(args, apkbuild, "x86_64")
+    assert func(args, apkbuild, "x86_64") == key
+    assert func(args, apkbuild, "armhf") != key
+    assert func(args, apkbuild, "armhf", "crossdirect") != \
+        func(args, apkbuild, "armhf")
+
+    # Changed source file
+    write(aport + "/main.c", "int main() { return 0; }\n")
+    assert func(args, apkbuild, "x86_64") != key
+    key = func(args, apkbuild, "x86_64")
+
+    # Changed version of a dependency
+    versions["a"] = "1.0-r1"
+    assert func(args, apkbuild, "x86_64") != key
+    key = func(args, apkbuild, "x86_64")
+
+    # Changed version of a dependency of a dependency
+    versions["b"] = "2.0-r1"
+    assert func(args, apkbuild, "x86_64") != key
+    key = func(args, apkbuild, "x86_64")
+
+    # Changed version of the build toolchain
+    versions["gcc"] = "9.2.0-r0"
+    assert func(args, apkbuild, "x86_64") != key
+    key = func(args, apkbuild, "x86_64")
+
+    # Changed version of the cross-compiler
+    key_cross = func(args, apkbuild, "armhf", "crossdirect")
+    versions["gcc-armhf"] = "9.2.0-r0"
+    assert func(args, apkbuild, "armhf", "crossdirect") != key_cross
+    assert func(args, apkbuild, "x86_64") == key
+
+
+def test_depends_resolved(args, monkeypatch):
+    index = {"a": {"pkgname": "a", "version": "1-r0", "depends": ["so:b"]},
+             "so:b": {"pkgname": "b", "version": "2-r0", "depends": ["a"]}}
+    monkeypatch.setattr(pmb.parse.apkindex, "package", lambda args, pkgname,
+                        arch, must_exist=True, indexes=None:
+                        index.get(pkgname))
+    apkbuild = {"pkgname": "hello-world", "depends": [],
+                "makedepends": ["a", "c"], "checkdepends": [], "options": [],
+                "subpackages": []}
+    func = pmb.build.buildcache.depends_resolved
+    assert func(args, apkbuild, "x86_64") == {"a": "a-1-r0", "so:b": "b-2-r0",
+                                              "c": "(missing)"}
+
+
+def test_save_restore(args, monkeypatch):
+    monkeypatch.setattr(pmb.helpers.run, "root", pmb.helpers.run.user)
+    monkeypatch.setattr(pmb.build, "index_repo", lambda args, arch: None)
+    apkbuild = {"pkgname": "hello-world", "pkgver": "1", "pkgrel": "2",
+                "subpackages": ["hello-world-doc"]}
+    packages = args.work + "/packages/x86_64/"
+    func = pmb.build.buildcache.restore
+    assert func(args, "abc", apkbuild, "x86_64") is None
+
+    # Save the outputs of a build
+    for pkgname in ["hello-world", "hello-world-doc"]:
+        write(packages + pkgname + "-1-r2.apk", pkgname)
+    pmb.build.buildcache.save(args, "abc", apkbuild, "x86_64")
+    assert sorted(os.listdir(args.work + "/cache_build")) == ["abc"]
+
+    # Restore them after deleting them
+    for pkgname in ["hello-world", "hello-world-doc"]:
+        os.remove(packages + pkgname + "-1-r2.apk")
+    assert func(args, "abc", apkbuild, "x86_64") == \
+        "x86_64/hello-world-1-r2.apk"
+    with open(packages + "hello-world-doc-1-r2.apk") as handle:
+        assert handle.read() == "hello-world-doc"
+    assert func(args, "def", apkbuild, "x86_64") is None
+
+
+def test_enabled(args):
+    func = pmb.build.buildcache.enabled
+    assert func(args) is True
+    assert func(args, "/src") is False
+    args.no_build_cache = True
+    assert func(args) is False
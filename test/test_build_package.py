@@ -33,6 +33,8 @@ sys.path.insert(0, os.path.realpath(
     os.path.join(os.path.dirname(__file__) + "/..")))
 import pmb.build
 import pmb.build._package
+import pmb.build.autodetect
+import pmb.build.buildcache
 import pmb.config
 import pmb.config.init
 import pmb.helpers.logging
@@ -80,9 +82,9 @@ def args_patched(monkeypatch, argv):
 
 def test_skip_already_built(args):
     func = pmb.build._package.skip_already_built
-    assert args.cache["built"] == {}
+    assert args.cache["built"] == set()
     assert func(args, "test-package", "armhf") is False
-    assert args.cache["built"] == {"armhf": ["test-package"]}
+    assert args.cache["built"] == {("armhf", "test-package")}
     assert func(args, "test-package", "armhf") is True
 
 
@@ -239,6 +241,30 @@ def test_init_buildenv(args, monkeypatch):
     assert func(args, apkbuild, "armhf") is False
 
 
+def test_package_build_cache_hit(args, monkeypatch):
+    # Fake aport, that needs to be built
+    apkbuild = {"pkgname": "test", "pkgver": "1", "pkgrel": "2",
+                "subpackages": []}
+    monkeypatch.setattr(pmb.build._package, "skip_already_built",
+                        return_false)
+    monkeypatch.setattr(pmb.build._package, "get_apkbuild",
+                        lambda args, pkgname, arch: apkbuild)
+    monkeypatch.setattr(pmb.build._package, "check_build_for_arch",
+                        return_true)
+    monkeypatch.setattr(pmb.build.autodetect, "suffix", lambda *args:
+                        "native")
+    monkeypatch.setattr(pmb.build.autodetect, "crosscompile", return_none)
+    monkeypatch.setattr(pmb.build._package, "depends_necessary",
+                        lambda *args: [])
+
+    # Cache hit: the build environment does not get set up
+    monkeypatch.setattr(pmb.build.buildcache, "key", return_string)
+    monkeypatch.setattr(pmb.build.buildcache, "restore", lambda args, key,
+                        apkbuild, arch: arch + "/test-1-r2.apk")
+    monkeypatch.setattr(pmb.build._package, "setup_buildenv", None)
+    assert pmb.build.package(args, "test", "armhf") == "armhf/test-1-r2.apk"
+
+
 def test_get_pkgver(monkeypatch):
     # With original source
     func = pmb.build._package.get_pkgver
@@ -313,11 +339,11 @@ def test_package(args):
     assert pmb.build.package(args, "hello-world", force=True)
 
     # Package exists
-    args.cache["built"] = {}
+    args.cache["built"] = set()
     assert pmb.build.package(args, "hello-world") is None
 
     # Force building again
-    args.cache["built"] = {}
+    args.cache["built"] = set()
     assert pmb.build.package(args, "hello-world", force=True)
 
     # Build for another architecture
@@ -352,7 +378,7 @@ def test_build_depends_high_level(args, monkeypatch):
     # Remove hello-world
     pmb.helpers.run.root(args, ["rm", output_hello_outside])
     pmb.build.index_repo(args, args.arch_native)
-    args.cache["built"] = {}
+    args.cache["built"] = set()
 
     # Ask to build the wrapper. It should not build the wrapper (it exists, not
     # using force), but build/update its missing dependency "hello-world"
@@ -0,0 +1,219 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import pytest
+import sys
+import threading
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build
+import pmb.build.autodetect
+import pmb.build.scheduler
+import pmb.helpers.logging
+import pmb.helpers.mount
+import pmb.helpers.run
+import pmb.parse.arch
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    args.cross = False
+    return args
+
+
+@pytest.fixture
+def fake_pmaports(args, monkeypatch):
+    """
+    Packages with the following dependencies ("c" is up to date, "e" only
+    exists as binary package):
+
+    a: b-dev (subpackage of b), c, e
+    b: d
+    c: d
+    d:
+    """
+    apkbuilds = {}
+    for pkgname, depends, subpackages in [("a", ["b-dev", "c", "e"], []),
+                                          ("b", ["d"], ["b-dev"]),
+                                          ("c", ["d"], []),
+                                          ("d", [], [])]:
+        apkbuilds[pkgname] = {"pkgname": pkgname,
+                              "depends": depends,
+                              "makedepends": [],
+                              "checkdepends": [],
+                              "options": [],
+                              "subpackages": subpackages}
+    apkbuilds["b-dev"] = apkbuilds["b"]
+
+    def get_apkbuild(args, pkgname, arch):
+        return apkbuilds.get(pkgname)
+
+    def is_necessary(args, arch, apkbuild):
+        return apkbuild["pkgname"] != "c"
+
+    monkeypatch.setattr(pmb.build._package, "get_apkbuild", get_apkbuild)
+    monkeypatch.setattr(pmb.build._package, "check_build_for_arch",
+                        lambda args, pkgname, arch: True)
+    monkeypatch.setattr(pmb.build.other, "is_necessary", is_necessary)
+
+
+def test_plan(args, fake_pmaports):
+    arch = args.arch_native
+    func = pmb.build.scheduler.plan
+    ret = func(args, [("a", arch)])
+    assert list(ret["dag"].keys()) == [("d", arch), ("b", arch), ("c", arch),
+                                       ("a", arch)]
+    assert ret["dag"][("a", arch)] == {"depends": [("b", arch), ("c", arch)],
+                                       "build": True,
+                                       "requested": True}
+    assert ret["levels"] == [[("d", arch)], [("b", arch)], [("a", arch)]]
+    assert ret["critical_path"] == [("d", arch), ("b", arch), ("a", arch)]
+    assert ret["duration"] == 0
+    assert ret["unknown"] == [("d", arch), ("b", arch), ("a", arch)]
+
+    # Subpackage and up to date package requested, with previous build times
+    save = pmb.build.scheduler.build_time_save
+    save(args, "a", arch, 5)
+    save(args, "b", arch, 20)
+    save(args, "d", arch, 10)
+    ret = func(args, [("b-dev", arch), ("c", arch)])
+    assert ret["requested"] == {("b-dev", arch): ("b", arch),
+                                ("c", arch): ("c", arch)}
+    assert ret["levels"] == [[("d", arch)], [("b", arch)]]
+    assert ret["duration"] == 30
+    assert ret["unknown"] == []
+    pmb.build.scheduler.log_plan(args, ret)
+
+    # Forced build of an up to date package
+    ret = func(args, [("c", arch)], True)
+    assert ret["levels"] == [[("d", arch)], [("c", arch)]]
+
+
+def test_run(args, fake_pmaports, monkeypatch):
+    arch = args.arch_native
+    calls = []
+
+    def package(args, pkgname, arch, force=False, strict=False, src=None):
+        calls.append((pkgname, force, src))
+        if pkgname == "c" and not force:
+            return None
+        return arch + "/" + pkgname + "-1-r0.apk"
+    monkeypatch.setattr(pmb.build, "package", package)
+
+    build_plan = pmb.build.scheduler.plan(args, [("a", arch), ("c", arch)])
+    ret = pmb.build.scheduler.run(args, build_plan, src="/src")
+    assert calls == [("d", False, None), ("b", False, None),
+                     ("a", False, "/src"), ("c", False, "/src")]
+    assert ret == {("a", arch): arch + "/a-1-r0.apk", ("c", arch): None}
+
+
+def test_run_parallel(args, fake_pmaports, monkeypatch):
+    arch = args.arch_native
+    calls = []
+
+    def package(args, pkgname, arch, force=False, strict=False, src=None):
+        apkbuild = pmb.build._package.get_apkbuild(args, pkgname, arch)
+        suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
+        logging.info("building " + pkgname)
+        return (pkgname, suffix, force, src, os.path.basename(args.log))
+
+    def init(args, suffix):
+        calls.append(("init", suffix))
+        os.makedirs(args.work + "/chroot_" + suffix)
+    monkeypatch.setattr(pmb.build, "package", package)
+    monkeypatch.setattr(pmb.build, "init", init)
+    monkeypatch.setattr(pmb.helpers.mount, "umount_all", lambda args, folder:
+                        calls.append(("umount", os.path.basename(folder))))
+    monkeypatch.setattr(pmb.helpers.run, "root", pmb.helpers.run.user)
+    monkeypatch.setattr(pmb.build, "index_repo",
+                        lambda args, arch: calls.append(("index", arch)))
+
+    # "b" and "c" get built in parallel, "d" and "a" in the main process
+    build_plan = pmb.build.scheduler.plan(args, [("a", arch), ("c", arch)],
+                                          True)
+    assert build_plan["levels"][1] == [("b", arch), ("c", arch)]
+    ret = pmb.build.scheduler.run(args, build_plan, True, src="/src",
+                                  parallel=4)
+    assert calls == [("init", "native-1"), ("init", "native-2"),
+                     ("index", arch), ("umount", "chroot_native-1"),
+                     ("umount", "chroot_native-2")]
+    assert not os.path.exists(args.work + "/chroot_native-1")
+    assert ret[("a", arch)] == ("a", "native", True, "/src",
+                                "log_testsuite.txt")
+    assert ret[("c", arch)] in [("c", "native-" + str(clone), True, "/src",
+                                 arch + "_c.txt") for clone in [1, 2]]
+    assert args.cache["built"] == {(arch, "b"), (arch, "c")}
+    with open(args.work + "/log_build/" + arch + "_b.txt") as handle:
+        assert "building b" in handle.read()
+    assert "build_clone" not in args
+
+
+def test_publish(args, monkeypatch):
+    arch = args.arch_native
+    calls = []
+    monkeypatch.setattr(pmb.helpers.run, "root", pmb.helpers.run.user)
+    monkeypatch.setattr(pmb.build, "index_repo",
+                        lambda args, arch: calls.append(arch))
+
+    # Parallel build process: the lock is held while publishing
+    lock = threading.RLock()
+    monkeypatch.setitem(pmb.build.scheduler._parallel, "lock", lock)
+    assert pmb.build.scheduler.lock() is lock
+
+    path = (args.work + "/chroot_native-1" + pmb.build.scheduler.repodest +
+            "/pmos/" + arch)
+    os.makedirs(path)
+    open(path + "/hello-world-1-r0.apk", "w").close()
+    pmb.build.scheduler.publish(args, arch, "native-1")
+    assert os.listdir(path) == []
+    assert os.listdir(args.work + "/packages/" + arch) == \
+        ["hello-world-1-r0.apk"]
+    assert calls == [arch]
+
+
+def test_suffix_clone(args):
+    apkbuild = {"pkgname": "hello-world"}
+    func = pmb.build.autodetect.suffix
+    assert func(args, apkbuild, args.arch_native) == "native"
+    assert func(args, apkbuild, "armhf") == "buildroot_armhf"
+    args.build_clone = 2
+    assert func(args, apkbuild, args.arch_native) == "native-2"
+    assert func(args, apkbuild, "armhf") == "buildroot_armhf-2"
+
+    func = pmb.parse.arch.from_chroot_suffix
+    assert func(args, "native-2") == args.arch_native
+    assert func(args, "buildroot_x86_64-2") == "x86_64"
+    assert func(args, "buildroot_armhf") == "armhf"
+
+
+def test_format_duration():
+    func = pmb.build.scheduler.format_duration
+    assert func(5.4) == "5s"
+    assert func(65) == "1m 5s"
+    assert func(3725) == "1h 2m 5s"
@@ -0,0 +1,121 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+"""
+This file tests pmb.chroot.root_batch() and related functions
+"""
+
+import os
+import subprocess
+import sys
+import pytest
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.chroot
+import pmb.chroot.batch
+import pmb.helpers.logging
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+@pytest.fixture
+def fake_chroot(args, monkeypatch):
+    """ Run the scripts on the host system instead of inside the chroot and
+        return the log messages """
+    calls = []
+
+    def run_script(args, log_message, script, suffix="native", output="log",
+                   output_return=False, check=None, env={}, auto_init=True):
+        calls.append(log_message)
+        marker = pmb.chroot.batch.marker
+        os.makedirs(os.path.dirname(args.work + "/chroot_" + suffix + marker),
+                    exist_ok=True)
+        script = script.replace(marker, args.work + "/chroot_" + suffix +
+                                marker)
+        return pmb.helpers.run.user(args, ["sh", "-c", script], None, output,
+                                    output_return, check, env)
+    monkeypatch.setattr(pmb.chroot.batch, "run_script", run_script)
+    return calls
+
+
+def test_batch_script(args, monkeypatch):
+    marker = args.work + "/failed"
+    monkeypatch.setattr(pmb.chroot.batch, "marker", marker)
+    cmds = [["echo", "a b"], ["sh", "-c", "exit 3"], ["echo", "never"]]
+    script = pmb.chroot.batch.batch_script(cmds, {"VAR": "x y"})
+    process = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE)
+    assert process.returncode == 3
+    assert process.stdout.decode("utf-8") == ("% echo a b\n"
+                                              "a b\n"
+                                              "% sh -c exit 3\n"
+                                              "(exit code 3)\n")
+    with open(marker) as handle:
+        assert handle.read() == "2\n"
+
+    # More commands than possible exit codes
+    cmds = [["true"]] * 299 + [["false"]]
+    script = pmb.chroot.batch.batch_script(cmds)
+    assert subprocess.run(["sh", "-c", script]).returncode == 1
+    with open(marker) as handle:
+        assert handle.read() == "300\n"
+
+
+def test_root_batch(args, fake_chroot, tmpdir):
+    func = pmb.chroot.root_batch
+    path = str(tmpdir) + "/batch"
+
+    # All commands succeed, working dir
+    assert func(args, [["mkdir", "batch"], ["touch", "batch/test"]],
+                working_dir=str(tmpdir)) == 0
+    assert os.path.exists(path + "/test")
+    assert fake_chroot == ["(native) % cd " + str(tmpdir) + "; mkdir batch"
+                           " && touch batch/test"]
+
+    # Stops at the first failing command
+    cmds = [["touch", path + "/1"], ["false"], ["touch", path + "/2"]]
+    with pytest.raises(RuntimeError) as e:
+        func(args, cmds)
+    assert str(e.value) == "Command failed: (native) % false"
+    assert os.path.exists(path + "/1")
+    assert not os.path.exists(path + "/2")
+    assert func(args, cmds, check=False) == 1
+    assert pmb.chroot.batch.marker_read(args, "native") == 2
+
+    # Failing before the first command: no marker of an earlier batch
+    with pytest.raises(RuntimeError) as e:
+        func(args, [["true"]], working_dir=path + "/missing")
+    assert str(e.value).startswith("Command failed: (native) % cd ")
+    assert pmb.chroot.batch.marker_read(args, "native") is None
+
+    # Output modes that can't be used
+    with pytest.raises(RuntimeError) as e:
+        func(args, cmds, output="background")
+    assert str(e.value).startswith("Can't use output background")
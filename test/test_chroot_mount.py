@@ -0,0 +1,81 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pytest
+import sys
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.chroot.mount
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.mount
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+def test_mount_once_per_session(args, monkeypatch):
+    binds = []
+    mounts = set()
+
+    def bind(args, source, destination):
+        binds.append(destination)
+        mounts.add(destination)
+
+    def umount_all_list(prefix):
+        return sorted([path for path in mounts if path.startswith(prefix)])
+
+    # pmb.chroot.mount is the function, get the module
+    module = sys.modules["pmb.chroot.mount"]
+    monkeypatch.setattr(module, "mount_dev_tmpfs",
+                        lambda args, suffix: mounts.add(args.work +
+                                                        "/chroot_native/dev"))
+    monkeypatch.setattr(pmb.helpers.mount, "bind", bind)
+    monkeypatch.setattr(pmb.helpers.mount, "ismount", lambda path: path in
+                        mounts)
+    monkeypatch.setattr(pmb.helpers.mount, "umount_all_list", umount_all_list)
+    monkeypatch.setattr(pmb.helpers.run, "root",
+                        lambda args, cmd: mounts.discard(cmd[1]))
+
+    # Second call: nothing to do
+    count = len(pmb.config.chroot_mount_bind)
+    pmb.chroot.mount(args)
+    pmb.chroot.mount(args)
+    assert len(binds) == count
+
+    # /dev is not mounted anymore: mount again
+    mounts.discard(args.work + "/chroot_native/dev")
+    pmb.chroot.mount(args)
+    assert len(binds) == count * 2
+
+    # After umount_all(), the cache is reset
+    pmb.helpers.mount.umount_all(args, args.work + "/chroot_native/proc")
+    pmb.chroot.mount(args)
+    assert len(binds) == count * 3
@@ -0,0 +1,131 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pytest
+import sys
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.chroot
+import pmb.chroot.overlay
+import pmb.chroot.template
+import pmb.helpers.logging
+import pmb.helpers.mount
+import pmb.helpers.repo
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    args.strict_overlay = True
+    return args
+
+
+@pytest.fixture
+def fake_root(args, monkeypatch):
+    """ Run the commands as user instead of root, except for mount and umount
+        (these only get recorded, like the pmb.chroot.init() calls) """
+    calls = []
+    mounts = []
+
+    def root(args, cmd, *args_root, **kwargs):
+        if cmd[0] == "mount":
+            mounts.append(cmd[-1])
+        elif cmd[0] == "umount":
+            mounts.remove(cmd[1])
+        else:
+            pmb.helpers.run.user(args, cmd, *args_root, **kwargs)
+        calls.append(cmd[0])
+
+    def umount_all_list(prefix):
+        return sorted([path for path in mounts if path.startswith(prefix)],
+                      reverse=True)
+
+    monkeypatch.setattr(pmb.helpers.run, "root", root)
+    monkeypatch.setattr(pmb.helpers.mount, "ismount", lambda path: path in
+                        mounts)
+    monkeypatch.setattr(pmb.helpers.mount, "umount_all_list", umount_all_list)
+    monkeypatch.setattr(pmb.helpers.repo, "update", lambda args, arch: None)
+    monkeypatch.setattr(pmb.chroot, "init", lambda args, suffix:
+                        calls.append("init " + suffix))
+    monkeypatch.setattr(pmb.chroot.template, "packages_apkindex",
+                        lambda args, arch: {"alpine-base": "1.0-r0"})
+    return (calls, mounts)
+
+
+def test_enabled(args):
+    func = pmb.chroot.overlay.enabled
+    assert func(args, True) is True
+    assert func(args, False) is False
+    args.strict_overlay = False
+    assert func(args, True) is False
+
+
+def test_mount_discard(args, fake_root):
+    calls, mounts = fake_root
+    chroot = args.work + "/chroot_native"
+    arch = args.arch_native
+
+    # Template of the pristine build chroot
+    key = pmb.chroot.template.key(arch, {"alpine-base": "1.0-r0"})
+    template = pmb.chroot.template.path(args, arch, key)
+    os.makedirs(args.work + "/pristine/bin")
+    os.makedirs(os.path.dirname(template))
+    pmb.helpers.run.user(args, ["tar", "-C", args.work + "/pristine", "-cf",
+                                template, "."])
+
+    # Old chroot, lower layer of an older template
+    os.makedirs(chroot + "/home/pmos/build")
+    os.makedirs(args.work + "/cache_chroot_overlay/" + arch + "_old")
+    args.cache["apk_repository_list_updated"].add("native")
+
+    # Mount the overlay
+    pmb.chroot.overlay.mount(args, "native")
+    lower = args.work + "/cache_chroot_overlay/" + arch + "_" + key
+    assert os.listdir(args.work + "/cache_chroot_overlay") == \
+        [os.path.basename(lower)]
+    assert os.path.exists(lower + "/bin")
+    assert mounts == [chroot]
+    assert pmb.chroot.overlay.mounted(args, "native")
+    assert not os.path.exists(chroot + "/home")
+    assert os.path.exists(args.work + "/overlay_native/upper")
+    assert "native" not in args.cache["apk_repository_list_updated"]
+    assert calls[-2:] == ["mount", "init native"]
+
+    # Discard it, other chroots are not affected
+    mounts.append(args.work + "/chroot_native-2")
+    mounts.append(chroot + "/proc")
+    pmb.chroot.overlay.discard(args, "native")
+    assert mounts == [args.work + "/chroot_native-2"]
+    assert not os.path.exists(chroot)
+    assert not os.path.exists(args.work + "/overlay_native")
+    assert not pmb.chroot.overlay.mounted(args, "native")
+
+    # Lower layer gets reused
+    del calls[:]
+    pmb.chroot.overlay.mount(args, "native")
+    assert "tar" not in calls
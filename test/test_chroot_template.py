@@ -0,0 +1,190 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import importlib
+import os
+import pytest
+import sys
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.chroot
+import pmb.chroot.apk
+import pmb.chroot.apk_static
+import pmb.chroot.template
+import pmb.config
+import pmb.helpers.repo
+import pmb.helpers.logging
+import pmb.helpers.run
+import pmb.parse.apkindex
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+@pytest.fixture
+def fake_apkindex(monkeypatch):
+    """ alpine-base, the build packages and their dependencies, as they are
+        in the APKINDEX and installed in the chroot """
+    index = {}
+    for pkgname, depends in [("alpine-base", ["busybox", "so:libc.so"]),
+                             ("abuild", ["busybox"]),
+                             ("build-base", ["gcc"]),
+                             ("ccache", []),
+                             ("busybox", ["so:libc.so"]),
+                             ("gcc", ["so:libc.so"]),
+                             ("musl", [])]:
+        index[pkgname] = {"pkgname": pkgname, "version": "1.0-r0",
+                          "depends": depends}
+    index["so:libc.so"] = index["musl"]
+    installed = dict(index)
+
+    def package(args, pkgname, arch=None, must_exist=True, indexes=None):
+        return index.get(pkgname)
+    monkeypatch.setattr(pmb.parse.apkindex, "package", package)
+    monkeypatch.setattr(pmb.chroot.apk, "installed",
+                        lambda args, suffix: installed)
+    return (index, installed)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(content)
+
+
+def test_packages(args, fake_apkindex):
+    index, installed = fake_apkindex
+    func = pmb.chroot.template.packages_apkindex
+    packages = func(args, "x86_64")
+    assert packages == {pkgname: "1.0-r0" for pkgname in
+                        ["alpine-base", "abuild", "build-base", "ccache",
+                         "busybox", "gcc", "musl"]}
+    assert pmb.chroot.template.packages_installed(args, "native") == \
+        packages
+
+    # Missing dependency
+    del index["so:libc.so"]
+    assert func(args, "x86_64") is None
+
+
+def test_key():
+    func = pmb.chroot.template.key
+    key = func("x86_64", {"a": "1-r0", "b": "2-r0"})
+    assert func("x86_64", {"b": "2-r0", "a": "1-r0"}) == key
+    assert func("armhf", {"a": "1-r0", "b": "2-r0"}) != key
+    assert func("x86_64", {"a": "1-r1", "b": "2-r0"}) != key
+    assert func("x86_64", {"a": "1-r0"}) != key
+
+
+def test_save_restore(args, fake_apkindex, monkeypatch):
+    index, installed = fake_apkindex
+    monkeypatch.setattr(pmb.helpers.run, "root", pmb.helpers.run.user)
+    chroot = args.work + "/chroot_native"
+    func = pmb.chroot.template.restore
+    assert func(args, "native") is False
+
+    # Save a chroot, without mountpoints and files for the current host
+    for path in ["/bin/sh", "/etc/abuild.conf", "/etc/resolv.conf",
+                 "/tmp/gzip_wrapper.sh", "/proc/cpuinfo",
+                 "/var/cache/apk/a.apk"]:
+        write(chroot + path, path)
+    pmb.chroot.template.save(args, "native")
+    templates = os.listdir(args.work + "/cache_chroot_template")
+    assert len(templates) == 1
+    assert templates[0].startswith(args.arch_native + "_")
+
+    # Restore it into a new chroot
+    pmb.helpers.run.user(args, ["rm", "-r", chroot])
+    os.makedirs(chroot + "/proc")
+    assert func(args, "native") is True
+    assert os.path.exists(chroot + "/bin/sh")
+    assert os.path.exists(chroot + "/etc/abuild.conf")
+    for path in ["/etc/resolv.conf", "/tmp/gzip_wrapper.sh", "/proc/cpuinfo",
+                 "/var/cache/apk"]:
+        assert not os.path.exists(chroot + path)
+
+    # Newer version in the APKINDEX: don't use the template
+    index["ccache"] = {"pkgname": "ccache", "version": "1.1-r0",
+                       "depends": []}
+    assert func(args, "native") is False
+
+    # Save the updated chroot, the old template gets removed
+    installed["ccache"] = index["ccache"]
+    pmb.chroot.template.save(args, "native")
+    templates_new = os.listdir(args.work + "/cache_chroot_template")
+    assert len(templates_new) == 1
+    assert templates_new != templates
+
+    # Installed packages differ from the APKINDEX: not saved
+    installed["vim"] = {"pkgname": "vim", "version": "8-r0", "depends": []}
+    monkeypatch.setattr(pmb.helpers.run, "root", None)
+    pmb.chroot.template.save(args, "native")
+
+
+def test_enabled(args):
+    func = pmb.chroot.template.enabled
+    assert func(args, "native") is True
+    assert func(args, "buildroot_armhf-2") is True
+    assert func(args, "rootfs_qemu-amd64") is False
+    args.no_chroot_template = True
+    assert func(args, "native") is False
+
+
+def test_init_restore(args, monkeypatch):
+    """ Restoring a template skips alpine-base and adduser, but the owner of
+        the mountpoints in /mnt still gets fixed """
+    calls = []
+    chroot = args.work + "/chroot_native"
+    module = importlib.import_module("pmb.chroot.init")
+    for func in ["root", "user"]:
+        monkeypatch.setattr(pmb.chroot, func, lambda args, cmd, *a, **k:
+                            calls.append(cmd))
+    monkeypatch.setattr(pmb.chroot, "mount", lambda args, suffix: None)
+    monkeypatch.setattr(pmb.chroot.apk_static, "init", lambda args: None)
+    monkeypatch.setattr(pmb.chroot.apk_static, "run", None)
+    monkeypatch.setattr(pmb.chroot.apk, "update_repository_list",
+                        lambda args, suffix: None)
+    monkeypatch.setattr(pmb.helpers.repo, "update", lambda args, arch: None)
+    monkeypatch.setattr(pmb.helpers.run, "root", lambda args, cmd: None)
+    monkeypatch.setattr(module, "copy_resolv_conf", lambda args, suffix:
+                        None)
+
+    # Restored chroot already has the links to the mountpoints
+    def restore(args, suffix):
+        for link_name in pmb.config.chroot_home_symlinks.values():
+            os.makedirs(os.path.dirname(chroot + link_name), exist_ok=True)
+            os.symlink("/mnt", chroot + link_name)
+        return True
+    monkeypatch.setattr(pmb.chroot.template, "restore", restore)
+
+    module.init(args, "native")
+    assert "adduser" not in [cmd[0] for cmd in calls]
+    assert "ln" not in [cmd[0] for cmd in calls]
+    for target in pmb.config.chroot_home_symlinks.keys():
+        assert ["chown", "pmos:pmos", target] in calls
@@ -0,0 +1,80 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import sys
+import pytest
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.helpers.disk_cache
+import pmb.helpers.logging
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+def test_disk_cache_save_load_delete(args):
+    func_load = pmb.helpers.disk_cache.load
+    data = {"a": [1, 2], "b": "test"}
+
+    # Nothing saved yet
+    assert func_load(args, "test", "key", (1, 2)) is None
+
+    # Saved with the same validity
+    pmb.helpers.disk_cache.save(args, "test", "key", (1, 2), data)
+    assert func_load(args, "test", "key", (1, 2)) == data
+
+    # Different validity or key
+    assert func_load(args, "test", "key", (1, 3)) is None
+    assert func_load(args, "test", "key2", (1, 2)) is None
+
+    # Delete (run twice for both code paths)
+    assert pmb.helpers.disk_cache.delete(args, "test", "key") is True
+    assert pmb.helpers.disk_cache.delete(args, "test", "key") is False
+    assert func_load(args, "test", "key", (1, 2)) is None
+
+
+def test_disk_cache_outdated_version(args, monkeypatch):
+    pmb.helpers.disk_cache.save(args, "test", "key", 1, "data")
+    monkeypatch.setattr(pmb.config, "version", "0.0.0")
+    assert pmb.helpers.disk_cache.load(args, "test", "key", 1) is None
+
+
+def test_disk_cache_corrupt(args):
+    pmb.helpers.disk_cache.save(args, "test", "key", 1, "data")
+    path = pmb.helpers.disk_cache.path(args, "test", "key")
+    with open(path, "wb") as handle:
+        handle.write(b"garbage")
+    assert pmb.helpers.disk_cache.load(args, "test", "key", 1) is None
+
+
+def test_disk_cache_no_work_folder(args, tmpdir):
+    args.work = str(tmpdir) + "/does-not-exist"
+    pmb.helpers.disk_cache.save(args, "test", "key", 1, "data")
+    assert not os.path.exists(args.work)
@@ -101,11 +101,11 @@ def test_helpers_package_depends_recurse(args):
     """ Test pmb.helpers.package.depends_recurse() """
 
     # Put fake data into the pmb.helpers.package.get() cache
-    cache = {"a": {False: {"pkgname": "a", "depends": ["b", "c"]}},
-             "b": {False: {"pkgname": "b", "depends": []}},
-             "c": {False: {"pkgname": "c", "depends": ["d"]}},
-             "d": {False: {"pkgname": "d", "depends": ["b"]}}}
-    args.cache["pmb.helpers.package.get"]["armhf"] = cache
+    cache = args.cache["pmb.helpers.package.get"]
+    for pkgname, depends in [("a", ["b", "c"]), ("b", []), ("c", ["d"]),
+                             ("d", ["b"])]:
+        cache[("armhf", pkgname, False)] = {"pkgname": pkgname,
+                                            "depends": depends}
 
     # Normal runs
     func = pmb.helpers.package.depends_recurse
@@ -113,7 +113,7 @@ def test_helpers_package_depends_recurse(args):
     assert func(args, "d", "armhf") == ["b", "d"]
 
     # Cached result
-    args.cache["pmb.helpers.package.get"]["armhf"] = {}
+    cache.clear()
     assert func(args, "d", "armhf") == ["b", "d"]
 
 
@@ -121,22 +121,22 @@ def test_helpers_package_check_arch_package(args):
     """ Test pmb.helpers.package.check_arch(): binary = True """
     # Put fake data into the pmb.helpers.package.get() cache
     func = pmb.helpers.package.check_arch
-    cache = {"a": {False: {"arch": []}}}
-    args.cache["pmb.helpers.package.get"]["armhf"] = cache
+    package = {"arch": []}
+    args.cache["pmb.helpers.package.get"][("armhf", "a", False)] = package
 
-    cache["a"][False]["arch"] = ["all !armhf"]
+    package["arch"] = ["all !armhf"]
     assert func(args, "a", "armhf") is False
 
-    cache["a"][False]["arch"] = ["all"]
+    package["arch"] = ["all"]
     assert func(args, "a", "armhf") is True
 
-    cache["a"][False]["arch"] = ["noarch"]
+    package["arch"] = ["noarch"]
     assert func(args, "a", "armhf") is True
 
-    cache["a"][False]["arch"] = ["armhf"]
+    package["arch"] = ["armhf"]
     assert func(args, "a", "armhf") is True
 
-    cache["a"][False]["arch"] = ["aarch64"]
+    package["arch"] = ["aarch64"]
     assert func(args, "a", "armhf") is False
 
 
@@ -158,17 +158,17 @@ def test_helpers_package_check_arch_pmaports(args, monkeypatch):
 
 def test_helpers_package_check_arch_recurse(args, monkeypatch):
     """ Test pmb.helpers.package.check_arch_recurse() """
-    # Test data
+    # Test data: "a" depends on "b" and "c"
     func = pmb.helpers.package.check_arch_recurse
-    depends = ["a", "b", "c"]
+    cache = args.cache["pmb.helpers.package.get"]
+    for pkgname, depends in [("a", ["b", "c"]), ("b", []), ("c", [])]:
+        cache[("armhf", pkgname, False)] = {"pkgname": pkgname,
+                                            "depends": depends}
     arch_check_results = {}
-
-    def fake_depends_recurse(args, pkgname, arch):
-        return depends
-    monkeypatch.setattr(pmb.helpers.package, "depends_recurse",
-                        fake_depends_recurse)
+    arch_check_calls = []
 
     def fake_check_arch(args, pkgname, arch):
+        arch_check_calls.append(pkgname)
         return arch_check_results[pkgname]
     monkeypatch.setattr(pmb.helpers.package, "check_arch", fake_check_arch)
 
@@ -179,7 +179,60 @@ def test_helpers_package_check_arch_recurse(args, monkeypatch):
     assert func(args, "a", "armhf") is True
 
     # Result: False
+    args.cache["pmb.helpers.package.check_arch_recurse"].clear()
     arch_check_results = {"a": True,
                           "b": False,
                           "c": True}
     assert func(args, "a", "armhf") is False
+
+    # Every package gets checked only once
+    args.cache["pmb.helpers.package.check_arch_recurse"].clear()
+    arch_check_calls.clear()
+    assert func(args, "a", "armhf") is False
+    assert func(args, "b", "armhf") is False
+    assert func(args, "c", "armhf") is True
+    assert arch_check_calls == ["a", "b", "c"]
+
+
+def test_helpers_package_check_arch_recurse_cycle(args, monkeypatch):
+    """ Test pmb.helpers.package.check_arch_recurse() with a dependency cycle:
+        "a" and "b" depend on each other, "b" also depends on "c" """
+    func = pmb.helpers.package.check_arch_recurse
+    cache = args.cache["pmb.helpers.package.get"]
+    for pkgname, depends in [("a", ["b"]), ("b", ["a", "c"]), ("c", [])]:
+        cache[("armhf", pkgname, False)] = {"pkgname": pkgname,
+                                            "depends": depends}
+    arch_check_results = {"a": True, "b": True, "c": False}
+    monkeypatch.setattr(pmb.helpers.package, "check_arch",
+                        lambda args, pkgname, arch:
+                        arch_check_results[pkgname])
+    assert func(args, "a", "armhf") is False
+    assert func(args, "b", "armhf") is False
+
+    # "b" is in the cycle, so it must not be cached as buildable before "a"
+    # is done
+    args.cache["pmb.helpers.package.check_arch_recurse"].clear()
+    cache[("armhf", "b", False)] = {"pkgname": "b", "depends": ["a"]}
+    cache[("armhf", "a", False)] = {"pkgname": "a", "depends": ["b", "c"]}
+    assert func(args, "a", "armhf") is False
+    assert func(args, "b", "armhf") is False
+    arch_check_results["c"] = True
+    args.cache["pmb.helpers.package.check_arch_recurse"].clear()
+    assert func(args, "b", "armhf") is True
+
+
+def test_helpers_package_immutable():
+    """ Test pmb.helpers.package.Package """
+    package = pmb.helpers.package.Package(["armhf"], ["a", "b"], "test", [],
+                                          "1.0-r1")
+    assert package["depends"] == ("a", "b")
+    assert package.get("invalid") is None
+    assert package == {"arch": ["armhf"], "depends": ["a", "b"],
+                       "pkgname": "test", "provides": [],
+                       "version": "1.0-r1"}
+    with pytest.raises(AttributeError):
+        package.depends = []
+
+    replaced = package.replace(depends=["c"])
+    assert replaced["depends"] == ("c",)
+    assert package["depends"] == ("a", "b")
@@ -25,6 +25,10 @@ import sys
 sys.path.insert(0, os.path.realpath(
     os.path.join(os.path.dirname(__file__) + "/..")))
 import pmb.build.other
+import pmb.helpers.args
+import pmb.helpers.pmaports
+import pmb.helpers.run
+import pmb.parse
 
 
 @pytest.fixture
@@ -50,3 +54,73 @@ def test_guess_main(args, tmpdir):
     assert func(args, "qemu-system-x86_64") == tmpdir + "/temp/qemu"
     assert func(args, "some-pkg-sub-pkg") == tmpdir + "/main/some-pkg"
     assert func(args, "qemuPackageWithoutDashes") is None
+
+
+def create_apkbuild(path, pkgname, subpackages="", provides=""):
+    os.makedirs(path)
+    with open(path + "/APKBUILD", "w", encoding="utf-8") as handle:
+        handle.write("pkgname=" + pkgname + "\n"
+                     "pkgver=1.0\n"
+                     "pkgrel=0\n"
+                     "arch=\"all\"\n"
+                     "subpackages=\"" + subpackages + "\"\n"
+                     "provides=\"" + provides + "\"\n"
+                     "package() {\n"
+                     "}\n")
+
+
+def test_find_subpackages_index(args, tmpdir):
+    # Fake pmaports and work folder
+    tmpdir = str(tmpdir)
+    args.aports = tmpdir + "/aports"
+    args.work = tmpdir + "/work"
+    os.makedirs(args.work)
+    create_apkbuild(args.aports + "/main/hello-world", "hello-world",
+                    "$pkgname-doc hello-world-extra:extra", "hello=1.0")
+    create_apkbuild(args.aports + "/device/device-test", "device-test")
+
+    # Main packages, subpackages, provides and misses
+    func = pmb.helpers.pmaports.find
+    aport = args.aports + "/main/hello-world"
+    assert func(args, "hello-world") == aport
+    assert func(args, "hello-world-doc") == aport
+    assert func(args, "hello-world-extra") == aport
+    assert func(args, "hello") == aport
+    assert func(args, "device-test") == args.aports + "/device/device-test"
+    assert func(args, "alpine-only", False) is None
+    with pytest.raises(RuntimeError) as e:
+        func(args, "alpine-only-2")
+    assert str(e.value).startswith("Could not find aport for package")
+
+    # Loaded from disk in the next session, without parsing any APKBUILD
+    index = pmb.helpers.pmaports.subpackages_index(args)
+    pmb.helpers.args.add_cache(args)
+    assert pmb.helpers.pmaports.subpackages_index(args) == index
+    assert args.cache["apkbuild"] == {}
+
+    # Rebuilt when an APKBUILD gets added
+    pmb.helpers.args.add_cache(args)
+    create_apkbuild(args.aports + "/main/new", "new", "new-dev")
+    assert func(args, "new-dev") == args.aports + "/main/new"
+
+
+def test_invalidate(args, tmpdir):
+    # Fake pmaports and work folder, index them
+    tmpdir = str(tmpdir)
+    args.aports = tmpdir + "/aports"
+    args.work = tmpdir + "/work"
+    os.makedirs(args.work)
+    aport = args.aports + "/main/hello-world"
+    create_apkbuild(aport, "hello-world")
+    func = pmb.helpers.pmaports.find
+    assert func(args, "greeting", False) is None
+
+    # New provides and new aport in the same session
+    pmb.helpers.run.user(args, ["rm", "-r", aport])
+    create_apkbuild(aport, "hello-world", provides="greeting")
+    create_apkbuild(args.aports + "/main/new", "new", "new-dev")
+    pmb.helpers.pmaports.invalidate(args, aport)
+    assert func(args, "greeting") == aport
+    assert func(args, "new-dev") == args.aports + "/main/new"
+    assert pmb.parse.apkbuild(args, aport + "/APKBUILD")["provides"] == \
+        ["greeting"]
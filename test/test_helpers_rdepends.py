@@ -0,0 +1,117 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pytest
+import sys
+import tarfile
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.helpers.logging
+import pmb.helpers.rdepends
+import pmb.helpers.repo
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir) + "/work"
+    args.aports = str(tmpdir) + "/aports"
+    os.makedirs(args.work)
+    return args
+
+
+def create_apkbuild(args, pkgname, subpackages="", depends="",
+                    makedepends=""):
+    path = args.aports + "/main/" + pkgname
+    os.makedirs(path)
+    with open(path + "/APKBUILD", "w", encoding="utf-8") as handle:
+        handle.write("pkgname=" + pkgname + "\n"
+                     "pkgver=1.0\n"
+                     "pkgrel=0\n"
+                     "arch=\"all\"\n"
+                     "subpackages=\"" + subpackages + "\"\n"
+                     "depends=\"" + depends + "\"\n"
+                     "makedepends=\"" + makedepends + "\"\n"
+                     "package() {\n"
+                     "}\n")
+
+
+def create_apkindex(path, packages):
+    """ :param packages: list of (pkgname, origin, depends, provides) """
+    content = ""
+    for pkgname, origin, depends, provides in packages:
+        content += ("P:" + pkgname + "\n"
+                    "V:1.0-r0\n"
+                    "A:x86_64\n"
+                    "o:" + origin + "\n"
+                    "t:1515217616\n"
+                    "D:" + depends + "\n"
+                    "p:" + provides + "\n"
+                    "\n")
+    with open(path + ".plain", "w", encoding="utf-8") as handle:
+        handle.write(content)
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(path + ".plain", "APKINDEX")
+
+
+def test_rdepends(args, monkeypatch):
+    # pmaports: "app" depends on the "lib-dev" subpackage of "lib", "meta"
+    # depends on "app", "app2" has no depends in the APKBUILD
+    create_apkbuild(args, "lib", "$pkgname-dev")
+    create_apkbuild(args, "app", makedepends="lib-dev>=1.0 !conflict")
+    create_apkbuild(args, "app2")
+    create_apkbuild(args, "meta", depends="app")
+
+    # Binary packages: "app2" depends on a library of "lib", packages that
+    # are not in pmaports get ignored
+    apkindex = args.work + "/APKINDEX.tar.gz"
+    create_apkindex(apkindex, [
+        ("lib", "lib", "", "so:liblib.so.1=1.0"),
+        ("app2", "app2", "so:liblib.so.1 so:libc.musl-x86_64.so.1", ""),
+        ("musl", "musl", "", "so:libc.musl-x86_64.so.1=1"),
+        ("alpine-app", "alpine-app", "so:liblib.so.1", "")])
+    monkeypatch.setattr(pmb.helpers.repo, "apkindex_files",
+                        lambda args, arch=None: [apkindex])
+    monkeypatch.setattr(pmb.helpers.repo, "update", None)
+
+    func = pmb.helpers.rdepends.get
+    assert func(args, "lib", "x86_64") == ["app", "app2", "meta"]
+    assert func(args, "lib", "x86_64", False) == ["app", "app2"]
+    assert func(args, "lib-dev", "x86_64") == ["app", "app2", "meta"]
+    assert func(args, "so:liblib.so.1", "x86_64") == ["app", "app2", "meta"]
+    assert func(args, "app", "x86_64") == ["meta"]
+    assert func(args, "meta", "x86_64") == []
+    assert func(args, "musl", "x86_64") == []
+    assert func(args, "does-not-exist", "x86_64") == []
+
+    # Only exact names, no guessing of the pmaport for unknown subpackages
+    assert pmb.helpers.rdepends.origin(args, "lib-dev", "x86_64") == "lib"
+    assert pmb.helpers.rdepends.origin(args, "lib-static", "x86_64") is None
+    assert func(args, "lib-static", "x86_64") == []
+
+    # The graph gets built only once per session and arch
+    graph = pmb.helpers.rdepends.graph(args, "x86_64")
+    assert pmb.helpers.rdepends.graph(args, "x86_64") is graph
@@ -0,0 +1,168 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+"""
+This file tests functions from pmb.helpers.root_helper
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import pytest
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.helpers.logging
+import pmb.helpers.root_helper
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "--root-helper", "init"]
+    args = pmb.parse.arguments()
+    assert args.root_helper
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+@pytest.fixture
+def helper(args, request):
+    """ Start the helper process without sudo, as the current user """
+    func = pmb.helpers.root_helper
+    process = subprocess.Popen([sys.executable, "-I", func.__file__],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    func._helper["pid"] = os.getpid()
+    func._helper["process"] = process
+    request.addfinalizer(func.stop)
+    return process
+
+
+def test_split_env():
+    func = pmb.helpers.root_helper.split_env
+    assert func(["echo", "test"]) == (["echo", "test"], None)
+    assert func(["env", "-i", "A=1", "B=x=y", "sh", "-c", "C=2"]) == \
+        (["sh", "-c", "C=2"], {"A": "1", "B": "x=y"})
+    cmd, env = func(["env", "A=1", "sh"])
+    assert cmd == ["sh"]
+    assert env["A"] == "1"
+    assert env["PATH"] == os.environ["PATH"]
+    assert func(["env", "-u", "A", "sh"]) == (["env", "-u", "A", "sh"], None)
+
+
+def test_run(args, helper):
+    # Output, exit code, environment, working dir
+    func = pmb.helpers.run.root
+    assert func(args, ["echo", "test"], output_return=True) == "test\n"
+    assert func(args, ["false"], check=False) == 1
+    assert func(args, ["env", "-i", "A=1", "sh", "-c", "echo $A; pwd"],
+                "/tmp", output_return=True) == "1\n/tmp\n"
+    with pytest.raises(RuntimeError) as e:
+        func(args, ["sh", "-c", "exit 3"])
+    assert str(e.value).startswith("Command failed")
+
+    # Environment variables
+    assert func(args, ["sh", "-c", "echo \"$A\""], env={"A": "x y"},
+                output_return=True) == "x y\n"
+
+    # Missing executable
+    assert func(args, ["/does/not/exist"], check=False) == 127
+
+    # All commands ran in the same helper process
+    assert pmb.helpers.root_helper.start(args) is helper
+    assert helper.poll() is None
+
+
+def test_run_timeout(args, helper):
+    args.timeout = 0.5
+    func = pmb.helpers.run.root
+    assert func(args, ["sh", "-c", "echo a; sleep 10; echo b"],
+                output_return=True, check=False) == "a\n"
+
+    # The helper is still usable after killing the command
+    assert func(args, ["echo", "c"], output_return=True) == "c\n"
+
+
+def test_run_log_order(args, helper):
+    """ Text that is not flushed yet gets written before the output """
+    args.logfd.write("before log order\n")
+    pmb.helpers.root_helper.run(args, ["echo", "log order"])
+    with open(args.log) as handle:
+        log = handle.read()
+    assert log.rindex("before log order\n") < log.rindex("\nlog order\n")
+
+
+def test_run_interrupt(args, helper):
+    """ Ctrl-C kills the command, and waits until it has finished """
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt()
+    handler = signal.signal(signal.SIGALRM, interrupt)
+    try:
+        start = time.perf_counter()
+        signal.setitimer(signal.ITIMER_REAL, 0.3)
+        with pytest.raises(KeyboardInterrupt):
+            pmb.helpers.run.root(args, ["sleep", "10"])
+        assert time.perf_counter() - start < 5
+    finally:
+        signal.signal(signal.SIGALRM, handler)
+
+    # The helper is still usable
+    assert pmb.helpers.run.root(args, ["echo", "c"],
+                                output_return=True) == "c\n"
+
+
+def test_serve_signals(helper):
+    """ The helper ignores SIGINT, and kills the command on SIGTERM """
+    func = pmb.helpers.root_helper
+    request = {"cmd": ["sh", "-c", "echo $$; exec sleep 10"], "cwd": None}
+    func.write_frame(helper.stdin.fileno(), b"r",
+                     json.dumps(request).encode("utf-8"))
+    frame_type, payload = func.read_frame(helper.stdout.fileno())
+    assert frame_type == b"o"
+    pid = int(payload)
+
+    helper.send_signal(signal.SIGINT)
+    time.sleep(0.2)
+    assert helper.poll() is None
+
+    helper.send_signal(signal.SIGTERM)
+    assert helper.wait(5) == 128 + signal.SIGTERM
+    func._helper.clear()
+    for i in range(50):
+        try:
+            with open("/proc/" + str(pid) + "/stat") as handle:
+                if handle.read().split(")")[-1].split()[0] in ["Z", "X"]:
+                    break
+        except FileNotFoundError:
+            break
+        time.sleep(0.1)
+    else:
+        raise AssertionError("command is still running: " + str(pid))
+
+
+def test_stop(args, helper):
+    pmb.helpers.root_helper.stop()
+    assert helper.returncode == 0
+    assert pmb.helpers.root_helper._helper == {}
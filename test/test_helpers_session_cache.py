@@ -0,0 +1,111 @@
+"""
+Copyright 2019 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pytest
+import sys
+import time
+
+# Import from parent directory
+sys.path.insert(0, os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.helpers.logging
+import pmb.helpers.session_cache
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def test_session_cache():
+    cache = pmb.helpers.session_cache.SessionCache({"files": {},
+                                                    "checked": set()})
+    assert cache == {"files": {}, "checked": set()}
+
+    # Hits and misses, time between miss and storing the entry
+    assert "a" not in cache["files"]
+    time.sleep(0.01)
+    cache["files"]["a"] = 1
+    assert "a" in cache["files"]
+    assert cache["files"].get("a") == 1
+    assert cache["files"].get("b") is None
+    cache["checked"].add("native")
+    assert "native" in cache["checked"]
+    stats = cache.stats()
+    assert stats["files"]["seconds"] >= 0.01
+    assert stats["checked"]["seconds"] == 0
+    for name in ["files", "checked"]:
+        del stats[name]["seconds"]
+    assert stats == {"files": {"hits": 2, "misses": 2, "invalidations": 0},
+                     "checked": {"hits": 1, "misses": 0, "invalidations": 0}}
+
+    # Replaced caches keep counting
+    cache["files"] = {"b": 2}
+    assert isinstance(cache["files"], pmb.helpers.session_cache.Cache)
+    assert "b" in cache["files"]
+    assert cache.stats()["files"]["hits"] == 3
+
+    # Invalidation with hooks
+    calls = []
+    cache.add_hook("files", calls.append)
+    assert cache.invalidate("files", "b") is True
+    assert cache.invalidate("files", "b") is False
+    assert cache.invalidate("checked", "native") is True
+    cache["files"]["c"] = 3
+    assert cache.invalidate("files") is True
+    assert cache == {"files": {}, "checked": set()}
+    assert calls == ["b", "b", None]
+    assert cache.stats()["files"]["invalidations"] == 3
+
+
+def test_log_stats(args, caplog):
+    caplog.set_level("DEBUG")
+    assert "hello-world" not in args.cache["find_aport"]
+    args.cache["find_aport"]["hello-world"] = "/aports/main/hello-world"
+    pmb.helpers.session_cache.log_stats(args)
+    assert "* find_aport: 0 hits, 1 misses, 0 invalidations" in caplog.text
+    assert "apkbuild:" not in caplog.text
+    assert '"find_aport": {"hits": 0, "invalidations": 0, "misses": 1' in \
+        caplog.text
+
+
+def test_computing_max(monkeypatch):
+    monkeypatch.setattr(pmb.helpers.session_cache, "computing_max", 2)
+    cache = pmb.helpers.session_cache.SessionCache({"files": {}})
+    computing = cache.counters["files"]["computing"]
+
+    # Misses that never get stored don't pile up
+    for key in ["a", "b", "c", "b"]:
+        assert key not in cache["files"]
+    assert list(computing) == ["c", "b"]
+    cache["files"]["b"] = 2
+    assert list(computing) == ["c"]
+
+    # Invalidation removes pending misses as well
+    assert "d" not in cache["files"]
+    cache.invalidate("files", "c")
+    assert list(computing) == ["d"]
+    cache.invalidate("files")
+    assert list(computing) == []
@@ -44,3 +44,22 @@ def test_umount_all_list(tmpdir):
     ret = pmb.helpers.mount.umount_all_list("/test", fake_mounts)
     assert ret == ["/test/var/cache", "/test/proc", "/test/home/pmos/packages",
                    "/test/dev/loop0p2", "/test"]
+
+
+def test_table(tmpdir):
+    # Parsed once, until it gets invalidated
+    fake_mounts = str(tmpdir + "/mounts")
+    with open(fake_mounts, "w") as handle:
+        handle.write("tmpfs /test/dev tmpfs rw 0 0\n")
+    func = pmb.helpers.mount.table
+    assert func(fake_mounts) == ({"/test/dev"}, {"tmpfs"})
+    with open(fake_mounts, "a") as handle:
+        handle.write("/work/packages /test/packages ext4 rw 0 0\n")
+    assert func(fake_mounts) == ({"/test/dev"}, {"tmpfs"})
+    pmb.helpers.mount.invalidate()
+    assert func(fake_mounts) == ({"/test/dev", "/test/packages"},
+                                 {"tmpfs", "/work/packages"})
+
+    # The real mount table
+    assert pmb.helpers.mount.ismount("/proc")
+    assert not pmb.helpers.mount.ismount(str(tmpdir))
@@ -17,6 +17,8 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import hashlib
+import json
 import os
 import pytest
 import sys
@@ -24,6 +26,9 @@ import sys
 # Import from parent directory
 pmb_src = os.path.realpath(os.path.join(os.path.dirname(__file__) + "/.."))
 sys.path.insert(0, pmb_src)
+import pmb.config
+import pmb.helpers.args
+import pmb.helpers.disk_cache
 import pmb.parse._apkbuild
 
 
@@ -72,3 +77,114 @@ def test_kernels(args):
     ret = {"downstream": "Downstream description",
            "mainline": "Mainline description"}
     assert func(args, device) == ret
+
+
+def test_apkbuild_disk_cache(args, tmpdir, monkeypatch):
+    # Copy of a test APKBUILD, so we can modify it
+    args.work = str(tmpdir)
+    path = str(tmpdir) + "/aports/device/device-lg-mako/APKBUILD"
+    os.makedirs(os.path.dirname(path))
+    testdata = pmb_src + "/test/testdata/init_questions_device/aports"
+    with open(testdata + "/device/device-lg-mako/APKBUILD") as handle:
+        content = handle.read()
+    with open(path, "w") as handle:
+        handle.write(content)
+    func = pmb.parse._apkbuild.apkbuild
+    expected = func(args, path)
+
+    # Next session: load from disk without parsing
+    pmb.helpers.args.add_cache(args)
+    parse_attributes = pmb.parse._apkbuild.parse_attributes
+
+    def parse_attributes_fail(path):
+        raise RuntimeError("APKBUILD should not get parsed again")
+    monkeypatch.setattr(pmb.parse._apkbuild, "parse_attributes",
+                        parse_attributes_fail)
+    assert func(args, path) == expected
+
+    # Sanity checks still run on cached results
+    path_wrong = str(tmpdir) + "/aports/device/wrong-name/APKBUILD"
+    os.makedirs(os.path.dirname(path_wrong))
+    with open(path_wrong, "w") as handle:
+        handle.write(content)
+    monkeypatch.setattr(pmb.parse._apkbuild, "parse_attributes",
+                        parse_attributes)
+    func(args, path_wrong, check_pkgname=False)
+    pmb.helpers.args.add_cache(args)
+    monkeypatch.setattr(pmb.parse._apkbuild, "parse_attributes",
+                        parse_attributes_fail)
+    with pytest.raises(RuntimeError) as e:
+        func(args, path_wrong)
+    assert str(e.value).startswith("The pkgname must be equal to the name")
+
+    # Modified APKBUILD: parse again
+    pmb.helpers.args.add_cache(args)
+    monkeypatch.setattr(pmb.parse._apkbuild, "parse_attributes",
+                        parse_attributes)
+    with open(path, "w") as handle:
+        handle.write(content.replace("pkgrel=", "pkgrel=1"))
+    assert func(args, path)["pkgrel"] == "1" + expected["pkgrel"]
+
+    # New parser version: parse again
+    pmb.helpers.args.add_cache(args)
+    monkeypatch.setattr(pmb.parse._apkbuild, "parser_version",
+                        pmb.parse._apkbuild.parser_version + 1)
+    monkeypatch.setattr(pmb.parse._apkbuild, "parse_attributes",
+                        parse_attributes_fail)
+    with pytest.raises(RuntimeError) as e:
+        func(args, path)
+    assert str(e.value) == "APKBUILD should not get parsed again"
+
+    # Different attributes to parse: parse again
+    attributes = json.dumps(pmb.config.apkbuild_attributes, sort_keys=True)
+    assert pmb.parse._apkbuild.attributes_digest == \
+        hashlib.sha256(attributes.encode("utf-8")).hexdigest()
+    validity = pmb.parse._apkbuild.cache_validity(path)
+    monkeypatch.setattr(pmb.parse._apkbuild, "attributes_digest", "changed")
+    assert pmb.parse._apkbuild.cache_validity(path) != validity
+
+
+def test_apkbuild_all(args, tmpdir, monkeypatch):
+    # Fake pmaports with many copies of a test APKBUILD
+    args.work = str(tmpdir) + "/work"
+    args.aports = str(tmpdir) + "/aports"
+    os.makedirs(args.work)
+    testdata = pmb_src + "/test/testdata/init_questions_device/aports"
+    with open(testdata + "/device/device-lg-mako/APKBUILD") as handle:
+        content = handle.read()
+    paths = []
+    for i in range(10):
+        pkgname = "device-lg-mako" + str(i)
+        path = args.aports + "/device/" + pkgname + "/APKBUILD"
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as handle:
+            handle.write(content.replace("pkgname=device-lg-mako",
+                                         "pkgname=" + pkgname))
+        paths.append(path)
+
+    # Parse in parallel, same result as parsing one by one
+    monkeypatch.setattr(pmb.parse._apkbuild, "parallel_threshold", 2)
+    func = pmb.parse._apkbuild.apkbuild_all
+    ret = func(args)
+    assert list(ret.keys()) == paths
+    assert args.cache["apkbuild"] == ret
+    pmb.helpers.args.add_cache(args)
+    pmb.helpers.disk_cache.delete(args, "apkbuild", paths[0])
+    expected = pmb.parse._apkbuild.apkbuild(args, paths[0])
+    assert ret[paths[0]] == expected
+    assert ret[paths[0]]["pkgname"] == "device-lg-mako0"
+
+    # Loaded from the disk cache in the next session
+    pmb.helpers.args.add_cache(args)
+    assert func(args, paths[3:5]) == {paths[3]: ret[paths[3]],
+                                      paths[4]: ret[paths[4]]}
+
+    # Errors from the worker processes
+    pmb.helpers.args.add_cache(args)
+    with open(paths[5], "w") as handle:
+        handle.write(content.replace("pkgname=device-lg-mako", "pkgname=a"))
+    with open(paths[6], "w") as handle:
+        handle.write(content.replace("\n", "\r\n"))
+    with pytest.raises(RuntimeError) as e:
+        func(args)
+    assert str(e.value).startswith("Wrong line endings in APKBUILD")
@@ -22,9 +22,13 @@ This file tests all functions from pmb.parse.apkindex.
 """
 
 import collections
+import copy
+import logging
 import os
+import pickle
 import pytest
 import sys
+import tarfile
 
 # Import from parent directory
 sys.path.insert(0, os.path.realpath(
@@ -56,10 +60,8 @@ def test_parse_next_block_exceptions(args):
     for file, error_substr in mapping.items():
         path = pmb.config.pmb_src + "/test/testdata/apkindex/" + file
         with open(path, "r", encoding="utf-8") as handle:
-            lines = handle.readlines()
-
-        with pytest.raises(RuntimeError) as e:
-            pmb.parse.apkindex.parse_next_block(args, path, lines, [0])
+            with pytest.raises(RuntimeError) as e:
+                pmb.parse.apkindex.parse_next_block(args, path, handle)
         assert error_substr in str(e.value)
 
 
@@ -68,10 +70,9 @@ def test_parse_next_block_no_error(args):
     func = pmb.parse.apkindex.parse_next_block
     path = pmb.config.pmb_src + "/test/testdata/apkindex/no_error"
     with open(path, "r", encoding="utf-8") as handle:
-        lines = handle.readlines()
+        lines = iter(handle.readlines())
 
     # First block
-    start = [0]
     block = {'arch': 'x86_64',
              'depends': [],
              'origin': 'musl',
@@ -79,8 +80,7 @@ def test_parse_next_block_no_error(args):
              'provides': ['so:libc.musl-x86_64.so.1'],
              'timestamp': '1515217616',
              'version': '1.1.18-r5'}
-    assert func(args, path, lines, start) == block
-    assert start == [24]
+    assert func(args, path, lines) == block
 
     # Second block
     block = {'arch': 'x86_64',
@@ -93,12 +93,10 @@ def test_parse_next_block_no_error(args):
              'provides': ['cmd:curl'],
              'timestamp': '1512030418',
              'version': '7.57.0-r0'}
-    assert func(args, path, lines, start) == block
-    assert start == [45]
+    assert func(args, path, lines) == block
 
     # No more blocks
-    assert func(args, path, lines, start) is None
-    assert start == [45]
+    assert func(args, path, lines) is None
 
 
 def test_parse_next_block_virtual(args):
@@ -109,10 +107,9 @@ def test_parse_next_block_virtual(args):
     func = pmb.parse.apkindex.parse_next_block
     path = pmb.config.pmb_src + "/test/testdata/apkindex/virtual_package"
     with open(path, "r", encoding="utf-8") as handle:
-        lines = handle.readlines()
+        lines = iter(handle.readlines())
 
     # First block
-    start = [0]
     block = {'arch': 'x86_64',
              'depends': ['so:libc.musl-x86_64.so.1'],
              'origin': 'hello-world',
@@ -120,8 +117,7 @@ def test_parse_next_block_virtual(args):
              'provides': ['cmd:hello-world'],
              'timestamp': '1500000000',
              'version': '2-r0'}
-    assert func(args, path, lines, start) == block
-    assert start == [20]
+    assert func(args, path, lines) == block
 
     # Second block: virtual package
     block = {'arch': 'noarch',
@@ -129,12 +125,65 @@ def test_parse_next_block_virtual(args):
              'pkgname': '.pmbootstrap',
              'provides': [],
              'version': '0'}
-    assert func(args, path, lines, start) == block
-    assert start == [31]
+    assert func(args, path, lines) == block
 
     # No more blocks
-    assert func(args, path, lines, start) is None
-    assert start == [31]
+    assert func(args, path, lines) is None
+
+
+def test_parse_next_block_operators(args):
+    lines = iter(["P:test\n",
+                  "V:1-r0\n",
+                  "A:noarch\n",
+                  "D:a>=1 b<=2 c=3 d<4 e>5 f~6 !g h so:libc.so=1 !i<2\n",
+                  "p:cmd:test=1-r0 test-alias\n",
+                  "\n"])
+    block = pmb.parse.apkindex.parse_next_block(args, "test", lines)
+    assert block["depends"] == ("a", "b", "c", "d", "e", "f", "h",
+                                "so:libc.so")
+    assert block["provides"] == ("cmd:test", "test-alias")
+
+
+def test_parse_blocks(args, tmpdir):
+    path_plain = pmb.config.pmb_src + "/test/testdata/apkindex/no_error"
+    path = str(tmpdir) + "/APKINDEX.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(path_plain, "APKINDEX")
+
+    blocks = pmb.parse.apkindex.parse_blocks(args, path)
+    assert [block["pkgname"] for block in blocks] == ["musl", "curl"]
+    assert blocks == pmb.parse.apkindex.parse_blocks(args, path_plain)
+
+
+def test_block(args):
+    block = pmb.parse.apkindex.Block("noarch", ("a", "b"), None, "test",
+                                     (), None, "1-r0")
+
+    # Dictionary-like access
+    assert block["pkgname"] == "test"
+    assert "depends" in block
+    assert "origin" not in block
+    assert block.get("timestamp", "default") == "default"
+    with pytest.raises(KeyError):
+        block["timestamp"]
+    assert list(block) == ["arch", "depends", "pkgname", "provides",
+                           "version"]
+    assert block == {"arch": "noarch", "depends": ["a", "b"],
+                     "pkgname": "test", "provides": [], "version": "1-r0"}
+
+    # Immutable, but can be pickled and copied
+    with pytest.raises(AttributeError):
+        block.version = "2-r0"
+    assert pickle.loads(pickle.dumps(block)) == block
+    assert copy.deepcopy(block) == block
+
+
+def test_block_lazy_depends(args):
+    block = pmb.parse.apkindex.Block("noarch", "a>=1 !b c", None, "test",
+                                     (), None, "1-r0")
+    assert block._depends == "a>=1 !b c"
+    assert block["depends"] == ("a", "c")
+    assert block._depends == ("a", "c")
 
 
 def test_parse_add_block(args):
@@ -163,6 +212,13 @@ def test_parse_add_block(args):
     func(ret, block_new, alias, multiple_providers)
     assert ret == {"test": block_new, "test_alias": block_new}
 
+    # Same choice as apk for suffixes without a number ("1-r0" > "1_p")
+    ret = {}
+    block = {"pkgname": "test", "version": "1-r0"}
+    func(ret, block, None, multiple_providers)
+    func(ret, {"pkgname": "test", "version": "1_p"}, None, multiple_providers)
+    assert ret == {"test": block}
+
 
 def test_parse_add_block_multiple_providers(args):
     func = pmb.parse.apkindex.parse_add_block
@@ -348,3 +404,102 @@ def test_package(args, monkeypatch):
 
     # No provider (without must_exist)
     assert func(args, pkgname, must_exist=False) is None
+
+
+def test_parse_disk_cache(args, tmpdir, monkeypatch):
+    # Create an APKINDEX.tar.gz from the test data
+    args.work = str(tmpdir)
+    apkindex = pmb.config.pmb_src + "/test/testdata/apkindex/no_error"
+    path = str(tmpdir) + "/APKINDEX.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(apkindex, "APKINDEX")
+
+    # Parse it once to fill the disk cache
+    func = pmb.parse.apkindex.parse
+    ret = func(args, path)
+    assert "curl" in ret
+
+    # Start a new session: the result must come from disk, without parsing
+    def parse_next_block_fail(*args, **kwargs):
+        raise RuntimeError("should use the disk cache")
+    monkeypatch.setattr(pmb.parse.apkindex, "parse_next_block",
+                        parse_next_block_fail)
+    args.cache["apkindex"] = {}
+    assert func(args, path) == ret
+
+    # Clearing the cache removes it from disk as well
+    pmb.parse.apkindex.clear_cache(args, path)
+    with pytest.raises(RuntimeError) as e:
+        func(args, path)
+    assert "should use the disk cache" in str(e.value)
+
+
+def test_providers_index_cached(args, monkeypatch):
+    # Fake parse function, that counts its calls
+    calls = []
+
+    def return_fake_parse(args, path):
+        calls.append(path)
+        block = {"pkgname": "test", "version": path[1:]}
+        return {"test": {"test": block}, "alias": {"test": block}}
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", return_fake_parse)
+
+    # Only merge once per session
+    func = pmb.parse.apkindex.providers
+    indexes = ["i2", "i3", "i1"]
+    assert func(args, "test", indexes=indexes)["test"]["version"] == "3"
+    assert func(args, "alias", indexes=indexes)["test"]["version"] == "3"
+    assert calls == indexes
+
+    # Clearing the cache of one index merges again
+    pmb.parse.apkindex.clear_cache(args, "i3")
+    assert func(args, "test", indexes=indexes)["test"]["version"] == "3"
+    assert calls == indexes + indexes
+
+
+def test_providers_index_disk_cache(args, tmpdir, monkeypatch):
+    # Create two real indexes
+    args.work = str(tmpdir)
+    paths = []
+    for i in range(2):
+        path = str(tmpdir) + "/APKINDEX." + str(i)
+        pmb.helpers.run.user(args, ["touch", path])
+        paths.append(path)
+
+    def return_fake_parse(args, path):
+        return {"test": {"test": {"pkgname": "test", "version": "1"}}}
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", return_fake_parse)
+    func = pmb.parse.apkindex.providers_index
+    ret = func(args, paths)
+
+    # New session: merged index gets loaded from disk
+    def parse_fail(args, path):
+        raise RuntimeError("should use the disk cache")
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", parse_fail)
+    args.cache["apkindex_providers"] = {}
+    assert func(args, paths) == ret
+
+    # Modified index: merge again (even if it is cached for this session)
+    with open(paths[1], "w") as handle:
+        handle.write("\n")
+    with pytest.raises(RuntimeError) as e:
+        func(args, paths)
+    assert "should use the disk cache" in str(e.value)
+
+
+def test_providers_verbose(args, monkeypatch):
+    def return_fake_parse(args, path):
+        block = {"pkgname": "test", "version": path[1:]}
+        return {"test": {"test": block}}
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", return_fake_parse)
+    messages = []
+    monkeypatch.setattr(logging, "verbose", messages.append, raising=False)
+
+    # The index of each provider only gets looked up for verbose logging
+    func = pmb.parse.apkindex.providers
+    args.verbose = False
+    func(args, "test", indexes=["i1", "i2"])
+    assert messages == []
+    args.verbose = True
+    func(args, "test", indexes=["i1", "i2"])
+    assert messages == ["test: provided by: test-2 in i2"]
@@ -31,7 +31,9 @@ sys.path.insert(0, os.path.realpath(
     os.path.join(os.path.dirname(__file__) + "/..")))
 import pmb.config
 import pmb.config.init
+import pmb.helpers.args
 import pmb.helpers.logging
+import pmb.helpers.repo
 import pmb.parse.depends
 
 
@@ -93,7 +95,10 @@ def test_package_provider(args, monkeypatch):
 
     # 4. Pick a package, that is already installed
     pkgnames_install = []
-    assert func(args, pkgname, pkgnames_install) == package
+    installed_used = []
+    assert func(args, pkgname, pkgnames_install, "native",
+                installed_used) == package
+    assert installed_used == ["test"]
 
     # 5. Pick the first one
     installed = {}
@@ -165,7 +170,11 @@ def test_recurse(args, monkeypatch):
         "so:libtest.so.1": ["libtest_depend"],
     }
 
-    def package_from_index(args, pkgname, install, aport, suffix):
+    installs = []
+
+    def package_from_index(args, pkgname, install, aport, suffix,
+                           installed_used):
+        installs.append(set(install))
         return {"pkgname": pkgname, "depends": depends[pkgname]}
     monkeypatch.setattr(pmb.parse.depends, "package_from_index",
                         package_from_index)
@@ -175,3 +184,70 @@ def test_recurse(args, monkeypatch):
     pkgnames = ["test", "so:libtest.so.1"]
     result = ["test", "so:libtest.so.1", "libtest", "libtest_depend"]
     assert func(args, pkgnames) == result
+
+    # Packages that will be installed (already found + todo list) at each step
+    assert installs == [{"so:libtest.so.1"},
+                        {"test", "so:libtest.so.1", "libtest"},
+                        {"test", "so:libtest.so.1", "libtest_depend"},
+                        {"test", "so:libtest.so.1", "libtest",
+                         "libtest_depend"}]
+
+
+def test_recurse_cached(args, tmpdir, monkeypatch):
+    # Fake work folder, pmaports and APKINDEX
+    tmpdir = str(tmpdir)
+    args.work = tmpdir + "/work"
+    args.aports = tmpdir + "/aports"
+    os.makedirs(args.work)
+    os.makedirs(args.aports + "/main/hello-world")
+    apkindex = args.work + "/APKINDEX.tar.gz"
+    with open(apkindex, "w") as handle:
+        handle.write("first version")
+    monkeypatch.setattr(pmb.helpers.repo, "apkindex_files",
+                        lambda args, arch=None: [apkindex])
+
+    # Count the calls of recurse(), "c" has multiple providers and one gets
+    # picked by looking at the installed packages
+    calls = []
+
+    def recurse(args, pkgnames, suffix="native", installed_used=None):
+        calls.append(pkgnames)
+        if "c" in pkgnames:
+            installed_used.append("c")
+        return list(pkgnames) + ["depend"]
+    monkeypatch.setattr(pmb.parse.depends, "recurse", recurse)
+
+    # First call resolves, second call with the same input loads from disk
+    func = pmb.parse.depends.recurse_cached
+    assert func(args, ["a", "b"]) == ["a", "b", "depend"]
+    assert func(args, ["a", "b"]) == ["a", "b", "depend"]
+    assert len(calls) == 1
+
+    # Different packages or suffix
+    func(args, ["b", "a"])
+    func(args, ["a", "b"], "buildroot_armhf")
+    assert len(calls) == 3
+
+    # Modified APKINDEX, new APKBUILD (in the next session)
+    with open(apkindex, "w") as handle:
+        handle.write("second version")
+    func(args, ["a", "b"])
+    with open(args.aports + "/main/hello-world/APKBUILD", "w") as handle:
+        handle.write("pkgname=hello-world\n")
+    func(args, ["a", "b"])
+    assert len(calls) == 4
+    pmb.helpers.args.add_cache(args)
+    func(args, ["a", "b"])
+    assert len(calls) == 5
+
+    # Installed packages changed: only resolved again, if they were used
+    func(args, ["c"])
+    installed = args.work + "/chroot_native/lib/apk/db/installed"
+    os.makedirs(os.path.dirname(installed))
+    with open(installed, "w") as handle:
+        handle.write("\n")
+    func(args, ["a", "b"])
+    func(args, ["c"])
+    assert len(calls) == 7
+    func(args, ["c"])
+    assert len(calls) == 7
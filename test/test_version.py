@@ -72,3 +72,135 @@ def test_version(args):
     for error in errors:
         print(error)
     assert errors == []
+
+
+def compare_reference(a_version, b_version, fuzzy=False):
+    """
+    Original implementation of pmb.parse.version.compare(), which tokenizes
+    both strings on every call (port of apk_version_compare_blob_fuzzy()).
+    """
+    get_token = pmb.parse.version.get_token
+    token_value = pmb.parse.version.token_value
+    a_token = "digit"
+    b_token = "digit"
+    a_value = 0
+    b_value = 0
+    a_rest = a_version
+    b_rest = b_version
+    while (a_token == b_token and a_token not in ["end", "invalid"] and
+           a_value == b_value):
+        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    if a_value < b_value:
+        return -1
+    if a_value > b_value:
+        return 1
+    if a_token == b_token or fuzzy:
+        return 0
+    if a_token == "suffix":
+        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+        if a_value < 0:
+            return -1
+    if b_token == "suffix":
+        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+        if b_value < 0:
+            return 1
+    if token_value(a_token) > token_value(b_token):
+        return -1
+    if token_value(a_token) < token_value(b_token):
+        return 1
+    return 0
+
+
+def read_versions():
+    """ :returns: all version strings from the apk-tools test data """
+    ret = set()
+    path = pmb_src + "/test/testdata/version/version.data"
+    with open(path) as handle:
+        for line in handle:
+            split = line.split(" ")
+            ret.add(split[0])
+            ret.add(split[2].split("#")[0].rstrip())
+    return sorted(ret)
+
+
+def test_version_compare_differential():
+    """ Compare each version with each other version, the result must be the
+        same as with the original implementation. """
+    versions = read_versions()
+    for a in versions:
+        for b in versions:
+            assert pmb.parse.version.compare(a, b) == compare_reference(a, b)
+
+    # Fuzzy compare only differs in one case, a subset is enough
+    for a in versions:
+        for b in versions[::10]:
+            assert (pmb.parse.version.compare(a, b, True) ==
+                    compare_reference(a, b, True))
+
+
+def test_version_key():
+    """ Comparing the keys must give the same result as compare() for all
+        versions from the test data. """
+    versions = read_versions()
+    keys = [pmb.parse.version.key(version) for version in versions]
+    for a, a_key in zip(versions, keys):
+        for b, b_key in zip(versions, keys):
+            result = (a_key > b_key) - (a_key < b_key)
+            assert result == pmb.parse.version.compare(a, b)
+
+    # Documented exception: post-release suffix without number
+    assert pmb.parse.version.compare("1_p", "1") == 0
+    assert pmb.parse.version.key("1_p") > pmb.parse.version.key("1")
+
+
+def test_version_tokens_cached():
+    func = pmb.parse.version.tokens
+    func.cache_clear()
+    assert func("1.2_rc1-r3") == func("1.2_rc1-r3")
+    assert func.cache_info().hits == 1
+
+
+def test_version_sort():
+    func = pmb.parse.version.sort
+    versions = ["1.10-r0", "1.2-r1", "1.2_rc1-r0", "1.2-r0", "1.2a-r0"]
+    expected = ["1.2_rc1-r0", "1.2-r0", "1.2-r1", "1.2a-r0", "1.10-r0"]
+    assert func(versions) == expected
+    assert func(versions, True) == list(reversed(expected))
+
+    # Same order as compare() for suffixes without a number
+    assert func(["1-r0", "1_p"]) == ["1_p", "1-r0"]
+    assert func(["1_p", "1-r0"]) == ["1_p", "1-r0"]
+    assert func(["1_p", "1"]) == ["1_p", "1"]
+    assert func(["1", "1_p"]) == ["1", "1_p"]
+    assert func(["1_p-r3", "1-r0"]) == ["1_p-r3", "1-r0"]
+
+
+def test_version_highest():
+    func = pmb.parse.version.highest
+    assert func([]) is None
+    assert func(["1.2", "1.10", "1.9"]) == "1.10"
+
+    # Objects with get_version, the last of the highest versions wins
+    items = [{"name": "a", "version": "1.0-r1"},
+             {"name": "b", "version": "1.0-r2"},
+             {"name": "c", "version": "1.0-r2"},
+             {"name": "d", "version": "1.0-r0"}]
+    assert func(items, lambda item: item["version"])["name"] == "c"
+
+    # Same result as compare() for suffixes without a number
+    for a, b, expected in [("1", "1_p", "1_p"),
+                           ("1_p", "1", "1"),
+                           ("1-r0", "1_p", "1-r0"),
+                           ("1_p", "1-r0", "1-r0"),
+                           ("1-r0", "1_p-r3", "1_p-r3"),
+                           ("1_p-r3", "1-r0", "1-r0")]:
+        assert func([a, b]) == expected
+
+    # Same result as comparing pair by pair with compare()
+    versions = read_versions()
+    result = versions[0]
+    for version in versions[1:]:
+        if pmb.parse.version.compare(result, version) != 1:
+            result = version
+    assert func(versions) == result